@@ -3,6 +3,16 @@
 # Worker concurrency defaults.
 export RK_WORKERS="${RK_WORKERS:-2}"
 export RK_MAX_TASKS="${RK_MAX_TASKS:-50}"
+export RK_CELERY_EMBED_QUEUE="${RK_CELERY_EMBED_QUEUE:-embed}"
+export RK_CELERY_IO_QUEUE="${RK_CELERY_IO_QUEUE:-io}"
+export RK_IO_WORKERS="${RK_IO_WORKERS:-20}"
+# The io tasks enforce their soft time limits on gevent, the threads pool enforces none.
+export RK_IO_WORKER_POOL="${RK_IO_WORKER_POOL:-gevent}"
+
+# Metrics of the web and worker processes are gathered through this directory,
+# leftovers of previous runs would be counted in otherwise.
+export PROMETHEUS_MULTIPROC_DIR="${PROMETHEUS_MULTIPROC_DIR:-/var/data/metrics}"
+rm -rf "$PROMETHEUS_MULTIPROC_DIR" && mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
 
 echo "Setting application permissions..."
 
@@ -17,6 +27,15 @@ chown www-data:www-data -R /opt/conda/envs/riigikantselei/var \
 # ACTIVATE & MIGRATE
 source activate riigikantselei
 
+# The settings never download anything, the vectorization model and the tiktoken encodings
+# are fetched here once. Encodings already bundled into the image aren't fetched again.
+if [[ "${RK_DOWNLOAD_DATA,,}" =~ ^(true|1|yes|on)$ ]]; then
+    echo "Downloading the vectorization model..."
+    python manage.py download_models
+    echo "Downloading the tiktoken encodings..."
+    python manage.py download_encoders
+fi
+
 echo "Migrating application..."
 
 python migrate.py -o
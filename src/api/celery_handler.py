@@ -1,7 +1,20 @@
 import logging
 import os
+import time
+from datetime import datetime
+from typing import Any, Optional
 
 from celery import Celery, Task
+from celery.signals import (
+    before_task_publish,
+    task_postrun,
+    task_prerun,
+    worker_init,
+    worker_process_init,
+    worker_process_shutdown,
+)
+
+from core.timings import start_timer, stop_timer
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'api.settings')
 app = Celery('api')
@@ -21,3 +34,121 @@ logger = logging.getLogger(__name__)
 @app.task(bind=True)
 def debug_task(self: Task) -> None:
     logger.info(f'Request: {self.request!r}')
+
+
+@worker_process_init.connect
+def preload_encoders(**kwargs: Any) -> None:  # pylint: disable=unused-argument
+    """Build the tiktoken encoders before the child process receives its first task."""
+    # pylint: disable=import-outside-toplevel
+    from django.conf import settings
+
+    from api.utilities.encoder import load_encoders
+
+    load_encoders(settings.ENCODER_MODEL_NAMES)
+
+
+def is_prefork_worker(worker: Any) -> bool:
+    pool = worker.pool_cls if isinstance(worker.pool_cls, str) else worker.pool_cls.__module__
+    return 'prefork' in pool
+
+
+def is_embed_worker(worker: Any) -> bool:
+    """Whether the worker forks its processes and takes on the tasks that vectorize."""
+    # pylint: disable=import-outside-toplevel
+    from django.conf import settings
+
+    consumed_queues = worker.app.amqp.queues.consume_from
+    return is_prefork_worker(worker) and settings.CELERY_EMBED_QUEUE in consumed_queues
+
+
+@worker_init.connect
+def size_hedging_pool(sender: Any, **kwargs: Any) -> None:  # pylint: disable=unused-argument
+    """Give the requests of every task running at once a thread to be sent and hedged on."""
+    # pylint: disable=import-outside-toplevel
+    from api.utilities.gpt import set_hedging_concurrency
+
+    # Processes of a prefork pool run a single task at a time.
+    set_hedging_concurrency(1 if is_prefork_worker(sender) else sender.concurrency)
+
+
+@worker_init.connect
+def set_up_embed_worker(sender: Any, **kwargs: Any) -> None:  # pylint: disable=unused-argument
+    """Set the thread count of the child processes and load the model they share."""
+    # pylint: disable=import-outside-toplevel
+    from django.conf import settings
+
+    if not is_embed_worker(sender):
+        return
+
+    from core.threads import configure_worker
+
+    configure_worker(sender.concurrency)
+    if settings.WORKER_SHARED_MODEL:
+        from core.warmup import load_shared_model
+
+        load_shared_model()
+
+
+@worker_process_init.connect
+def warm_up_models(**kwargs: Any) -> None:  # pylint: disable=unused-argument
+    """Load the vectorization model before the child process receives its first task."""
+    # pylint: disable=import-outside-toplevel
+    from django.conf import settings
+
+    from core.threads import apply_thread_limit
+
+    apply_thread_limit()
+    if settings.WORKER_WARMUP:
+        from core.warmup import warm_up_worker
+
+        warm_up_worker()
+
+
+@before_task_publish.connect
+def stamp_enqueue_time(headers: Optional[dict] = None, **kwargs: Any) -> None:
+    # pylint: disable=unused-argument
+    if headers is not None:
+        headers.setdefault('rk_enqueued_at', time.time())
+
+
+def get_queue_wait(task: Task) -> Optional[float]:
+    """Seconds the task spent in the broker, not counting the countdown it was sent with."""
+    enqueued_at = getattr(task.request, 'rk_enqueued_at', None)
+    if enqueued_at is None:
+        # Eagerly executed tasks never pass through the broker.
+        return None
+
+    available_at = float(enqueued_at)
+    if task.request.eta:
+        available_at = max(available_at, datetime.fromisoformat(task.request.eta).timestamp())
+    return time.time() - available_at
+
+
+@task_prerun.connect
+def start_stage_timer(task: Task, **kwargs: Any) -> None:  # pylint: disable=unused-argument
+    start_timer(queue_wait=get_queue_wait(task))
+
+
+@task_postrun.connect
+def stop_stage_timer(**kwargs: Any) -> None:  # pylint: disable=unused-argument
+    stop_timer()
+
+
+@worker_process_shutdown.connect
+def mark_metrics_process_dead(pid: int, **kwargs: Any) -> None:  # pylint: disable=unused-argument
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        # pylint: disable=import-outside-toplevel
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(pid)
+
+
+@worker_process_shutdown.connect
+def mark_worker_gone(**kwargs: Any) -> None:  # pylint: disable=unused-argument
+    # pylint: disable=import-outside-toplevel
+    from django.conf import settings
+
+    if settings.WORKER_WARMUP:
+        from core import warmup
+
+        warmup.mark_worker_gone()
@@ -15,8 +15,9 @@ from gettext import gettext
 from pathlib import Path
 
 import environ
+from celery.schedules import crontab
 
-from api.utilities.vectorizer import download_vectorization_resources
+from api.utilities.encoder import set_encoder_cache_directory
 
 # pylint: disable=bad-builtin
 
@@ -70,6 +71,9 @@ CORE_SETTINGS = {
     # OpenAI integration
     # TODO: obtain key
     'OPENAI_API_KEY': env('RK_OPENAI_API_KEY', default=None),
+    # Points the client towards any OpenAI compatible API, for example the bundled
+    # stand-in server (python manage.py run_fake_openai) for load testing.
+    'OPENAI_API_BASE_URL': env.str('RK_OPENAI_API_BASE_URL', default=None),
     'OPENAI_SYSTEM_MESSAGE': env.str(
         'RK_OPENAI_SYSTEM_MESSAGE', default='You are a helpful assistant.'
     ),
@@ -85,6 +89,12 @@ CORE_SETTINGS = {
     'OPENAI_API_CHAT_MODEL': env.int('RK_OPENAI_API_CHAT_MODEL', default='gpt-4o'),
     'OPENAI_CONTEXT_MAX_TOKEN_LIMIT': env.int('RK_OPENAI_CONTEXT_MAX_TOKEN_LIMIT', default=4800),
     'OPENAI_API_TEMPERATURE': env.float('RK_OPENAI_API_TEMPERATURE', default=0.0),
+    # Hedging sends a second request when the first one is slower than the p95 latency
+    # of the previous ones, the delay is used until enough latencies have been gathered.
+    'OPENAI_API_HEDGE_ENABLED': env.bool('RK_OPENAI_API_HEDGE_ENABLED', default=False),
+    'OPENAI_API_HEDGE_DELAY': env.float('RK_OPENAI_API_HEDGE_DELAY', default=5.0),
+    'OPENAI_API_HEDGE_MAX_RATE': env.float('RK_OPENAI_API_HEDGE_MAX_RATE', default=0.1),
+    'OPENAI_API_HEDGE_FALLBACK_MODEL': env.str('RK_OPENAI_API_HEDGE_FALLBACK_MODEL', default=None),
     #
     # Other
     'DEFAULT_USAGE_LIMIT_EUROS': env.float('RK_DEFAULT_USAGE_LIMIT_EUROS', default=50.0),
@@ -93,6 +103,13 @@ CORE_SETTINGS = {
     'EURO_COST_PER_OUTPUT_TOKEN': env.float(
         'RK_EURO_COST_PER_OUTPUT_TOKEN', default=15 / 1_000_000
     ),
+    # Batch API requests are billed at half the price.
+    'EURO_COST_PER_BATCH_INPUT_TOKEN': env.float(
+        'RK_EURO_COST_PER_BATCH_INPUT_TOKEN', default=2.5 / 1_000_000
+    ),
+    'EURO_COST_PER_BATCH_OUTPUT_TOKEN': env.float(
+        'RK_EURO_COST_PER_BATCH_OUTPUT_TOKEN', default=7.5 / 1_000_000
+    ),
 }
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -199,6 +216,10 @@ REST_FRAMEWORK = {
     'DEFAULT_THROTTLE_RATES': {'anon': '75/hour'},
 }
 
+# Conversation lists are cursor paginated, clients can ask for pages of up to the max size.
+CONVERSATION_PAGE_SIZE = env.int('RK_CONVERSATION_PAGE_SIZE', default=50)
+CONVERSATION_MAX_PAGE_SIZE = env.int('RK_CONVERSATION_MAX_PAGE_SIZE', default=200)
+
 if DEBUG is True:
     REST_FRAMEWORK['DEFAULT_RENDERER_CLASSES'] = (
         'rest_framework.renderers.JSONRenderer',
@@ -385,22 +406,194 @@ CELERY_DEFAULT_QUEUE = env.str('RK_WORKER_QUEUE', default='celery')
 CELERY_DEFAULT_EXCHANGE = CELERY_DEFAULT_QUEUE
 CELERY_DEFAULT_ROUTING_KEY = CELERY_DEFAULT_QUEUE
 
+# Tasks that vectorize texts hold the embedding model and are CPU bound, so they go to
+# a small prefork pool. Tasks that wait on OpenAI or only write into the database go to
+# a high concurrency gevent pool which never loads the model. Their soft time limits are
+# raised by the tasks themselves there (see core.base_task.IOTask), the threads pool enforces
+# no time limits at all.
+CELERY_EMBED_QUEUE = env.str('RK_CELERY_EMBED_QUEUE', default='embed')
+CELERY_IO_QUEUE = env.str('RK_CELERY_IO_QUEUE', default='io')
+CELERY_EMBED_TASKS = (
+    'query_and_format_rag_context',
+    'run_text_search_pipeline',
+    'run_document_search_pipeline',
+    'prepare_text_search_batch',
+    'generate_aggregations',
+    'generate_openai_prompt',
+    'render_conversation_pdf',
+    'generate_statistics_pdf',
+    # Its aggregates would block every other task of a gevent pool while they run.
+    'refresh_usage_rollups',
+)
+CELERY_IO_TASKS = (
+    'call_openai_api',
+    'save_openai_results',
+    'poll_text_search_batch',
+    'send_document_search',
+    'save_openai_results_for_doc',
+    'refresh_health_snapshot',
+    'resume_text_search_batches',
+)
+CELERY_TASK_ROUTES = {
+    **{task_name: {'queue': CELERY_EMBED_QUEUE} for task_name in CELERY_EMBED_TASKS},
+    **{task_name: {'queue': CELERY_IO_QUEUE} for task_name in CELERY_IO_TASKS},
+}
+
+# Whether the worker processes load the vectorization model and run an encode through it
+# when they start, instead of on their first task. Warm processes are announced in Redis.
+WORKER_WARMUP = env.bool('RK_WORKER_WARMUP', default=False)
+WORKER_READINESS_URL = env.str('RK_WORKER_READINESS_URL', default=CELERY_BROKER_URL)
+# Seconds after which a worker process that stopped refreshing its readiness isn't counted.
+WORKER_READINESS_TTL = env.int('RK_WORKER_READINESS_TTL', default=60)
+# Child processes that haven't started within this are killed, loading the model takes longer.
+CELERY_WORKER_PROC_ALIVE_TIMEOUT = env.float(
+    'RK_WORKER_PROC_ALIVE_TIMEOUT', default=120.0 if WORKER_WARMUP else 4.0
+)
+# Whether the embed worker loads the vectorization model before forking its processes, which
+# then share the memory of the weights instead of each loading a copy of their own.
+WORKER_SHARED_MODEL = env.bool('RK_WORKER_SHARED_MODEL', default=False)
+
+# How chat requests are processed, either as a chain of tasks for retrieval, the LLM call and
+# storing the results (chain) or all of them within a single task to save on the broker
+# round trips and database queries between them (single).
+RAG_PIPELINE_MODE = env.str('RK_RAG_PIPELINE_MODE', default='chain')
+
+# Payloads passed between chained tasks (prompts with their context, LLM results) are kept
+# compressed in a blob store and the tasks pass only a claim check through the broker.
+# Backends: redis, disk (a directory shared by all workers) or inline (pass payloads as is).
+PAYLOAD_STORE_BACKEND = env.str('RK_PAYLOAD_STORE_BACKEND', default='redis')
+PAYLOAD_STORE_URL = env.str('RK_PAYLOAD_STORE_URL', default=CELERY_BROKER_URL)
+PAYLOAD_STORE_DIR = Path(env.str('RK_PAYLOAD_STORE_DIR', default=DATA_DIR / 'payloads'))
+# Has to outlive the retries of the OpenAI tasks.
+PAYLOAD_STORE_TTL = env.int('RK_PAYLOAD_STORE_TTL', default=2 * 60 * 60)
+
+# State transitions of tasks are published through Redis for the clients waiting on them.
+TASK_NOTIFICATION_URL = env.str('RK_TASK_NOTIFICATION_URL', default=CELERY_BROKER_URL)
+# Longest time a request to the task status endpoint may wait for the status to change.
+TASK_STATUS_MAX_WAIT = env.int('RK_TASK_STATUS_MAX_WAIT', default=25)
+# Seconds between the keep-alive comments of the task event stream.
+TASK_EVENTS_HEARTBEAT = env.int('RK_TASK_EVENTS_HEARTBEAT', default=15)
+# Seconds browsers wait before reconnecting to a dropped task event stream.
+TASK_EVENTS_RETRY = env.int('RK_TASK_EVENTS_RETRY', default=5)
+# Seconds the tokens browsers open the task event stream with stay valid for.
+TASK_EVENTS_TOKEN_MAX_AGE = env.int('RK_TASK_EVENTS_TOKEN_MAX_AGE', default=60)
+
 CELERY_VECTOR_SEARCH_SOFT_LIMIT = 2 * 60
 CELERY_OPENAI_SOFT_LIMIT = 2 * 60 + 30
 CELERY_RESULT_STORE_SOFT_LIMIT = 1 * 60
 CELERY_AGGREGATE_TASK_SOFT_LIMIT = 1 * 60 + 30
+CELERY_PIPELINE_SOFT_LIMIT = (
+    CELERY_VECTOR_SEARCH_SOFT_LIMIT + CELERY_OPENAI_SOFT_LIMIT + CELERY_RESULT_STORE_SOFT_LIMIT
+)
+CELERY_BATCH_PREPARE_SOFT_LIMIT = 30 * 60
+CELERY_BATCH_POLL_SOFT_LIMIT = 10 * 60
+# Seconds tasks of the io queue get on top of their soft limit before the pool stops them. The
+# hard limit is only a backstop, stopping a task skips its handlers and leaves it STARTED.
+CELERY_HARD_LIMIT_GRACE = 30
+# How many seconds to wait between checking the status of an OpenAI batch.
+OPENAI_BATCH_POLL_INTERVAL = env.int('RK_OPENAI_BATCH_POLL_INTERVAL', default=60)
+OPENAI_BATCH_MAX_QUESTIONS = env.int('RK_OPENAI_BATCH_MAX_QUESTIONS', default=1000)
+# Seconds a started batch may go without being polled before the beat polls it again.
+OPENAI_BATCH_RESUME_AFTER = env.int('RK_OPENAI_BATCH_RESUME_AFTER', default=60 * 60)
+
+# Periodic tasks, run by the beat process.
+# Seconds between rebuilding the monthly usage rollups the statistics report is read from.
+USAGE_ROLLUP_REFRESH_INTERVAL = env.int('RK_USAGE_ROLLUP_REFRESH_INTERVAL', default=15 * 60)
+# Seconds between probing the services, the health endpoint serves the latest snapshot.
+HEALTH_REFRESH_INTERVAL = env.int('RK_HEALTH_REFRESH_INTERVAL', default=15)
+HEALTH_SNAPSHOT_PATH = Path(env.str('RK_HEALTH_SNAPSHOT_PATH', default=DATA_DIR / 'health.json'))
+CELERY_BEAT_SCHEDULE = {
+    'refresh_usage_rollups': {
+        'task': 'refresh_usage_rollups',
+        'schedule': USAGE_ROLLUP_REFRESH_INTERVAL,
+    },
+    'resume_text_search_batches': {
+        'task': 'resume_text_search_batches',
+        'schedule': OPENAI_BATCH_RESUME_AFTER,
+        'options': {'expires': OPENAI_BATCH_RESUME_AFTER},
+    },
+    # Statistics months are in UTC, by the morning in CELERY_TIMEZONE the last one has ended.
+    'generate_statistics_pdf': {
+        'task': 'generate_statistics_pdf',
+        'schedule': crontab(minute=0, hour=6, day_of_month=1),
+    },
+    # Refreshes that couldn't run in time are dropped, the next one is due anyway.
+    'refresh_health_snapshot': {
+        'task': 'refresh_health_snapshot',
+        'schedule': HEALTH_REFRESH_INTERVAL,
+        'options': {'expires': HEALTH_REFRESH_INTERVAL},
+    },
+}
+CELERY_BEAT_SCHEDULE_FILENAME = str(DATA_DIR / 'celerybeat-schedule')
+
+#### PDF ####
+# Conversation PDFs are generated by a task into this directory, which has to be shared
+# by the web and worker processes.
+PDF_CACHE_DIR = Path(env.str('RK_PDF_CACHE_DIR', default=DATA_DIR / 'pdf'))
+# Seconds a PDF may take to generate, a request after that queues it again.
+PDF_RENDER_TIMEOUT = env.int('RK_PDF_RENDER_TIMEOUT', default=5 * 60)
+
+#### STATISTICS ####
+# How many processes render the charts of a statistics report in parallel, below 2 they're
+# rendered within the requesting process.
+CHART_WORKERS = env.int('RK_CHART_WORKERS', default=2)
+# Charts of closed months are kept in this directory, as they never change.
+CHART_CACHE_DIR = Path(env.str('RK_CHART_CACHE_DIR', default=DATA_DIR / 'charts'))
+# Statistics PDFs are kept in this directory, the ones of closed months until their month
+# is rolled up again, the one of the ongoing month for STATISTICS_LIVE_TTL seconds.
+STATISTICS_CACHE_DIR = Path(env.str('RK_STATISTICS_CACHE_DIR', default=DATA_DIR / 'statistics'))
+STATISTICS_LIVE_TTL = env.int('RK_STATISTICS_LIVE_TTL', default=5 * 60)
+
+#### SPENDING ####
+# Redis instance holding the cached balances and the budget reservations of the users.
+SPEND_LEDGER_URL = env.str('RK_SPEND_LEDGER_URL', default=CELERY_BROKER_URL)
+# Seconds the spent sum of a user is cached for, a spend outdates it as soon as it's committed.
+SPEND_BALANCE_CACHE_TTL = env.int('RK_SPEND_BALANCE_CACHE_TTL', default=5 * 60)
+# Reservations are released once the answer is stored, this only clears the lost ones.
+SPEND_RESERVATION_TTL = env.int('RK_SPEND_RESERVATION_TTL', default=30 * 60)
+# Batches keep their reservation through the 24 hour completion window of the Batch API.
+SPEND_BATCH_RESERVATION_TTL = env.int('RK_SPEND_BATCH_RESERVATION_TTL', default=25 * 60 * 60)
+# How many tokens an answer is expected to have at most when reserving the budget for it.
+SPEND_ESTIMATED_OUTPUT_TOKENS = env.int('RK_SPEND_ESTIMATED_OUTPUT_TOKENS', default=1000)
+
+#### OPENAI CLIENT CONFIGURATIONS ####
+# Every process keeps its OpenAI clients alive between tasks,
+# these limit the connection pool each of those clients holds.
+OPENAI_HTTP2 = env.bool('RK_OPENAI_HTTP2', default=True)
+OPENAI_HTTP_MAX_CONNECTIONS = env.int('RK_OPENAI_HTTP_MAX_CONNECTIONS', default=20)
+OPENAI_HTTP_MAX_KEEPALIVE_CONNECTIONS = env.int(
+    'RK_OPENAI_HTTP_MAX_KEEPALIVE_CONNECTIONS', default=10
+)
+OPENAI_HTTP_KEEPALIVE_EXPIRY = env.float('RK_OPENAI_HTTP_KEEPALIVE_EXPIRY', default=120.0)
 
 #### VECTORIZATION CONFIGURATIONS ####
 VECTORIZATION_MODEL_NAME = 'BAAI/bge-m3'
 BGEM3_SYSTEM_CONFIGURATION = {'use_fp16': True, 'device': 'cpu', 'normalize_embeddings': True}
 BGEM3_INFERENCE_CONFIGURATION = {'batch_size': 12, 'return_dense': True, 'max_length': 8192}
 
-# DOWNLOAD MODEL DEPENDENCIES
+# Torch threads of every embed worker process, 0 to split the cores the worker may run on
+# evenly between its processes.
+TORCH_THREADS = env.int('RK_TORCH_THREADS', default=0)
+# Torch threads the task embedding the questions of a batch runs on, 0 for those of the process.
+BATCH_TORCH_THREADS = env.int('RK_BATCH_TORCH_THREADS', default=0)
+
+#### ENCODER CONFIGURATIONS ####
+# Tiktoken BPE files are kept in a local directory so that workers never need network
+# access to build the encoders for the configured chat models. The Docker image bundles
+# them outside of the data directory, which is usually a volume.
+ENCODER_CACHE_DIR = Path(env.str('RK_ENCODER_CACHE_DIR', default=DATA_DIR / 'tiktoken'))
+ENCODER_MODEL_NAMES = env.list(
+    'RK_ENCODER_MODEL_NAMES', default=[CORE_SETTINGS['OPENAI_API_CHAT_MODEL']]
+)
+set_encoder_cache_directory(ENCODER_CACHE_DIR)
 
-DOWNLOAD_RESOURCES = env('RK_DOWNLOAD_DATA', default=True)
+# The vectorization model and the encodings are downloaded with the download_models and
+# download_encoders management commands, never while the settings are imported.
 
-if DOWNLOAD_RESOURCES:
-    download_vectorization_resources(VECTORIZATION_MODEL_NAME, DATA_DIR)
+#### STARTUP ####
+# Budgets of the profile_startup management command for the cold start of every process.
+STARTUP_TIME_BUDGET = env.float('RK_STARTUP_TIME_BUDGET', default=10.0)
+STARTUP_RSS_BUDGET = env.float('RK_STARTUP_RSS_BUDGET', default=300.0)
 
 #### EMAIL CONFIGURATION ####
 
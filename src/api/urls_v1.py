@@ -22,10 +22,13 @@ from core.views import (
     DatasetViewset,
     ElasticDocumentDetailView,
     StatisticsView,
+    TaskEventsTokenView,
+    TaskEventsView,
+    TaskStatusView,
 )
 from document_search.views import DocumentSearchConversationViewset
-from health.views import HealthView
-from text_search.views import TextSearchConversationViewset
+from health.views import HealthView, MetricsView
+from text_search.views import TextSearchBatchViewset, TextSearchConversationViewset
 from user_profile.views import GetTokenView, LogOutView, UserProfileViewSet
 
 router = routers.DefaultRouter()
@@ -33,6 +36,7 @@ router.register('core_settings', CoreVariableViewSet, basename='core_settings')
 router.register('dataset', DatasetViewset, basename='dataset')
 router.register('user_profile', UserProfileViewSet, basename='user_profile')
 router.register('text_search', TextSearchConversationViewset, basename='text_search')
+router.register('text_search_batch', TextSearchBatchViewset, basename='text_search_batch')
 router.register('document_search', DocumentSearchConversationViewset, basename='document_search')
 
 urlpatterns = [
@@ -45,5 +49,9 @@ urlpatterns = [
     path('get_token', GetTokenView.as_view(), name='get_token'),
     path('log_out', LogOutView.as_view(), name='log_out'),
     path('health', HealthView.as_view(), name='health'),
+    path('metrics', MetricsView.as_view(), name='metrics'),
     path('statistics', StatisticsView.as_view(), name='statistics'),
+    path('task_status/<uuid:result_uuid>/', TaskStatusView.as_view(), name='task_status'),
+    path('task_events', TaskEventsView.as_view(), name='task_events'),
+    path('task_events/token', TaskEventsTokenView.as_view(), name='task_events_token'),
 ]
@@ -0,0 +1,46 @@
+import logging
+import os
+import pathlib
+from typing import Dict, Iterable
+
+import tiktoken
+from tiktoken import Encoding
+
+logger = logging.getLogger(__name__)
+
+# Encoders are immutable once built, so every process keeps a single
+# instance per model name and hands the same object to every task.
+_ENCODERS: Dict[str, Encoding] = {}
+
+
+def set_encoder_cache_directory(cache_directory: pathlib.Path) -> None:
+    # Tiktoken only downloads the BPE files when they are missing from
+    # this directory, which is what makes air-gapped nodes work.
+    os.environ.setdefault('TIKTOKEN_CACHE_DIR', str(cache_directory))
+
+
+def download_encoder_resources(model_names: Iterable[str], cache_directory: pathlib.Path) -> None:
+    set_encoder_cache_directory(cache_directory)
+    cache_directory.mkdir(parents=True, exist_ok=True)
+
+    for model_name in model_names:
+        logger.info(f'Fetching tiktoken encoding for model: {model_name}')
+        tiktoken.encoding_for_model(model_name)
+
+
+def get_encoder(model_name: str) -> Encoding:
+    encoder = _ENCODERS.get(model_name, None)
+    if encoder is None:
+        encoder = tiktoken.encoding_for_model(model_name)
+        _ENCODERS[model_name] = encoder
+    return encoder
+
+
+def load_encoders(model_names: Iterable[str]) -> None:
+    for model_name in model_names:
+        try:
+            get_encoder(model_name)
+        except Exception:  # pylint: disable=broad-exception-caught
+            # A missing encoding shouldn't keep the worker from booting,
+            # the task will try again and fail with a proper error.
+            logger.exception(f'Could not preload tiktoken encoding for model: {model_name}')
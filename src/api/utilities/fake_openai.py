@@ -0,0 +1,311 @@
+"""
+Stand-in for the OpenAI chat completions API for load and latency testing.
+
+The server speaks just enough of the API for the openai client used by ChatGPT:
+POST /v1/chat/completions with or without streaming, token usage and rate limit
+headers. Latencies are drawn from a configurable distribution and errors
+(429, 5xx and hanging requests) can be injected at configurable rates.
+
+Run it as a separate process with ``python manage.py run_fake_openai`` or in-process
+with FakeOpenAIServer(...).start() and point the OPENAI_API_BASE_URL core setting
+towards its base_url.
+"""
+import json
+import logging
+import math
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+LATENCY_DISTRIBUTIONS = ('fixed', 'uniform', 'normal', 'lognormal')
+DEFAULT_RESPONSE_TEXT = 'This is an answer from the stand-in OpenAI server.\n\nAllikad: 0'
+
+# pylint: disable=too-many-instance-attributes
+
+
+class FakeOpenAIBehaviour:
+    def __init__(
+        self,
+        latency_distribution: str = 'fixed',
+        latency_mean: float = 0.0,
+        latency_stddev: float = 0.0,
+        rate_limit_error_rate: float = 0.0,
+        server_error_rate: float = 0.0,
+        timeout_rate: float = 0.0,
+        timeout_seconds: float = 60.0,
+        requests_per_minute: int = 500,
+        tokens_per_minute: int = 30000,
+        response_text: str = DEFAULT_RESPONSE_TEXT,
+        seed: Optional[int] = None,
+    ):  # pylint: disable=too-many-arguments
+        if latency_distribution not in LATENCY_DISTRIBUTIONS:
+            raise ValueError(f'Unknown latency distribution: {latency_distribution}')
+
+        self.latency_distribution = latency_distribution
+        self.latency_mean = latency_mean
+        self.latency_stddev = latency_stddev
+
+        self.rate_limit_error_rate = rate_limit_error_rate
+        self.server_error_rate = server_error_rate
+        self.timeout_rate = timeout_rate
+        self.timeout_seconds = timeout_seconds
+
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.response_text = response_text
+
+        self.random = random.Random(seed)  # nosec
+        self._lock = threading.Lock()
+        self._window_start = time.monotonic()
+        self._window_requests = 0
+        self._window_tokens = 0
+
+    def sample_latency(self) -> float:
+        mean, stddev = self.latency_mean, self.latency_stddev
+        with self._lock:
+            if self.latency_distribution == 'uniform':
+                latency = self.random.uniform(mean - stddev, mean + stddev)
+            elif self.latency_distribution == 'normal':
+                latency = self.random.gauss(mean, stddev)
+            elif self.latency_distribution == 'lognormal' and mean > 0:
+                # Parametrized by the mean and deviation of the latency itself,
+                # which gives the long tail that real APIs tend to have.
+                sigma = math.sqrt(math.log(1 + (stddev / mean) ** 2))
+                latency = self.random.lognormvariate(math.log(mean) - sigma**2 / 2, sigma)
+            else:
+                latency = mean
+        return max(latency, 0.0)
+
+    def sample_failure(self) -> Optional[str]:
+        with self._lock:
+            roll = self.random.random()
+
+        if roll < self.timeout_rate:
+            return 'timeout'
+        roll -= self.timeout_rate
+        if roll < self.rate_limit_error_rate:
+            return 'rate_limit'
+        roll -= self.rate_limit_error_rate
+        if roll < self.server_error_rate:
+            return 'server_error'
+        return None
+
+    def consume_rate_limit(self, tokens: int) -> Tuple[bool, Dict[str, str]]:
+        """
+        Counts the request towards the current one minute window.
+        :return: Whether the request fits into the limits and the rate limit headers.
+        """
+        with self._lock:
+            now = time.monotonic()
+            if now - self._window_start >= 60:
+                self._window_start = now
+                self._window_requests = 0
+                self._window_tokens = 0
+
+            self._window_requests += 1
+            self._window_tokens += tokens
+            reset_ms = int((60 - (now - self._window_start)) * 1000)
+
+            remaining_requests = self.requests_per_minute - self._window_requests
+            remaining_tokens = self.tokens_per_minute - self._window_tokens
+
+        headers = {
+            'x-ratelimit-limit-requests': str(self.requests_per_minute),
+            'x-ratelimit-limit-tokens': str(self.tokens_per_minute),
+            'x-ratelimit-remaining-requests': str(max(remaining_requests, 0)),
+            'x-ratelimit-remaining-tokens': str(max(remaining_tokens, 0)),
+            'x-ratelimit-reset-requests': f'{reset_ms}ms',
+            'x-ratelimit-reset-tokens': f'{reset_ms}ms',
+        }
+        return remaining_requests >= 0 and remaining_tokens >= 0, headers
+
+
+def _count_tokens(text: str) -> int:
+    # Roughly how the OpenAI tokenizers behave for European languages,
+    # good enough for usage numbers and rate limits.
+    return max(1, math.ceil(len(text) / 4))
+
+
+def _completion(model: str, text: str, prompt_tokens: int) -> dict:
+    completion_tokens = _count_tokens(text)
+    return {
+        'id': f'chatcmpl-{uuid.uuid4().hex}',
+        'object': 'chat.completion',
+        'created': int(time.time()),
+        'model': model,
+        'system_fingerprint': 'fp_fake',
+        'choices': [
+            {
+                'index': 0,
+                'finish_reason': 'stop',
+                'logprobs': None,
+                'message': {'role': 'assistant', 'content': text},
+            }
+        ],
+        'usage': {
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': completion_tokens,
+            'total_tokens': prompt_tokens + completion_tokens,
+        },
+    }
+
+
+def _completion_chunks(
+    model: str, text: str, prompt_tokens: int, include_usage: bool
+) -> List[dict]:
+    base = {
+        'id': f'chatcmpl-{uuid.uuid4().hex}',
+        'object': 'chat.completion.chunk',
+        'created': int(time.time()),
+        'model': model,
+        'system_fingerprint': 'fp_fake',
+    }
+
+    chunks = [base | {'choices': [{'index': 0, 'delta': {'role': 'assistant', 'content': ''}}]}]
+    for word in text.split(' '):
+        delta = {'content': f'{word} '}
+        chunks.append(base | {'choices': [{'index': 0, 'delta': delta, 'finish_reason': None}]})
+    chunks.append(base | {'choices': [{'index': 0, 'delta': {}, 'finish_reason': 'stop'}]})
+
+    if include_usage:
+        completion_tokens = _count_tokens(text)
+        usage = {
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': completion_tokens,
+            'total_tokens': prompt_tokens + completion_tokens,
+        }
+        chunks.append(base | {'choices': [], 'usage': usage})
+    return chunks
+
+
+class _FakeOpenAIHandler(BaseHTTPRequestHandler):
+    # Keep-alive is needed to see the effect of connection pooling in the clients.
+    protocol_version = 'HTTP/1.1'
+    server: '_FakeOpenAIHTTPServer'
+
+    def log_message(self, format: str, *args: Any) -> None:  # pylint: disable=redefined-builtin
+        logger.debug(format, *args)
+
+    def _send_json(self, status_code: int, body: dict, headers: Dict[str, str]) -> None:
+        content = json.dumps(body).encode('utf8')
+        self.send_response(status_code)
+        self.send_header('content-type', 'application/json')
+        self.send_header('content-length', str(len(content)))
+        self.send_header('x-request-id', f'req_{uuid.uuid4().hex}')
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(content)
+
+    def _send_error(self, status_code: int, error_type: str, headers: Dict[str, str]) -> None:
+        body = {'error': {'message': f'Injected {error_type}', 'type': error_type, 'code': None}}
+        self._send_json(status_code, body, headers)
+
+    def _send_stream(self, chunks: List[dict], headers: Dict[str, str]) -> None:
+        self.send_response(200)
+        self.send_header('content-type', 'text/event-stream')
+        self.send_header('transfer-encoding', 'chunked')
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.end_headers()
+
+        events = [f'data: {json.dumps(chunk)}\n\n' for chunk in chunks] + ['data: [DONE]\n\n']
+        for event in events:
+            data = event.encode('utf8')
+            self.wfile.write(f'{len(data):x}\r\n'.encode('ascii') + data + b'\r\n')
+            self.wfile.flush()
+        self.wfile.write(b'0\r\n\r\n')
+
+    def do_POST(self) -> None:  # pylint: disable=invalid-name
+        length = int(self.headers.get('content-length', 0))
+        request = json.loads(self.rfile.read(length) or b'{}')
+
+        if self.path.rstrip('/') not in ('/v1/chat/completions', '/chat/completions'):
+            self._send_error(404, 'not_found_error', {})
+            return
+
+        behaviour = self.server.behaviour
+        time.sleep(behaviour.sample_latency())
+
+        failure = behaviour.sample_failure()
+        if failure == 'timeout':
+            # Hang until the client gives up and then drop the connection.
+            time.sleep(behaviour.timeout_seconds)
+            self.close_connection = True  # pylint: disable=attribute-defined-outside-init
+            return
+
+        messages = request.get('messages', [])
+        prompt_tokens = sum(_count_tokens(str(message.get('content', ''))) for message in messages)
+        fits_limits, headers = behaviour.consume_rate_limit(prompt_tokens)
+
+        if failure == 'rate_limit' or not fits_limits:
+            self._send_error(429, 'rate_limit_exceeded', headers | {'retry-after': '1'})
+            return
+        if failure == 'server_error':
+            status_code = behaviour.random.choice((500, 502, 503))
+            self._send_error(status_code, 'server_error', headers)
+            return
+
+        model = request.get('model', 'gpt-4o')
+        if request.get('stream', False):
+            include_usage = (request.get('stream_options') or {}).get('include_usage', False)
+            chunks = _completion_chunks(
+                model, behaviour.response_text, prompt_tokens, include_usage
+            )
+            self._send_stream(chunks, headers)
+        else:
+            body = _completion(model, behaviour.response_text, prompt_tokens)
+            self._send_json(200, body, headers)
+
+
+class _FakeOpenAIHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: Tuple[str, int], behaviour: FakeOpenAIBehaviour):
+        super().__init__(address, _FakeOpenAIHandler)
+        self.behaviour = behaviour
+
+
+class FakeOpenAIServer:
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, **behaviour: Any):
+        """
+        :param host: Address to listen at.
+        :param port: Port to listen at, 0 picks a free one.
+        :param behaviour: Keyword arguments for FakeOpenAIBehaviour.
+        """
+        self.behaviour = FakeOpenAIBehaviour(**behaviour)
+        self.host = host
+        self.httpd = _FakeOpenAIHTTPServer((host, port), self.behaviour)
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        # The port is only known once bound when 0 was given.
+        port = self.httpd.server_address[1]
+        return f'http://{self.host}:{port}/v1'
+
+    def serve_forever(self) -> None:
+        self.httpd.serve_forever()
+
+    def start(self) -> 'FakeOpenAIServer':
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self) -> 'FakeOpenAIServer':
+        return self.start()
+
+    def __exit__(self, *args: Any) -> None:
+        self.stop()
@@ -1,13 +1,21 @@
+import importlib.util
+import json
 import logging
 import os
 import re
-from typing import List, Optional, Tuple
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Deque, Dict, List, Optional, Tuple
 
 import django
+import httpx
 import openai
+from django.conf import settings
 from django.utils.translation import gettext as _
 from rest_framework.exceptions import APIException
 
+from core.exceptions import OPENAI_EXCEPTIONS
 from core.models import CoreVariable
 
 logger = logging.getLogger(__name__)
@@ -25,6 +33,8 @@ class LLMResponse:
         input_tokens: int,
         response_tokens: int,
         headers: dict,
+        hedged_requests: int = 0,
+        is_batch: bool = False,
     ):  # pylint: disable=too-many-arguments
         self.raw_message = message
         self.model = model
@@ -34,6 +44,12 @@ class LLMResponse:
         self.response_tokens = response_tokens
         self.headers = headers
 
+        # How many additional requests were sent out for the same messages
+        # and still have to be paid for despite their answer being discarded.
+        self.hedged_requests = hedged_requests
+        # Answers from the Batch API are billed at a discounted rate.
+        self.is_batch = is_batch
+
         self.__message: str = ''
         self.__information_found: Optional[bool] = None
         self.__used_references: List[int] = []
@@ -106,9 +122,13 @@ class LLMResponse:
 
     @property
     def total_cost(self) -> float:
-        return self.input_tokens * CoreVariable.get_core_setting(
-            'EURO_COST_PER_INPUT_TOKEN'
-        ) + self.response_tokens * CoreVariable.get_core_setting('EURO_COST_PER_OUTPUT_TOKEN')
+        prefix = 'EURO_COST_PER_BATCH' if self.is_batch else 'EURO_COST_PER'
+        request_cost = self.input_tokens * CoreVariable.get_core_setting(
+            f'{prefix}_INPUT_TOKEN'
+        ) + self.response_tokens * CoreVariable.get_core_setting(f'{prefix}_OUTPUT_TOKEN')
+        # The usage of the discarded requests is never seen,
+        # so they're estimated to cost as much as the one that was used.
+        return request_cost * (1 + self.hedged_requests)
 
     def __str__(self) -> str:
         return f'{self.message} / {self.total_tokens} tokens used'
@@ -139,6 +159,105 @@ def _parse_message(response: dict, user_input: str) -> str:
     return message
 
 
+# Clients are kept for the lifetime of the process so that consecutive requests
+# reuse the warm TLS connections inside the httpx pool instead of handshaking anew.
+_CLIENTS: Dict[Tuple[str, int, int, Optional[str]], openai.OpenAI] = {}
+
+
+def _reset_clients() -> None:
+    # Connections inherited from the parent process share their sockets with it,
+    # so a forked child (Celery prefork) must always open its own.
+    _CLIENTS.clear()
+
+
+# Rolling per-process history of successful request latencies (in seconds) and of
+# whether a request was hedged, used to pick the hedging delay and to cap the hedge rate.
+_LATENCY_WINDOW = 200
+_MIN_LATENCY_SAMPLES = 20
+_LATENCIES: Deque[float] = deque(maxlen=_LATENCY_WINDOW)
+_HEDGE_HISTORY: Deque[bool] = deque(maxlen=_LATENCY_WINDOW)
+_EXECUTOR: Optional[ThreadPoolExecutor] = None
+# How many tasks the process runs at once, set by the Celery worker before its pool starts.
+_CONCURRENCY: Optional[int] = None
+
+
+def _reset_hedging() -> None:
+    global _EXECUTOR  # pylint: disable=global-statement
+    _EXECUTOR = None
+    _LATENCIES.clear()
+    _HEDGE_HISTORY.clear()
+
+
+def set_hedging_concurrency(concurrency: int) -> None:
+    global _CONCURRENCY  # pylint: disable=global-statement
+    _CONCURRENCY = concurrency
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _EXECUTOR  # pylint: disable=global-statement
+    if _EXECUTOR is None:
+        # Every task running at once may have its request and a hedge in flight. With fewer
+        # threads requests would wait for one, and as the wait counts towards the hedge delay,
+        # hedges would fire on queueing instead of on slow responses. Outside of the workers
+        # no more requests than there are connections can be in flight anyway.
+        concurrency = _CONCURRENCY or settings.OPENAI_HTTP_MAX_CONNECTIONS
+        _EXECUTOR = ThreadPoolExecutor(
+            max_workers=2 * concurrency, thread_name_prefix='openai-hedge'
+        )
+    return _EXECUTOR
+
+
+def get_hedge_delay(default_delay: float) -> float:
+    """Returns the p95 of recent request latencies or the default while there are too few."""
+    if len(_LATENCIES) < _MIN_LATENCY_SAMPLES:
+        return default_delay
+
+    latencies = sorted(_LATENCIES)
+    index = min(len(latencies) - 1, int(len(latencies) * 0.95))
+    return latencies[index]
+
+
+def is_hedge_allowed(max_rate: float) -> bool:
+    if not _HEDGE_HISTORY:
+        return max_rate > 0
+    return sum(_HEDGE_HISTORY) / len(_HEDGE_HISTORY) < max_rate
+
+
+os.register_at_fork(after_in_child=_reset_clients)
+os.register_at_fork(after_in_child=_reset_hedging)
+
+
+def _build_http_client(timeout: int) -> httpx.Client:
+    use_http2 = settings.OPENAI_HTTP2
+    if use_http2 and importlib.util.find_spec('h2') is None:
+        logger.warning('Package h2 is not installed, falling back to HTTP/1.1 for OpenAI API!')
+        use_http2 = False
+
+    limits = httpx.Limits(
+        max_connections=settings.OPENAI_HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.OPENAI_HTTP_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=settings.OPENAI_HTTP_KEEPALIVE_EXPIRY,
+    )
+    return httpx.Client(limits=limits, http2=use_http2, timeout=timeout)
+
+
+def get_openai_client(
+    api_key: str, timeout: int, max_retries: int, base_url: Optional[str] = None
+) -> openai.OpenAI:
+    key = (api_key, timeout, max_retries, base_url)
+    client = _CLIENTS.get(key, None)
+    if client is None:
+        client = openai.OpenAI(
+            api_key=api_key,
+            timeout=timeout,
+            max_retries=max_retries,
+            base_url=base_url,
+            http_client=_build_http_client(timeout),
+        )
+        _CLIENTS[key] = client
+    return client
+
+
 def construct_messages_for_testing(system_input: str, user_input: str) -> List[dict]:
     return [
         {'role': 'system', 'content': system_input},
@@ -153,20 +272,49 @@ class ChatGPT:
         model: Optional[str] = None,
         timeout: Optional[int] = None,
         max_retries: Optional[int] = None,
-    ):
-        api_key = api_key or CoreVariable.get_core_setting('OPENAI_API_KEY')
-        timeout = timeout or CoreVariable.get_core_setting('OPENAI_API_TIMEOUT')
-        max_retries = max_retries or CoreVariable.get_core_setting('OPENAI_API_MAX_RETRIES')
+        base_url: Optional[str] = None,
+    ):  # pylint: disable=too-many-arguments
+        core_settings = CoreVariable.get_core_settings(
+            'OPENAI_API_KEY',
+            'OPENAI_API_BASE_URL',
+            'OPENAI_API_TIMEOUT',
+            'OPENAI_API_MAX_RETRIES',
+            'OPENAI_API_CHAT_MODEL',
+            'OPENAI_API_TEMPERATURE',
+            'OPENAI_API_HEDGE_ENABLED',
+            'OPENAI_API_HEDGE_DELAY',
+            'OPENAI_API_HEDGE_MAX_RATE',
+            'OPENAI_API_HEDGE_FALLBACK_MODEL',
+        )
+        api_key = api_key or core_settings['OPENAI_API_KEY']
+        timeout = timeout or core_settings['OPENAI_API_TIMEOUT']
+        max_retries = max_retries or core_settings['OPENAI_API_MAX_RETRIES']
+        base_url = base_url or core_settings['OPENAI_API_BASE_URL'] or None
 
-        self.model = model or CoreVariable.get_core_setting('OPENAI_API_CHAT_MODEL')
+        self.model = model or core_settings['OPENAI_API_CHAT_MODEL']
+        self.temperature = core_settings['OPENAI_API_TEMPERATURE']
+
+        self.hedge_enabled = core_settings['OPENAI_API_HEDGE_ENABLED']
+        self.hedge_delay = core_settings['OPENAI_API_HEDGE_DELAY']
+        self.hedge_max_rate = core_settings['OPENAI_API_HEDGE_MAX_RATE']
+        self.hedge_model = core_settings['OPENAI_API_HEDGE_FALLBACK_MODEL'] or self.model
 
         if api_key is not None:
-            self.gpt = openai.OpenAI(api_key=api_key, timeout=timeout, max_retries=max_retries)
+            self.gpt = get_openai_client(
+                api_key=api_key, timeout=timeout, max_retries=max_retries, base_url=base_url
+            )
         else:
             logger.warning('No OpenAI API key found, this better be testing!')
             self.gpt = None
 
-    def _parse_results(self, user_input: str, response: dict, headers: dict) -> LLMResponse:
+    def _parse_results(
+        self,
+        user_input: str,
+        response: dict,
+        headers: dict,
+        hedged_requests: int = 0,
+        is_batch: bool = False,
+    ) -> LLMResponse:  # pylint: disable=too-many-arguments
         message = _parse_message(response, user_input)
 
         return LLMResponse(
@@ -176,18 +324,66 @@ class ChatGPT:
             input_tokens=response.get('usage', {}).get('prompt_tokens'),
             response_tokens=response.get('usage', {}).get('completion_tokens'),
             headers=headers,
+            hedged_requests=hedged_requests,
+            is_batch=is_batch,
         )
 
-    def _commit_api(self, messages: List[dict]) -> Tuple[dict, dict, int]:
-        temperature = CoreVariable.get_core_setting('OPENAI_API_TEMPERATURE')
-
+    def _timed_commit_api(self, messages: List[dict], model: str) -> Tuple[dict, dict, int]:
+        start = time.monotonic()
+        api_result = self._commit_api(messages=messages, model=model)
+        _LATENCIES.append(time.monotonic() - start)
+        return api_result
+
+    def _commit_hedged_api(self, messages: List[dict]) -> Tuple[dict, dict, int, int]:
+        """
+        Sends the request and, if it hasn't finished within the p95 latency of the previous
+        requests, sends a second one (to the fallback model if configured) in parallel.
+        Whichever request finishes successfully first is used.
+
+        :return: Headers, response and status code of the winner along with how many
+        other requests are still running and thus will still be billed.
+        """
+        executor = _get_executor()
+        primary = executor.submit(self._timed_commit_api, messages, self.model)
+
+        delay = get_hedge_delay(self.hedge_delay)
+        done, _ = wait([primary], timeout=delay)
+        if done or not is_hedge_allowed(self.hedge_max_rate):
+            _HEDGE_HISTORY.append(False)
+            return (*primary.result(), 0)
+
+        logger.info(f'OpenAI API response took longer than {delay:.2f}s, hedging the request!')
+        _HEDGE_HISTORY.append(True)
+        hedge = executor.submit(self._timed_commit_api, messages, self.hedge_model)
+
+        pending = {primary, hedge}
+        first_exception: Optional[BaseException] = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                exception = future.exception()
+                if exception is None:
+                    # Requests that finished along with the winner are billed as well.
+                    finished = [other for other in done if other is not future]
+                    billed = [other for other in finished if other.exception() is None]
+                    return (*future.result(), len(pending) + len(billed))
+                first_exception = first_exception or exception
+
+        raise first_exception  # type: ignore
+
+    def _commit_api(
+        self, messages: List[dict], model: Optional[str] = None
+    ) -> Tuple[dict, dict, int]:
         if self.gpt is None:
             message = _("No OpenAI API key given, can't query API!")
             raise APIException(message)
 
         try:
             response = self.gpt.chat.completions.with_raw_response.create(
-                model=self.model, stream=False, messages=messages, temperature=temperature
+                model=model or self.model,
+                stream=False,
+                messages=messages,
+                temperature=self.temperature,
             )
 
             headers = dict(response.headers)
@@ -243,10 +439,104 @@ class ChatGPT:
 
     def chat(self, messages: List[dict]) -> LLMResponse:
         user_input = messages[-1]['content']
-        headers, response, _ = self._commit_api(messages=messages)
-        llm_result = self._parse_results(user_input=user_input, response=response, headers=headers)
+
+        hedged_requests = 0
+        if self.hedge_enabled and self.gpt is not None:
+            headers, response, _, hedged_requests = self._commit_hedged_api(messages=messages)
+        else:
+            headers, response, _ = self._commit_api(messages=messages)
+
+        llm_result = self._parse_results(
+            user_input=user_input,
+            response=response,
+            headers=headers,
+            hedged_requests=hedged_requests,
+        )
         return llm_result
 
+    # Batch API
+
+    def build_batch_request(self, custom_id: str, messages: List[dict]) -> dict:
+        return {
+            'custom_id': custom_id,
+            'method': 'POST',
+            'url': '/v1/chat/completions',
+            'body': {'model': self.model, 'messages': messages, 'temperature': self.temperature},
+        }
+
+    def _check_client(self) -> openai.OpenAI:
+        if self.gpt is None:
+            message = _("No OpenAI API key given, can't query API!")
+            raise APIException(message)
+        return self.gpt
+
+    def submit_batch(self, requests: List[dict]) -> openai.types.Batch:
+        """
+        Uploads the requests as a single JSONL file and creates a Batch API job for it.
+        :param requests: Requests created with build_batch_request.
+        """
+        client = self._check_client()
+        content = '\n'.join(json.dumps(request, ensure_ascii=False) for request in requests)
+
+        try:
+            batch_file = client.files.create(
+                file=('batch.jsonl', content.encode('utf8')), purpose='batch'
+            )
+            return client.batches.create(
+                input_file_id=batch_file.id,
+                endpoint='/v1/chat/completions',
+                completion_window='24h',
+            )
+        except OPENAI_EXCEPTIONS as exception:
+            raise exception
+        except openai.OpenAIError as exception:
+            logger.exception('Could not create an OpenAI batch!')
+            message = _("Couldn't create the OpenAI batch!")
+            raise APIException(message) from exception
+
+    def retrieve_batch(self, batch_id: str) -> openai.types.Batch:
+        client = self._check_client()
+        return client.batches.retrieve(batch_id)
+
+    def download_batch_results(self, file_id: str) -> List[dict]:
+        client = self._check_client()
+        content = client.files.content(file_id).text
+        return [json.loads(line) for line in content.splitlines() if line.strip()]
+
+    @staticmethod
+    def get_batch_result_error(batch_result: dict) -> Optional[str]:
+        """
+        Returns why OpenAI failed a request of a batch, if it did.
+        :param batch_result: Line of the output or error file as a dict.
+        """
+        response = batch_result.get('response') or {}
+        if not batch_result.get('error') and response.get('status_code') == 200:
+            return None
+
+        error = batch_result.get('error') or (response.get('body') or {}).get('error') or {}
+        if isinstance(error, dict):
+            status_code = response.get('status_code')
+            return error.get('message') or f'Request failed with status code {status_code}'
+        return str(error)
+
+    def parse_batch_result(self, user_input: str, batch_result: dict) -> LLMResponse:
+        """
+        Parses a single line of the Batch API output file.
+        :param user_input: Message that was sent as the last message of the request.
+        :param batch_result: Line of the output file as a dict.
+        """
+        error = self.get_batch_result_error(batch_result)
+        if error:
+            raise RuntimeError(f'OpenAI batch request failed: {error}')
+
+        response = batch_result.get('response') or {}
+        return self._parse_results(
+            user_input=user_input,
+            response=response.get('body', {}),
+            headers={},
+            is_batch=True,
+        )
+
 
 if __name__ == '__main__':
     os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'api.settings')
@@ -0,0 +1,124 @@
+import json
+import pathlib
+import time
+import uuid
+import zlib
+from typing import Any, Optional
+
+import redis
+from django.conf import settings
+
+# Chained Celery tasks hand each other only a small claim check in the form of
+# {PAYLOAD_KEY_FIELD: key}, the payload itself is kept compressed in the store.
+PAYLOAD_KEY_FIELD = 'payload_key'
+PAYLOAD_KEY_PREFIX = 'rk:payload:'
+
+_REDIS_CLIENT: Optional[redis.Redis] = None
+_LAST_DISK_PURGE = 0.0
+
+
+class PayloadExpiredError(Exception):
+    pass
+
+
+def _get_redis_client() -> redis.Redis:
+    global _REDIS_CLIENT  # pylint: disable=global-statement
+    # The connection pool of redis-py resets itself after a fork.
+    if _REDIS_CLIENT is None:
+        _REDIS_CLIENT = redis.Redis.from_url(settings.PAYLOAD_STORE_URL)
+    return _REDIS_CLIENT
+
+
+def _get_payload_path(key: str) -> pathlib.Path:
+    return pathlib.Path(settings.PAYLOAD_STORE_DIR) / f'{key}.json.z'
+
+
+def _purge_expired_disk_payloads() -> None:
+    # Scanning the directory on every write would get expensive,
+    # so every process does it at most ten times within the TTL.
+    global _LAST_DISK_PURGE  # pylint: disable=global-statement
+    now = time.time()
+    if now - _LAST_DISK_PURGE < settings.PAYLOAD_STORE_TTL / 10:
+        return
+
+    _LAST_DISK_PURGE = now
+    for path in pathlib.Path(settings.PAYLOAD_STORE_DIR).glob('*.json.z'):
+        try:
+            if now - path.stat().st_mtime > settings.PAYLOAD_STORE_TTL:
+                path.unlink()
+        except FileNotFoundError:
+            # Deleted by its consumer or another process in the meanwhile.
+            pass
+
+
+def is_claim_check(value: Any) -> bool:
+    return isinstance(value, dict) and list(value.keys()) == [PAYLOAD_KEY_FIELD]
+
+
+def store_payload(payload: dict) -> dict:
+    """
+    Stores the payload compressed and returns the claim check to pass along instead.
+    With the 'inline' backend the payload itself is returned.
+    """
+    backend = settings.PAYLOAD_STORE_BACKEND
+    if backend == 'inline':
+        return payload
+
+    key = uuid.uuid4().hex
+    data = zlib.compress(json.dumps(payload, ensure_ascii=False).encode('utf8'))
+
+    if backend == 'redis':
+        _get_redis_client().set(f'{PAYLOAD_KEY_PREFIX}{key}', data, ex=settings.PAYLOAD_STORE_TTL)
+    elif backend == 'disk':
+        directory = pathlib.Path(settings.PAYLOAD_STORE_DIR)
+        directory.mkdir(parents=True, exist_ok=True)
+        _purge_expired_disk_payloads()
+
+        # Write and rename so that a reader never sees a half written file.
+        path = _get_payload_path(key)
+        temporary_path = path.with_suffix('.tmp')
+        temporary_path.write_bytes(data)
+        temporary_path.replace(path)
+    else:
+        raise ValueError(f'Unknown payload store backend: {backend}')
+
+    return {PAYLOAD_KEY_FIELD: key}
+
+
+def load_payload(value: dict) -> dict:
+    """
+    Returns the payload behind a claim check. Anything that isn't a claim check
+    is returned as is, which keeps messages sent before the store was enabled working.
+    """
+    if not is_claim_check(value):
+        return value
+
+    key = value[PAYLOAD_KEY_FIELD]
+    data: Optional[bytes] = None
+
+    if settings.PAYLOAD_STORE_BACKEND == 'redis':
+        data = _get_redis_client().get(f'{PAYLOAD_KEY_PREFIX}{key}')
+    else:
+        path = _get_payload_path(key)
+        try:
+            if time.time() - path.stat().st_mtime <= settings.PAYLOAD_STORE_TTL:
+                data = path.read_bytes()
+        except FileNotFoundError:
+            pass
+
+    if data is None:
+        raise PayloadExpiredError(f'Payload {key} has expired or was never stored!')
+
+    return json.loads(zlib.decompress(data).decode('utf8'))
+
+
+def delete_payload(value: dict) -> None:
+    """Frees the payload once its last consumer is done with it, the TTL handles the rest."""
+    if not is_claim_check(value):
+        return
+
+    key = value[PAYLOAD_KEY_FIELD]
+    if settings.PAYLOAD_STORE_BACKEND == 'redis':
+        _get_redis_client().delete(f'{PAYLOAD_KEY_PREFIX}{key}')
+    else:
+        _get_payload_path(key).unlink(missing_ok=True)
@@ -0,0 +1,167 @@
+"""
+Cold start profiling of the processes the application runs as.
+
+Every entry point is started in a fresh interpreter and loads the application the way uWSGI,
+Celery and manage.py do. It's measured for its wall time and peak RSS, and started once more
+with ``-X importtime`` for the import time of every module. Run it with
+``python manage.py profile_startup``.
+"""
+import json
+import pathlib
+import statistics
+import subprocess
+import sys
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# Code run by the profiled interpreter, each loads the application like its process would.
+ENTRY_POINTS: Dict[str, str] = {
+    'wsgi': 'import api.wsgi',
+    'celery': (
+        'from api.celery_handler import app\n'
+        # The worker imports the task modules before it takes on any tasks.
+        'app.loader.import_default_modules()'
+    ),
+    'manage': (
+        'import os\n'
+        "os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'api.settings')\n"
+        'from django.core.management import execute_from_command_line\n'
+        "execute_from_command_line(['manage.py', 'check'])"
+    ),
+}
+
+# Modules which none of the entry points should import, as they're only needed by the embed
+# workers once they load the vectorization model.
+FORBIDDEN_MODULES = ('torch', 'transformers', 'FlagEmbedding', 'huggingface_hub')
+
+_REPORT_MARKER = 'startup-profile:'
+
+_REPORT_CODE = f"""
+import json
+import resource
+import sys
+
+report = {{
+    # Kilobytes on Linux.
+    'max_rss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    'modules': sorted(sys.modules),
+}}
+print('{_REPORT_MARKER}' + json.dumps(report))
+"""
+
+
+class StartupProfile:
+    def __init__(
+        self,
+        entry_point: str,
+        wall_times: List[float],
+        max_rss: int,
+        import_times: Dict[str, Tuple[int, int]],
+        forbidden_modules: List[str],
+    ):  # pylint: disable=too-many-arguments
+        self.entry_point = entry_point
+        self.wall_times = wall_times
+        # In kilobytes.
+        self.max_rss = max_rss
+        # Self and cumulative import times in microseconds, keyed by the module name.
+        self.import_times = import_times
+        self.forbidden_modules = forbidden_modules
+
+    @property
+    def wall_time(self) -> float:
+        return statistics.median(self.wall_times)
+
+    def slowest_imports(self, count: int) -> List[Tuple[str, int, int]]:
+        """Returns the top-level imports that took the longest, including what they imported."""
+        top_level = [
+            (name, self_time, cumulative)
+            for name, (self_time, cumulative) in self.import_times.items()
+            if '.' not in name
+        ]
+        return sorted(top_level, key=lambda item: item[2], reverse=True)[:count]
+
+    def exceeds(self, max_seconds: Optional[float], max_rss_mb: Optional[float]) -> List[str]:
+        problems = []
+        if max_seconds is not None and self.wall_time > max_seconds:
+            problems.append(f'took {self.wall_time:.2f}s, over the budget of {max_seconds}s')
+        if max_rss_mb is not None and self.max_rss / 1024 > max_rss_mb:
+            problems.append(
+                f'peaked at {self.max_rss / 1024:.0f}MB, over the budget of {max_rss_mb}MB'
+            )
+        if self.forbidden_modules:
+            problems.append(f'imported {", ".join(self.forbidden_modules)}')
+        return problems
+
+
+def parse_import_times(output: str) -> Dict[str, Tuple[int, int]]:
+    """Parses the `import time: self | cumulative | module` lines of -X importtime."""
+    import_times = {}
+    for line in output.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        self_time, cumulative, name = line[len('import time:') :].split('|')
+        if not self_time.strip().isdigit():
+            # The header line.
+            continue
+        import_times[name.strip()] = (int(self_time), int(cumulative))
+    return import_times
+
+
+def _run(
+    code: str, working_directory: pathlib.Path, timeout: float, import_time: bool
+) -> Tuple[float, Dict[str, Any], str]:
+    options = ['-X', 'importtime'] if import_time else []
+    started_at = time.perf_counter()
+    process = subprocess.run(
+        [sys.executable, *options, '-c', f'{code}\n{_REPORT_CODE}'],
+        cwd=working_directory,
+        capture_output=True,
+        text=True,
+        timeout=timeout,
+        check=False,
+    )
+    wall_time = time.perf_counter() - started_at
+
+    if process.returncode != 0:
+        errors = [
+            line for line in process.stderr.splitlines() if not line.startswith('import time:')
+        ]
+        raise RuntimeError('\n'.join(errors[-20:]))
+
+    report_line = [line for line in process.stdout.splitlines() if line.startswith(_REPORT_MARKER)]
+    report = json.loads(report_line[-1][len(_REPORT_MARKER) :])
+    return wall_time, report, process.stderr
+
+
+def profile_entry_point(
+    entry_point: str,
+    working_directory: pathlib.Path,
+    repeat: int = 3,
+    forbidden_modules: Iterable[str] = FORBIDDEN_MODULES,
+    timeout: float = 300.0,
+) -> StartupProfile:
+    """
+    Starts the entry point repeat times for its median wall time and peak RSS, then once
+    more with -X importtime for the import times, as it slows the imports down.
+    """
+    wall_times = []
+    max_rss = 0
+    for _ in range(repeat):
+        wall_time, report, _ = _run(
+            ENTRY_POINTS[entry_point], working_directory, timeout, import_time=False
+        )
+        wall_times.append(wall_time)
+        max_rss = max(max_rss, report['max_rss'])
+
+    _, report, stderr = _run(
+        ENTRY_POINTS[entry_point], working_directory, timeout, import_time=True
+    )
+    loaded_modules = set(report['modules'])
+
+    return StartupProfile(
+        entry_point=entry_point,
+        wall_times=wall_times,
+        max_rss=max_rss,
+        import_times=parse_import_times(stderr),
+        forbidden_modules=[module for module in forbidden_modules if module in loaded_modules],
+    )
@@ -1,7 +1,10 @@
+import pathlib
+import tempfile
 from typing import Any
 
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import User
+from django.test import override_settings
 
 from core.models import CoreVariable
 from core.serializers import CoreVariableSerializer
@@ -15,6 +18,30 @@ class IsType:
         return isinstance(other, self.type)
 
 
+def use_settings(test_case: Any, **settings: Any) -> None:
+    """
+    Overrides the settings until the end of the test, setUp can't use override_settings
+    as a context manager.
+    """
+    settings_override = override_settings(**settings)
+    settings_override.enable()
+    test_case.addCleanup(settings_override.disable)
+
+
+def use_temporary_directory(test_case: Any, *setting_names: str, **settings: Any) -> pathlib.Path:
+    """
+    Creates a directory which is removed at the end of the test and points the given
+    settings to it until then, along with overriding any other settings given.
+    :return: Path of the directory.
+    """
+    directory = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+    test_case.addCleanup(directory.cleanup)
+    path = pathlib.Path(directory.name)
+    if setting_names or settings:
+        use_settings(test_case, **{name: path for name in setting_names}, **settings)
+    return path
+
+
 def create_test_user(username: str, email: str, password: str, is_superuser: bool = False) -> User:
     model = get_user_model()
     auth_user = model.objects.create_user(
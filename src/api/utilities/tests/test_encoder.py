@@ -0,0 +1,27 @@
+from unittest import TestCase, mock
+
+from api.utilities import encoder as encoder_module
+from api.utilities.encoder import get_encoder, load_encoders
+
+
+class TestEncoderCache(TestCase):
+    def setUp(self) -> None:  # pylint: disable=invalid-name
+        encoder_module._ENCODERS.clear()  # pylint: disable=protected-access
+
+    def tearDown(self) -> None:  # pylint: disable=invalid-name
+        encoder_module._ENCODERS.clear()  # pylint: disable=protected-access
+
+    def test_encoder_being_built_only_once_per_model(self) -> None:
+        with mock.patch('tiktoken.encoding_for_model', return_value=object()) as mock_tiktoken:
+            load_encoders(['gpt-4o'])
+            first_encoder = get_encoder('gpt-4o')
+            second_encoder = get_encoder('gpt-4o')
+
+        mock_tiktoken.assert_called_once_with('gpt-4o')
+        self.assertIs(first_encoder, second_encoder)
+
+    def test_failing_preload_not_raising(self) -> None:
+        with mock.patch('tiktoken.encoding_for_model', side_effect=ConnectionError):
+            load_encoders(['gpt-4o'])
+
+        self.assertNotIn('gpt-4o', encoder_module._ENCODERS)  # pylint: disable=protected-access
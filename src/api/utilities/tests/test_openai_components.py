@@ -1,14 +1,25 @@
+import threading
+import time
+from concurrent.futures import ALL_COMPLETED, FIRST_COMPLETED, ThreadPoolExecutor, wait
 from copy import deepcopy
-from typing import Any, Dict
+from typing import Any, Dict, List, cast
 from unittest import mock
 
+import openai
+from openai.types import CompletionUsage
+from openai.types.chat import ChatCompletionMessageParam
 from rest_framework.exceptions import APIException
 from rest_framework.test import APITestCase
 
+from api.utilities import gpt as gpt_module
+from api.utilities.fake_openai import FakeOpenAIServer
 from api.utilities.gpt import (
     ChatGPT,
     ContentFilteredException,
+    _reset_clients,
+    _reset_hedging,
     construct_messages_for_testing,
+    set_hedging_concurrency,
 )
 from api.utilities.tests.test_settings import (
     GPT_HEADERS,
@@ -72,3 +83,160 @@ class ChatGPTTestCase(APITestCase):
             with mock.patch('api.utilities.gpt.ChatGPT._commit_api', return_value=return_values):
                 gpt = ChatGPT(api_key=None)
                 _ = gpt.chat(messages=self.messages)
+
+    def test_clients_being_reused_between_instances(self) -> None:
+        _reset_clients()
+
+        first_gpt = ChatGPT(api_key='foo', timeout=10, max_retries=1)
+        second_gpt = ChatGPT(api_key='foo', timeout=10, max_retries=1)
+        other_gpt = ChatGPT(api_key='bar', timeout=10, max_retries=1)
+
+        self.assertIs(first_gpt.gpt, second_gpt.gpt)
+        self.assertIsNot(first_gpt.gpt, other_gpt.gpt)
+
+        # Forked processes must not share the connections of their parent.
+        _reset_clients()
+        forked_gpt = ChatGPT(api_key='foo', timeout=10, max_retries=1)
+        self.assertIsNot(first_gpt.gpt, forked_gpt.gpt)
+
+    def test_slow_request_being_hedged_to_fallback_model(self) -> None:
+        _reset_hedging()
+        fallback_response = deepcopy(self.api_response) | {'model': 'gpt-4o-mini'}
+
+        def commit_side_effect(model: str, **_: Any) -> tuple:
+            if model == 'gpt-4o':
+                time.sleep(0.5)
+                return self.api_response_headers, self.api_response, self.api_status_code
+            return self.api_response_headers, fallback_response, self.api_status_code
+
+        with mock.patch(
+            'api.utilities.gpt.ChatGPT._commit_api', side_effect=commit_side_effect
+        ) as mock_gpt:
+            gpt = ChatGPT(api_key='foo', model='gpt-4o')
+            gpt.hedge_enabled = True
+            gpt.hedge_delay = 0.05
+            gpt.hedge_max_rate = 1.0
+            gpt.hedge_model = 'gpt-4o-mini'
+            llm_result = gpt.chat(messages=self.messages)
+
+            self.assertEqual(mock_gpt.call_count, 2)
+
+        self.assertEqual(llm_result.model, 'gpt-4o-mini')
+        self.assertEqual(llm_result.hedged_requests, 1)
+        # The discarded request is billed as well.
+        self.assertAlmostEqual(llm_result.total_cost, 2 * 0.000235)
+
+    def test_requests_finishing_together_both_being_billed(self) -> None:
+        _reset_hedging()
+        hedge_sent = threading.Event()
+
+        def commit_side_effect(model: str, **_: Any) -> tuple:
+            if model == 'gpt-4o':
+                hedge_sent.wait(timeout=5)
+            else:
+                hedge_sent.set()
+            return self.api_response_headers, self.api_response, self.api_status_code
+
+        def wait_for_both(futures: set, **kwargs: Any) -> tuple:
+            # Both requests are done by the time the results are looked at.
+            if kwargs.get('return_when') == FIRST_COMPLETED:
+                kwargs['return_when'] = ALL_COMPLETED
+            return wait(futures, **kwargs)
+
+        with mock.patch(
+            'api.utilities.gpt.ChatGPT._commit_api', side_effect=commit_side_effect
+        ), mock.patch('api.utilities.gpt.wait', side_effect=wait_for_both):
+            gpt = ChatGPT(api_key='foo', model='gpt-4o')
+            gpt.hedge_enabled = True
+            gpt.hedge_delay = 0.05
+            gpt.hedge_max_rate = 1.0
+            llm_result = gpt.chat(messages=self.messages)
+
+        self.assertEqual(llm_result.hedged_requests, 1)
+        self.assertAlmostEqual(llm_result.total_cost, 2 * 0.000235)
+
+    def test_hedging_respecting_the_rate_cap(self) -> None:
+        _reset_hedging()
+
+        def commit_side_effect(**_: Any) -> tuple:
+            time.sleep(0.1)
+            return self.api_response_headers, self.api_response, self.api_status_code
+
+        with mock.patch(
+            'api.utilities.gpt.ChatGPT._commit_api', side_effect=commit_side_effect
+        ) as mock_gpt:
+            gpt = ChatGPT(api_key='foo')
+            gpt.hedge_enabled = True
+            gpt.hedge_delay = 0.01
+            gpt.hedge_max_rate = 0.0
+            llm_result = gpt.chat(messages=self.messages)
+
+            mock_gpt.assert_called_once()
+
+        self.assertEqual(llm_result.hedged_requests, 0)
+        self.assertAlmostEqual(llm_result.total_cost, 0.000235)
+
+    def test_concurrent_requests_not_waiting_for_a_thread(self) -> None:
+        _reset_hedging()
+        self.addCleanup(_reset_hedging)
+        self.addCleanup(setattr, gpt_module, '_CONCURRENCY', None)
+        set_hedging_concurrency(6)
+
+        def commit_side_effect(**_: Any) -> tuple:
+            time.sleep(0.3)
+            return self.api_response_headers, self.api_response, self.api_status_code
+
+        def chat() -> int:
+            gpt = ChatGPT(api_key='foo')
+            gpt.hedge_enabled = True
+            gpt.hedge_delay = 0.5
+            gpt.hedge_max_rate = 1.0
+            return gpt.chat(messages=self.messages).hedged_requests
+
+        with mock.patch('api.utilities.gpt.ChatGPT._commit_api', side_effect=commit_side_effect):
+            with ThreadPoolExecutor(max_workers=6) as tasks:
+                hedged_requests = list(tasks.map(lambda _: chat(), range(6)))
+
+        # None of them is slow, so none is hedged however many run at once.
+        self.assertEqual(hedged_requests, [0] * 6)
+
+    def test_chatting_with_the_stand_in_server(self) -> None:
+        with FakeOpenAIServer(latency_mean=0.01) as server:
+            gpt = ChatGPT(api_key='foo', base_url=server.base_url, max_retries=1)
+            llm_result = gpt.chat(messages=self.messages)
+
+        self.assertEqual(llm_result.message, 'This is an answer from the stand-in OpenAI server.')
+        self.assertEqual(llm_result.used_references, [0])
+        self.assertGreater(llm_result.input_tokens, 0)
+        self.assertGreater(llm_result.response_tokens, 0)
+        self.assertEqual(llm_result.ratelimit_requests, 500)
+        self.assertEqual(llm_result.remaining_requests, 499)
+
+    def test_stand_in_server_injecting_errors(self) -> None:
+        with FakeOpenAIServer(rate_limit_error_rate=1.0) as server:
+            gpt = ChatGPT(api_key='foo', base_url=server.base_url, max_retries=1)
+            with self.assertRaises(openai.RateLimitError):
+                gpt.chat(messages=self.messages)
+
+        with FakeOpenAIServer(requests_per_minute=1) as server:
+            gpt = ChatGPT(api_key='foo', base_url=server.base_url, max_retries=1)
+            gpt.chat(messages=self.messages)
+            with self.assertRaises(openai.RateLimitError):
+                gpt.chat(messages=self.messages)
+
+    def test_stand_in_server_streaming(self) -> None:
+        with FakeOpenAIServer() as server:
+            gpt = ChatGPT(api_key='foo', base_url=server.base_url, max_retries=1)
+            stream = gpt.gpt.chat.completions.create(
+                model='gpt-4o',
+                messages=cast(List[ChatCompletionMessageParam], self.messages),
+                stream=True,
+                stream_options={'include_usage': True},
+            )
+            chunks = list(stream)
+
+        content = ''.join(chunk.choices[0].delta.content or '' for chunk in chunks if chunk.choices)
+        self.assertIn('stand-in OpenAI server', content)
+        # Usage is only sent in the last chunk, since include_usage was asked for.
+        usage = cast(CompletionUsage, chunks[-1].usage)
+        self.assertGreater(usage.completion_tokens, 0)
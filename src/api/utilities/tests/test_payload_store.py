@@ -0,0 +1,62 @@
+import os
+from unittest import mock
+
+from django.test import TestCase, override_settings
+
+from api.utilities.payload_store import (
+    PAYLOAD_KEY_FIELD,
+    PayloadExpiredError,
+    delete_payload,
+    load_payload,
+    store_payload,
+)
+from api.utilities.testing import use_temporary_directory
+
+PAYLOAD = {'context': 'Kommionu paneb moosi kommi sisse. ' * 100, 'references': [{'doc_id': '1'}]}
+
+
+class TestPayloadStore(TestCase):
+    def setUp(self) -> None:  # pylint: disable=invalid-name
+        self.directory = use_temporary_directory(
+            self, 'PAYLOAD_STORE_DIR', PAYLOAD_STORE_BACKEND='disk'
+        )
+
+    def test_payload_being_passed_as_claim_check(self) -> None:
+        handle = store_payload(PAYLOAD)
+
+        self.assertEqual(list(handle.keys()), [PAYLOAD_KEY_FIELD])
+        self.assertEqual(load_payload(handle), PAYLOAD)
+
+        # Payloads are compressed at rest.
+        stored_size = sum(path.stat().st_size for path in self.directory.iterdir())
+        self.assertLess(stored_size, len(PAYLOAD['context']) / 10)
+
+        delete_payload(handle)
+        with self.assertRaises(PayloadExpiredError):
+            load_payload(handle)
+
+    def test_expired_payload_not_being_loaded(self) -> None:
+        handle = store_payload(PAYLOAD)
+        path = self.directory / f'{handle[PAYLOAD_KEY_FIELD]}.json.z'
+        os.utime(path, (0, 0))
+
+        with self.assertRaises(PayloadExpiredError):
+            load_payload(handle)
+
+    def test_plain_payloads_being_passed_through(self) -> None:
+        self.assertEqual(load_payload(PAYLOAD), PAYLOAD)
+        delete_payload(PAYLOAD)
+
+        with override_settings(PAYLOAD_STORE_BACKEND='inline'):
+            self.assertIs(store_payload(PAYLOAD), PAYLOAD)
+
+    @override_settings(PAYLOAD_STORE_BACKEND='redis')
+    def test_redis_backend_setting_a_ttl(self) -> None:
+        redis_client = mock.MagicMock()
+        with mock.patch('api.utilities.payload_store._get_redis_client', return_value=redis_client):
+            handle = store_payload(PAYLOAD)
+
+        key, data = redis_client.set.call_args.args
+        self.assertTrue(key.endswith(handle[PAYLOAD_KEY_FIELD]))
+        self.assertIsInstance(data, bytes)
+        self.assertIn('ex', redis_client.set.call_args.kwargs)
@@ -0,0 +1,65 @@
+from io import StringIO
+from unittest import TestCase, mock
+
+from django.core.management import CommandError, call_command
+
+from api.utilities.startup_profile import StartupProfile, parse_import_times
+
+IMPORT_TIME_OUTPUT = """import time: self [us] | cumulative | imported package
+import time:       120 |        120 |   elastic_transport._version
+import time:      1500 |       1620 | elastic_transport
+import time:       300 |       2500 | django
+Traceback lines are ignored.
+"""
+
+
+def _profile(**kwargs: object) -> StartupProfile:
+    arguments = {
+        'entry_point': 'wsgi',
+        'wall_times': [1.0, 3.0, 2.0],
+        'max_rss': 150 * 1024,
+        'import_times': parse_import_times(IMPORT_TIME_OUTPUT),
+        'forbidden_modules': [],
+        **kwargs,
+    }
+    return StartupProfile(**arguments)  # type: ignore
+
+
+class TestStartupProfile(TestCase):
+    def test_import_times_being_parsed(self) -> None:
+        import_times = parse_import_times(IMPORT_TIME_OUTPUT)
+
+        self.assertEqual(import_times['elastic_transport._version'], (120, 120))
+        self.assertEqual(
+            _profile().slowest_imports(5),
+            [('django', 300, 2500), ('elastic_transport', 1500, 1620)],
+        )
+
+    def test_budgets_being_checked(self) -> None:
+        profile = _profile()
+
+        self.assertEqual(profile.wall_time, 2.0)
+        self.assertEqual(profile.exceeds(max_seconds=2.5, max_rss_mb=200), [])
+        self.assertEqual(profile.exceeds(max_seconds=None, max_rss_mb=None), [])
+        self.assertEqual(len(profile.exceeds(max_seconds=1.5, max_rss_mb=100)), 2)
+        self.assertEqual(
+            _profile(forbidden_modules=['torch']).exceeds(max_seconds=None, max_rss_mb=None),
+            ['imported torch'],
+        )
+
+    def test_command_failing_over_the_budget(self) -> None:
+        with mock.patch(
+            'core.management.commands.profile_startup.profile_entry_point', return_value=_profile()
+        ):
+            call_command(
+                'profile_startup', '--entry-points', 'wsgi', '--max-seconds', '5', stdout=StringIO()
+            )
+            with self.assertRaisesRegex(CommandError, 'wsgi took 2.00s'):
+                call_command(
+                    'profile_startup',
+                    '--entry-points',
+                    'wsgi',
+                    '--max-seconds',
+                    '1',
+                    stdout=StringIO(),
+                )
@@ -1,12 +1,16 @@
 import logging
 import pathlib
-from typing import Any, List, Optional
+from typing import TYPE_CHECKING, Any, List, Optional
 
-from FlagEmbedding import BGEM3FlagModel
-from huggingface_hub import snapshot_download
+if TYPE_CHECKING:
+    from FlagEmbedding import BGEM3FlagModel
 
 logger = logging.getLogger(__name__)
 
+# FlagEmbedding pulls in transformers and torch, which take seconds and hundreds of megabytes
+# to import. This module is imported by the web processes too, so the model stack is only
+# imported when a model is actually downloaded or loaded, which is within the embed workers.
+
 
 def download_vectorization_resources(model_name: str, model_directory: pathlib.Path) -> None:
     model = model_name.split('/')[-1]
@@ -40,7 +44,7 @@ class Vectorizer:
         self.inference_configuration = inference_configuration
         self.model_directory = model_directory
 
-        self.model_interface: Optional[BGEM3FlagModel] = None
+        self.model_interface: Optional['BGEM3FlagModel'] = None
 
     @property
     def _model_path(self) -> pathlib.Path:
@@ -51,6 +55,9 @@ class Vectorizer:
             model_name = self.model_name
 
         if not _model_exists(self.model_directory, model_name):
+            # pylint: disable=import-outside-toplevel
+            from huggingface_hub import snapshot_download
+
             logger.info(f'Downloading model (this takes a long time): {model_name}')
 
             # TODO: add better process/status information-
@@ -64,10 +71,26 @@ class Vectorizer:
             )
 
     def load_model_interface(self, **kwargs: Any) -> None:
+        # pylint: disable=import-outside-toplevel
+        from FlagEmbedding import BGEM3FlagModel
+
         self.model_interface = BGEM3FlagModel(
             str(self._model_path), **self.system_configuration, **kwargs
         )
 
+    def freeze(self) -> None:
+        """
+        Turns off gradients of the weights, so that using the model never writes into them.
+        Forked processes then keep sharing the pages the weights are in with their parent.
+        """
+        if self.model_interface is None:
+            self.load_model_interface()
+
+        model = self.model_interface.model  # type: ignore
+        model.eval()
+        for parameter in model.parameters():
+            parameter.requires_grad_(False)
+
     # Adding additional kwargs here to support overloading the parameters by hand.
     def vectorize(self, texts: List[str], **kwargs: Any) -> dict:
         if self.model_interface is None:
@@ -76,7 +99,12 @@ class Vectorizer:
         if self.model_interface is None:
             raise RuntimeError
 
-        result = self.model_interface.encode(texts, **self.inference_configuration, **kwargs)
+        # pylint: disable=import-outside-toplevel
+        import torch
+
+        # Skips autograd along with the bookkeeping it keeps on the tensors, nothing is trained.
+        with torch.inference_mode():
+            result = self.model_interface.encode(texts, **self.inference_configuration, **kwargs)
 
         # TODO: consider removing dtype and shape if never used
         return {
@@ -1,12 +1,16 @@
-from typing import Optional
+from typing import Any, Optional
 
 import celery
-import tiktoken
+import gevent
+from celery.exceptions import SoftTimeLimitExceeded
 from django.conf import settings
+from gevent import monkey
 from tiktoken import Encoding
 
+from api.utilities.encoder import get_encoder
 from api.utilities.vectorizer import Vectorizer
 from core.models import CoreVariable
+from core.threads import thread_limit
 
 # Ye who hark this path from the wilderness, beware the dangers within
 # Celery tasks are initiated as a singleton during worker boot-up
@@ -16,8 +20,30 @@ from core.models import CoreVariable
 # the Celery master process simply refuses to die. Also gives the
 # developer a headache.
 
+# Every task of a process shares the same vectorizer, so the model is loaded once per process
+# however many tasks use it, and can be loaded before the first task arrives (see warmup.py).
+_VECTORIZER: Optional[Vectorizer] = None
+
+
+def get_vectorizer() -> Vectorizer:
+    global _VECTORIZER  # pylint: disable=global-statement
+    if _VECTORIZER is None:
+        vectorizer = Vectorizer(
+            model_name=settings.VECTORIZATION_MODEL_NAME,
+            system_configuration=settings.BGEM3_SYSTEM_CONFIGURATION,
+            inference_configuration=settings.BGEM3_INFERENCE_CONFIGURATION,
+            model_directory=settings.DATA_DIR,
+        )
+        vectorizer.load_model_interface()
+        _VECTORIZER = vectorizer
+    return _VECTORIZER
+
 
 class ResourceTask(celery.Task):
+    # Torch threads the task runs on instead of those of the process, set with
+    # @app.task(torch_threads=...) for the tasks that encode a lot at a time.
+    torch_threads: Optional[int] = None
+
     def __init__(self) -> None:
         # The cache is initialized here. It can be access though all child
         # tasks whose base is ResourceTask.
@@ -25,19 +51,16 @@ class ResourceTask(celery.Task):
         self._vectorizer: Optional[Vectorizer] = None
         self._encoder: Optional[Encoding] = None
 
+    def __call__(self, *args: Any, **kwargs: Any) -> Any:
+        with thread_limit(self.torch_threads):
+            return super().__call__(*args, **kwargs)
+
     @property
     def vectorizer(self) -> Vectorizer:
         if self._vectorizer:
             return self._vectorizer
 
-        # If not in cache, initialize it.
-        self._vectorizer = Vectorizer(
-            model_name=settings.VECTORIZATION_MODEL_NAME,
-            system_configuration=settings.BGEM3_SYSTEM_CONFIGURATION,
-            inference_configuration=settings.BGEM3_INFERENCE_CONFIGURATION,
-            model_directory=settings.DATA_DIR,
-        )
-        self._vectorizer.load_model_interface()
+        self._vectorizer = get_vectorizer()
         return self._vectorizer
 
     @property
@@ -50,6 +73,30 @@ class ResourceTask(celery.Task):
 
     @staticmethod
     def generate_encoder() -> Encoding:
+        # Encoders for the models in settings.ENCODER_MODEL_NAMES are already
+        # built during worker_process_init, this only reads them from memory.
         model = CoreVariable.get_core_setting('OPENAI_API_CHAT_MODEL')
-        encoder = tiktoken.encoding_for_model(model)
+        encoder = get_encoder(model)
         return encoder
+
+
+def runs_on_gevent() -> bool:
+    # The gevent pool of the worker patches the standard library before any task is run.
+    return monkey.is_module_patched('socket')
+
+
+class IOTask(celery.Task):  # pylint: disable=abstract-method
+    """
+    Base of the tasks of the io queue. The gevent pool only enforces hard time limits, which
+    stop a task without running any of its handlers. The soft limit is raised within the task
+    instead, so that SoftTimeLimitExceeded reaches the handlers that mark the task failed.
+    """
+
+    def __call__(self, *args: Any, **kwargs: Any) -> Any:
+        _, soft_time_limit = self.request.timelimit or (None, None)
+        soft_time_limit = soft_time_limit or self.soft_time_limit
+        if not soft_time_limit or not runs_on_gevent():
+            return super().__call__(*args, **kwargs)
+
+        with gevent.Timeout(soft_time_limit, SoftTimeLimitExceeded):
+            return super().__call__(*args, **kwargs)
@@ -0,0 +1,166 @@
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import pathlib
+from base64 import b64encode
+from collections import Counter
+from concurrent.futures import Executor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from django.conf import settings
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+logger = logging.getLogger(__name__)
+
+# Charts are drawn on Figure objects of their own instead of through pyplot, which keeps
+# every figure in a global registry until it's closed. They're rendered in a small pool of
+# processes and the charts of closed months are kept on disk, as those never change.
+YEAR_CHART = 'year'
+DATASET_CHART = 'dataset'
+
+_EXECUTOR: Optional[Executor] = None
+
+
+def _to_base_64(figure: Figure) -> str:
+    image_bytes_buffer = BytesIO()
+    FigureCanvasAgg(figure)
+    figure.savefig(image_bytes_buffer, format='png')
+    figure.clear()
+    return b64encode(image_bytes_buffer.getvalue()).decode()
+
+
+def render_year_chart(x_y_pairs: List[Tuple[int, int]]) -> str:
+    x_list, y_list = zip(*x_y_pairs) if x_y_pairs else ([], [])
+
+    figure = Figure()
+    axis = figure.subplots()
+
+    bar_graph = axis.bar(x_list, y_list)
+    axis.bar_label(bar_graph)
+
+    axis.set_xlabel('Aasta')
+    axis.set_ylabel('Arv')
+
+    return _to_base_64(figure)
+
+
+def render_dataset_chart(x_y_pairs: List[Tuple[str, int]]) -> str:
+    x_list, y_list = zip(*x_y_pairs) if x_y_pairs else ([], [])
+    x_list = [x_value if len(x_list) < 50 else f'{x_value[:47]}...' for x_value in x_list]
+
+    figure = Figure()
+    axis = figure.subplots()
+
+    bar_graph = axis.barh(x_list, y_list)
+    axis.invert_yaxis()
+    axis.bar_label(bar_graph)
+    axis.set_yticks([])
+    for index, x_value in enumerate(x_list):
+        axis.text(0, index, x_value, va='center')
+
+    axis.set_ylabel('Andmestik')
+    axis.set_xlabel('Arv')
+
+    return _to_base_64(figure)
+
+
+RENDERERS: Dict[str, Callable[[Any], str]] = {
+    YEAR_CHART: render_year_chart,
+    DATASET_CHART: render_dataset_chart,
+}
+
+
+def _to_pairs(chart_type: str, counter: Counter) -> List[Tuple[Any, int]]:
+    x_y_pairs = counter.most_common()
+    if chart_type == YEAR_CHART:
+        x_y_pairs = [(value, count) for value, count in x_y_pairs if isinstance(value, int)]
+        x_y_pairs = sorted(x_y_pairs, key=lambda pair: pair[0])
+    return x_y_pairs
+
+
+def _get_executor() -> Optional[Executor]:
+    global _EXECUTOR  # pylint: disable=global-statement
+    # Daemonic processes, like the ones of Celery's prefork pool, can't have children.
+    if settings.CHART_WORKERS < 2 or multiprocessing.current_process().daemon:
+        return None
+
+    if _EXECUTOR is None:
+        # Forked, as spawning would start sys.executable, which is uwsgi within the web server.
+        _EXECUTOR = ProcessPoolExecutor(
+            max_workers=settings.CHART_WORKERS, mp_context=multiprocessing.get_context('fork')
+        )
+    return _EXECUTOR
+
+
+def _reset_executor() -> None:
+    global _EXECUTOR  # pylint: disable=global-statement
+    if _EXECUTOR is not None:
+        _EXECUTOR.shutdown(wait=False, cancel_futures=True)
+    _EXECUTOR = None
+
+
+def _get_cache_path(chart_type: str, x_y_pairs: List[Tuple[Any, int]]) -> pathlib.Path:
+    content = json.dumps([chart_type, x_y_pairs], ensure_ascii=False)
+    key = hashlib.sha1(content.encode('utf8')).hexdigest()
+    return pathlib.Path(settings.CHART_CACHE_DIR) / f'{chart_type}-{key}.png.b64'
+
+
+def _render_in_process(charts: Dict[str, Tuple[str, List[Tuple[Any, int]]]]) -> Dict[str, str]:
+    return {
+        name: RENDERERS[chart_type](x_y_pairs) for name, (chart_type, x_y_pairs) in charts.items()
+    }
+
+
+def _render(charts: Dict[str, Tuple[str, List[Tuple[Any, int]]]]) -> Dict[str, str]:
+    executor = _get_executor()
+    if executor is None or len(charts) < 2:
+        return _render_in_process(charts)
+
+    try:
+        futures = {
+            name: executor.submit(RENDERERS[chart_type], x_y_pairs)
+            for name, (chart_type, x_y_pairs) in charts.items()
+        }
+        return {name: future.result() for name, future in futures.items()}
+    except BrokenProcessPool:
+        logger.warning('Chart rendering pool broke down, rendering the charts in process.')
+        _reset_executor()
+        return _render_in_process(charts)
+
+
+def render_charts(charts: Dict[str, Tuple[str, Counter]], memoize: bool) -> Dict[str, str]:
+    """
+    Renders the counters into base64 encoded PNG bar charts, keyed by the names they're given.
+    With memoize the charts are kept on disk and rendered only the first time.
+    """
+    pairs = {
+        name: (chart_type, _to_pairs(chart_type, counter))
+        for name, (chart_type, counter) in charts.items()
+    }
+    if not memoize:
+        return _render(pairs)
+
+    rendered = {}
+    paths = {name: _get_cache_path(*chart) for name, chart in pairs.items()}
+    for name, path in paths.items():
+        try:
+            rendered[name] = path.read_text(encoding='ascii')
+        except FileNotFoundError:
+            pass
+
+    missing = {name: chart for name, chart in pairs.items() if name not in rendered}
+    if missing:
+        rendered.update(_render(missing))
+        pathlib.Path(settings.CHART_CACHE_DIR).mkdir(parents=True, exist_ok=True)
+        for name in missing:
+            # Written and renamed so that a reader never sees a half written file.
+            temporary_path = paths[name].with_suffix(f'.{os.getpid()}.tmp')
+            temporary_path.write_text(rendered[name], encoding='ascii')
+            temporary_path.replace(paths[name])
+
+    return rendered
@@ -0,0 +1,154 @@
+import heapq
+from datetime import datetime, timedelta
+from functools import reduce
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from django.db.models import Q, QuerySet
+
+from core.choices import TaskStatus
+from core.models import Dataset
+from document_search.models import DocumentSearchQueryResult
+from text_search.models import TextSearchQueryResult
+from user_profile.models import LogInEvent, LogOutEvent
+
+# Usage events are read in chunks from every table at once and merged by their time, so an
+# export holds a chunk of each table in memory instead of the whole history. Chunks are paged
+# by the time and pk of the last row, as MySQL reads the whole result of an iterator into
+# memory before handing out the first row, and every page is a short query. Search queries
+# are only complete once their task has finished, so they're exported by the time it last
+# changed, all the other events by the time they were created.
+DEFAULT_CHUNK_SIZE = 2000
+FINISHED_TASK_STATUSES = (TaskStatus.SUCCESS, TaskStatus.FAILURE)
+# Exports end this long before they start, so that rows whose transaction was still open
+# then, with a timestamp from before its commit, aren't skipped by the next export's cursor.
+SETTLE_TIME = timedelta(minutes=1)
+
+
+def _parse_references(result: Any) -> List[Dict[str, Any]]:
+    return [
+        {'id': reference.document_id, 'index': reference.index, 'parent': reference.parent}
+        for reference in result.reference_rows.all()
+    ]
+
+
+def _parse_result(result: Any, event: str, all_dataset_names: List[str]) -> Dict[str, Any]:
+    conversation = result.conversation
+    if event == 'text-search':
+        # Read from the string here, the dataset_names property queries every dataset each time.
+        datasets = (
+            conversation.dataset_names_string.split(',')
+            if conversation.dataset_names_string
+            else all_dataset_names
+        )
+    else:
+        datasets = result.dataset_name
+
+    return {
+        'user': conversation.auth_user.username,
+        'user_input': result.user_input,
+        'gpt_response': result.response,
+        'created_at': str(result.created_at),
+        'input_tokens': result.input_tokens,
+        'output_tokens': result.output_tokens,
+        'datasets': datasets,
+        'total_cost': result.total_cost,
+        'is_context_pruned': result.is_context_pruned,
+        'min_year': conversation.min_year,
+        'max_year': conversation.max_year,
+        'model': result.model,
+        'references': _parse_references(result),
+        'event': event,
+    }
+
+
+def _parse_login_logout_event(login_logout_event: Any, event: str) -> Dict[str, Any]:
+    return {
+        'created_at': str(login_logout_event.created_at),
+        'event': event,
+        'user': login_logout_event.auth_user.username,
+    }
+
+
+def _get_time_filters(
+    field: str, since: Optional[datetime], until: datetime
+) -> Dict[str, datetime]:
+    filters = {f'{field}__lte': until}
+    if since is not None:
+        filters[f'{field}__gt'] = since
+    return filters
+
+
+def _iterate(
+    queryset: QuerySet, event: str, chunk_size: int, time_field: str
+) -> Iterator[Tuple[datetime, int, str, Any]]:
+    queryset = queryset.order_by(time_field, 'pk')
+    page = queryset
+    while True:
+        rows = [
+            (reduce(getattr, time_field.split('__'), instance), instance.pk, event, instance)
+            for instance in page[:chunk_size]
+        ]
+        yield from rows
+
+        if len(rows) < chunk_size:
+            return
+        # Rows of the same time are told apart by their pk.
+        last_time, last_pk, _, _ = rows[-1]
+        page = queryset.filter(
+            Q(**{f'{time_field}__gt': last_time}) | Q(**{time_field: last_time, 'pk__gt': last_pk})
+        )
+
+
+def _iterate_results(
+    queryset: QuerySet, event: str, since: Optional[datetime], until: datetime, chunk_size: int
+) -> Iterator[Tuple[datetime, int, str, Any]]:
+    queryset = (
+        queryset.select_related('conversation__auth_user', 'celery_task')
+        .prefetch_related('reference_rows')
+        .filter(
+            celery_task__status__in=FINISHED_TASK_STATUSES,
+            **_get_time_filters('celery_task__modified_at', since, until),
+        )
+    )
+    return _iterate(queryset, event, chunk_size, 'celery_task__modified_at')
+
+
+def _iterate_login_logout_events(
+    queryset: QuerySet, event: str, since: Optional[datetime], until: datetime, chunk_size: int
+) -> Iterator[Tuple[datetime, int, str, Any]]:
+    queryset = queryset.select_related('auth_user').filter(
+        **_get_time_filters('created_at', since, until)
+    )
+    return _iterate(queryset, event, chunk_size, 'created_at')
+
+
+def iterate_events(
+    since: Optional[datetime], until: datetime, chunk_size: int = DEFAULT_CHUNK_SIZE
+) -> Iterator[Dict[str, Any]]:
+    """
+    Yields the log-in and log-out events created and the text and document searches finished
+    after since (all of them without it) up to and including until, oldest first. Searches
+    still waiting on their task are left to the export that runs after they've finished.
+    """
+    all_dataset_names = list(Dataset.objects.values_list('name', flat=True))
+    results = {
+        'text-search': TextSearchQueryResult.objects.all(),
+        'document-search': DocumentSearchQueryResult.objects.all(),
+    }
+    login_logout_events = {
+        'log-in': LogInEvent.objects.all(),
+        'log-out': LogOutEvent.objects.all(),
+    }
+
+    streams = [
+        _iterate_results(queryset, event, since, until, chunk_size)
+        for event, queryset in results.items()
+    ] + [
+        _iterate_login_logout_events(queryset, event, since, until, chunk_size)
+        for event, queryset in login_logout_events.items()
+    ]
+    for _, _, event, instance in heapq.merge(*streams, key=lambda item: item[:2]):
+        if event in results:
+            yield _parse_result(instance, event, all_dataset_names)
+        else:
+            yield _parse_login_logout_event(instance, event)
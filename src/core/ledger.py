@@ -0,0 +1,227 @@
+import logging
+import time
+from datetime import date
+from functools import partial
+from typing import Any, Dict, List, Optional, Union
+from uuid import UUID
+
+import redis
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from api.utilities.elastic import K_DEFAULT
+from core.models import CoreVariable, UsageLedger
+
+logger = logging.getLogger(__name__)
+
+# What a user has spent is kept in UsageLedger, one row per month, and its sum is cached
+# in Redis. Chats reserve their estimated cost before they're started, so that concurrent
+# requests can't all pass the limit check before any of them has been paid for.
+#
+# The cached sum is stored under the version of the balance, which is bumped whenever a spend
+# is committed. A sum read before the commit can only ever be cached under the old version,
+# which no one reads anymore, so it can't stand in for the new balance.
+BALANCE_KEY_PREFIX = 'rk:spend:used:'
+BALANCE_VERSION_KEY_PREFIX = 'rk:spend:version:'
+RESERVATIONS_KEY_PREFIX = 'rk:spend:reserved:'
+
+# Checks the limit and adds the reservation in one step, so that no other reservation
+# of the user can come in between. Every reservation is stored with the time it expires at,
+# those that were never released are dropped here before the rest are summed. The hash itself
+# expires with its last reservation.
+RESERVE_SCRIPT = '''
+local now = tonumber(ARGV[6])
+local reserved = 0
+local entries = redis.call('HGETALL', KEYS[1])
+for index = 1, #entries, 2 do
+    local cost, expires_at = string.match(entries[index + 1], '^([^:]+):(.+)$')
+    if cost == nil or tonumber(expires_at) <= now then
+        redis.call('HDEL', KEYS[1], entries[index])
+    else
+        reserved = reserved + tonumber(cost)
+    end
+end
+if tonumber(ARGV[1]) + reserved + tonumber(ARGV[3]) > tonumber(ARGV[2]) then
+    return 0
+end
+redis.call('HSET', KEYS[1], ARGV[4], ARGV[3] .. ':' .. (now + tonumber(ARGV[5])))
+if redis.call('TTL', KEYS[1]) < tonumber(ARGV[5]) then
+    redis.call('EXPIRE', KEYS[1], ARGV[5])
+end
+return 1
+'''
+
+# Tokens the chat format adds around the content of every message.
+MESSAGE_OVERHEAD_TOKENS = 4
+
+# When Redis is down, it's skipped for a while and the limits are checked from the database.
+REDIS_RETRY_INTERVAL = 30
+
+_REDIS_CLIENT: Optional[redis.Redis] = None
+_REDIS_RETRY_AT = 0.0
+
+
+def _get_redis_client() -> redis.Redis:
+    global _REDIS_CLIENT  # pylint: disable=global-statement
+    if _REDIS_CLIENT is None:
+        _REDIS_CLIENT = redis.Redis.from_url(settings.SPEND_LEDGER_URL, socket_connect_timeout=1)
+    return _REDIS_CLIENT
+
+
+def _is_redis_available() -> bool:
+    return time.monotonic() >= _REDIS_RETRY_AT
+
+
+def _set_redis_unavailable(exception: Exception) -> None:
+    global _REDIS_RETRY_AT  # pylint: disable=global-statement
+    _REDIS_RETRY_AT = time.monotonic() + REDIS_RETRY_INTERVAL
+    logger.warning(f'Spending cache is unavailable for a while: {exception}')
+
+
+def _get_month() -> date:
+    return timezone.localdate().replace(day=1)
+
+
+def _bump_balance_version(auth_user_id: int) -> None:
+    if not _is_redis_available():
+        return
+
+    try:
+        _get_redis_client().incr(f'{BALANCE_VERSION_KEY_PREFIX}{auth_user_id}')
+    except redis.RedisError as exception:
+        _set_redis_unavailable(exception)
+
+
+def record_spend(auth_user_id: int, cost: Optional[float]) -> None:
+    """
+    Adds the cost onto the ledger of the current month. Meant to be called within the
+    transaction that stores the result, the cached balance is outdated once it's committed.
+    """
+    if not cost:
+        return
+
+    month = _get_month()
+    UsageLedger.objects.get_or_create(auth_user_id=auth_user_id, month=month)
+    UsageLedger.objects.filter(auth_user_id=auth_user_id, month=month).update(
+        cost=F('cost') + cost, modified_at=timezone.now()
+    )
+    # Runs before the reservation of the result is released, which is registered later.
+    transaction.on_commit(partial(_bump_balance_version, auth_user_id))
+
+
+def _sum_ledger(auth_user_id: int) -> float:
+    ledger = UsageLedger.objects.filter(auth_user_id=auth_user_id)
+    return ledger.aggregate(Sum('cost', default=0.0))['cost__sum']
+
+
+def get_used_cost(auth_user_id: int) -> float:
+    if not _is_redis_available():
+        return _sum_ledger(auth_user_id)
+
+    try:
+        version = _get_redis_client().get(f'{BALANCE_VERSION_KEY_PREFIX}{auth_user_id}')
+        key = f'{BALANCE_KEY_PREFIX}{auth_user_id}:{int(version or 0)}'
+        cached = _get_redis_client().get(key)
+        if cached is not None:
+            return float(cached)
+
+        used_cost = _sum_ledger(auth_user_id)
+        _get_redis_client().set(key, used_cost, ex=settings.SPEND_BALANCE_CACHE_TTL)
+        return used_cost
+    except redis.RedisError as exception:
+        _set_redis_unavailable(exception)
+        return _sum_ledger(auth_user_id)
+
+
+def _count_tokens_at_most(text: str) -> int:
+    # Every token is at least a byte long, so the length in bytes bounds the token count
+    # without the web processes having to load the encodings.
+    return len(text.encode())
+
+
+def _estimate_cost(messages: List[Dict[str, str]], user_inputs: List[str], is_batch: bool) -> float:
+    prefix = 'EURO_COST_PER_BATCH' if is_batch else 'EURO_COST_PER'
+    core_settings = CoreVariable.get_core_settings(
+        'OPENAI_OPENING_QUESTION',
+        'OPENAI_CONTEXT_MAX_TOKEN_LIMIT',
+        f'{prefix}_INPUT_TOKEN',
+        f'{prefix}_OUTPUT_TOKEN',
+    )
+    # Sent along with every question.
+    input_tokens = sum(
+        _count_tokens_at_most(message['content'] or '') + MESSAGE_OVERHEAD_TOKENS
+        for message in messages
+    )
+    # The token limit applies to each document of the context on its own.
+    input_tokens += K_DEFAULT * core_settings['OPENAI_CONTEXT_MAX_TOKEN_LIMIT']
+    input_tokens += _count_tokens_at_most(core_settings['OPENAI_OPENING_QUESTION'])
+
+    input_tokens *= len(user_inputs)
+    input_tokens += sum(
+        _count_tokens_at_most(user_input) + MESSAGE_OVERHEAD_TOKENS for user_input in user_inputs
+    )
+    output_tokens = settings.SPEND_ESTIMATED_OUTPUT_TOKENS * len(user_inputs)
+    return (
+        input_tokens * core_settings[f'{prefix}_INPUT_TOKEN']
+        + output_tokens * core_settings[f'{prefix}_OUTPUT_TOKEN']
+    )
+
+
+def estimate_chat_cost(messages: List[Dict[str, str]], user_input: str) -> float:
+    """
+    Estimates the most a chat may cost: the conversation so far, which is sent along with
+    every question, the prompt with a full context from every document the vector search
+    returns, the question and a long answer.
+
+    :param messages: Messages of the conversation so far, see ConversationMixin.messages.
+    """
+    return _estimate_cost(messages, [user_input], is_batch=False)
+
+
+def estimate_batch_cost(questions: List[str]) -> float:
+    """Estimates the most a batch may cost, every question starts a conversation of its own."""
+    system_input = CoreVariable.get_core_setting('OPENAI_SYSTEM_MESSAGE')
+    messages = [{'role': 'system', 'content': system_input}]
+    return _estimate_cost(messages, questions, is_batch=True)
+
+
+def reserve_budget(
+    auth_user: Any, reservation_id: Union[int, str, UUID], cost: float, ttl: Optional[int] = None
+) -> bool:
+    """
+    Reserves the cost from the budget of the user until release_budget is called
+    with the same reservation id. Returns False when the reservation would exceed the limit.
+    Without Redis only the spent sum is checked.
+
+    :param ttl: Seconds after which the reservation is forgotten if it's never released,
+    RK_SPEND_RESERVATION_TTL by default.
+    """
+    if auth_user.is_superuser:
+        return True
+
+    used_cost = get_used_cost(auth_user.pk)
+    usage_limit = auth_user.user_profile.usage_limit
+    if not _is_redis_available():
+        return used_cost + cost <= usage_limit
+
+    try:
+        reserve = _get_redis_client().register_script(RESERVE_SCRIPT)
+        keys = [f'{RESERVATIONS_KEY_PREFIX}{auth_user.pk}']
+        ttl = ttl or settings.SPEND_RESERVATION_TTL
+        args = [used_cost, usage_limit, cost, str(reservation_id), ttl, int(time.time())]
+        return bool(reserve(keys=keys, args=args))
+    except redis.RedisError as exception:
+        _set_redis_unavailable(exception)
+        return used_cost + cost <= usage_limit
+
+
+def release_budget(auth_user_id: int, reservation_id: Union[int, str, UUID]) -> None:
+    if not _is_redis_available():
+        return
+
+    try:
+        _get_redis_client().hdel(f'{RESERVATIONS_KEY_PREFIX}{auth_user_id}', str(reservation_id))
+    except redis.RedisError as exception:
+        _set_redis_unavailable(exception)
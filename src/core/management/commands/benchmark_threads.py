@@ -0,0 +1,87 @@
+import multiprocessing
+import statistics
+import time
+from typing import Any, List, Tuple
+
+from django.core.management.base import BaseCommand, CommandParser
+
+from core.base_task import get_vectorizer
+from core.threads import get_cpu_count, get_thread_count, set_torch_threads
+from core.warmup import load_shared_model
+
+BENCHMARK_TEXT = 'Kas Kommionu paneb moosi kommi sisse ja kuidas see sinna jõuab? '
+
+
+def _encode(texts: List[str], rounds: int, thread_count: int) -> Tuple[float, float, List[float]]:
+    """Runs in a forked process like the ones of the embed worker."""
+    set_torch_threads(thread_count)
+    vectorizer = get_vectorizer()
+    vectorizer.vectorize(texts[:1])
+
+    latencies = []
+    started_at = time.time()
+    for _ in range(rounds):
+        encode_started_at = time.perf_counter()
+        vectorizer.vectorize(texts)
+        latencies.append(time.perf_counter() - encode_started_at)
+    return started_at, time.time(), latencies
+
+
+def _percentile(values: List[float], percentile: float) -> float:
+    values = sorted(values)
+    return values[round(percentile * (len(values) - 1))]
+
+
+class Command(BaseCommand):
+    help = (
+        'Measures the embedding throughput of concurrently encoding processes at different '
+        'torch thread counts, to check the thread counts the embed worker picks.'
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument(
+            '--concurrency',
+            nargs='+',
+            type=int,
+            default=[1, 2, 4],
+            help='Numbers of processes encoding at once.',
+        )
+        parser.add_argument(
+            '--threads',
+            nargs='+',
+            type=int,
+            default=[0],
+            help='Torch threads of every process, 0 for the count the embed worker would pick.',
+        )
+        parser.add_argument('--texts', type=int, default=12, help='Texts encoded at a time.')
+        parser.add_argument('--words', type=int, default=100, help='Words in every text.')
+        parser.add_argument('--rounds', type=int, default=5, help='Encodes per process.')
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        words = BENCHMARK_TEXT.split()
+        text = ' '.join(words[index % len(words)] for index in range(options['words']))
+        texts = [text] * options['texts']
+
+        # Loaded once and shared by the forked processes, as in RK_WORKER_SHARED_MODEL.
+        load_shared_model()
+        context = multiprocessing.get_context('fork')
+
+        self.stdout.write(f'{get_cpu_count()} cores available')
+        self.stdout.write(
+            f'{"processes":>9} {"threads":>7} {"texts/s":>9} {"p50 (s)":>8} {"p95 (s)":>8}'
+        )
+        for concurrency in options['concurrency']:
+            for threads in options['threads']:
+                thread_count = threads or get_thread_count(concurrency)
+                with context.Pool(concurrency) as pool:
+                    runs = pool.starmap(
+                        _encode, [(texts, options['rounds'], thread_count)] * concurrency
+                    )
+
+                elapsed = max(run[1] for run in runs) - min(run[0] for run in runs)
+                encoded = len(texts) * options['rounds'] * concurrency
+                latencies = [latency for run in runs for latency in run[2]]
+                self.stdout.write(
+                    f'{concurrency:>9} {thread_count:>7} {encoded / elapsed:>9.1f} '
+                    f'{statistics.median(latencies):>8.3f} {_percentile(latencies, 0.95):>8.3f}'
+                )
@@ -0,0 +1,24 @@
+from typing import Any
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandParser
+
+from api.utilities.encoder import download_encoder_resources
+
+
+class Command(BaseCommand):
+    help = 'Fetches the tiktoken encodings of the configured chat models into the cache directory.'
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument(
+            '--models',
+            nargs='+',
+            default=settings.ENCODER_MODEL_NAMES,
+            help='Names of the OpenAI models whose encodings to fetch.',
+        )
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        download_encoder_resources(options['models'], settings.ENCODER_CACHE_DIR)
+        self.stdout.write(
+            self.style.SUCCESS(f'Encodings stored under {settings.ENCODER_CACHE_DIR}')
+        )
@@ -0,0 +1,23 @@
+from typing import Any
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandParser
+
+from api.utilities.vectorizer import download_vectorization_resources
+
+
+class Command(BaseCommand):
+    help = 'Fetches the vectorization model the embed workers load into the data directory.'
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument(
+            '--model',
+            default=settings.VECTORIZATION_MODEL_NAME,
+            help='Name of the Hugging Face model to fetch.',
+        )
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        download_vectorization_resources(options['model'], settings.DATA_DIR)
+        self.stdout.write(
+            self.style.SUCCESS(f'Model {options["model"]} stored under {settings.DATA_DIR}')
+        )
@@ -0,0 +1,80 @@
+import gzip
+import json
+from datetime import datetime, timezone
+from typing import IO, Any, Optional
+
+from django.core.management.base import BaseCommand, CommandError, CommandParser
+from django.utils import timezone as django_timezone
+from django.utils.dateparse import parse_datetime
+
+from core.exports import DEFAULT_CHUNK_SIZE, SETTLE_TIME, iterate_events
+
+
+def _parse_since(value: str) -> datetime:
+    since = parse_datetime(value)
+    if since is None:
+        raise CommandError(f'--since expects an ISO 8601 timestamp, got "{value}".')
+    if django_timezone.is_naive(since):
+        since = since.replace(tzinfo=timezone.utc)
+    return since
+
+
+class Command(BaseCommand):
+    help = (
+        'Streams the usage events (log-ins, log-outs and finished search queries) into a JSON '
+        'lines file, oldest first. Pass the printed cursor as --since next time to export only '
+        'newer events.'
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument(
+            '--output',
+            default=None,
+            help='Path of the file to write, - for stdout (Default: <date>-dump.jsonl[.gz]).',
+        )
+        parser.add_argument(
+            '--since',
+            default=None,
+            help='Export only the events after this cursor, an ISO 8601 timestamp (UTC if naive).',
+        )
+        parser.add_argument('--gzip', action='store_true', help='Compress the output with gzip.')
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=DEFAULT_CHUNK_SIZE,
+            help='How many rows of each table are read from the database at a time.',
+        )
+
+    @staticmethod
+    def _write(output: IO[str], since: Optional[datetime], until: datetime, chunk_size: int) -> int:
+        count = 0
+        for event in iterate_events(since, until, chunk_size=chunk_size):
+            data = json.dumps(event, ensure_ascii=False)
+            output.write(f'{data}\n')
+            count += 1
+        return count
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        since = _parse_since(options['since']) if options['since'] else None
+        # Events created or finished while exporting are left to the next export.
+        until = django_timezone.now() - SETTLE_TIME
+        arguments = {'since': since, 'until': until, 'chunk_size': options['chunk_size']}
+
+        path = options['output']
+        if path is None:
+            extension = 'jsonl.gz' if options['gzip'] else 'jsonl'
+            path = f'{until.strftime("%Y-%m-%d")}-dump.{extension}'
+        use_gzip = options['gzip'] or path.endswith('.gz')
+
+        if path == '-':
+            count = self._write(self.stdout, **arguments)
+        elif use_gzip:
+            with gzip.open(path, 'wt', encoding='utf-8') as output:
+                count = self._write(output, **arguments)
+        else:
+            with open(path, 'w', encoding='utf-8') as output:
+                count = self._write(output, **arguments)
+
+        self.stderr.write(
+            f'Exported {count} events into {path}, continue with --since {until.isoformat()}'
+        )
@@ -0,0 +1,73 @@
+from typing import Any, List
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError, CommandParser
+
+from api.utilities.startup_profile import (
+    ENTRY_POINTS,
+    StartupProfile,
+    profile_entry_point,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Measures how long the web, Celery and manage.py processes take to start, how much '
+        'memory they take and which imports dominate. Fails when a process is over its budget '
+        'or imports the vectorization model stack.'
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument(
+            '--entry-points', nargs='+', choices=list(ENTRY_POINTS), default=list(ENTRY_POINTS)
+        )
+        parser.add_argument(
+            '--repeat', type=int, default=3, help='Starts per entry point, the median is used.'
+        )
+        parser.add_argument(
+            '--top', type=int, default=15, help='How many of the slowest imports to list.'
+        )
+        parser.add_argument(
+            '--max-seconds',
+            type=float,
+            default=settings.STARTUP_TIME_BUDGET,
+            help='Budget for the wall time of a start, 0 to not check it.',
+        )
+        parser.add_argument(
+            '--max-rss',
+            type=float,
+            default=settings.STARTUP_RSS_BUDGET,
+            help='Budget for the peak RSS of a start in megabytes, 0 to not check it.',
+        )
+
+    def _report(self, profile: StartupProfile, top: int) -> None:
+        wall_times = ', '.join(f'{wall_time:.2f}' for wall_time in profile.wall_times)
+        self.stdout.write(self.style.MIGRATE_HEADING(profile.entry_point))
+        self.stdout.write(f'  wall time: {profile.wall_time:.2f}s (runs: {wall_times})')
+        self.stdout.write(f'  peak RSS: {profile.max_rss / 1024:.0f}MB')
+        self.stdout.write(f'  modules imported: {len(profile.import_times)}')
+        self.stdout.write('  slowest imports (cumulative / self, ms):')
+        for name, self_time, cumulative in profile.slowest_imports(top):
+            self.stdout.write(f'    {cumulative / 1000:8.1f} {self_time / 1000:8.1f}  {name}')
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        max_seconds = options['max_seconds'] or None
+        max_rss = options['max_rss'] or None
+
+        failures: List[str] = []
+        for entry_point in options['entry_points']:
+            try:
+                profile = profile_entry_point(
+                    entry_point, settings.BASE_DIR, repeat=options['repeat']
+                )
+            except RuntimeError as exception:
+                raise CommandError(f'{entry_point} failed to start:\n{exception}') from exception
+
+            self._report(profile, options['top'])
+            failures.extend(
+                f'{entry_point} {problem}' for problem in profile.exceeds(max_seconds, max_rss)
+            )
+
+        if failures:
+            raise CommandError('\n'.join(failures))
+        self.stdout.write(self.style.SUCCESS('Every entry point started within its budget.'))
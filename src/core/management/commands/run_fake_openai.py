@@ -0,0 +1,56 @@
+from typing import Any
+
+from django.core.management.base import BaseCommand, CommandParser
+
+from api.utilities.fake_openai import (
+    DEFAULT_RESPONSE_TEXT,
+    LATENCY_DISTRIBUTIONS,
+    FakeOpenAIServer,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Runs a stand-in for the OpenAI chat completions API for load and latency testing. '
+        'Point the OPENAI_API_BASE_URL core setting at the printed address to use it.'
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument(
+            '--latency-distribution', choices=LATENCY_DISTRIBUTIONS, default='fixed'
+        )
+        parser.add_argument('--latency-mean', type=float, default=0.5, help='In seconds.')
+        parser.add_argument('--latency-stddev', type=float, default=0.0, help='In seconds.')
+        parser.add_argument('--rate-limit-error-rate', type=float, default=0.0)
+        parser.add_argument('--server-error-rate', type=float, default=0.0)
+        parser.add_argument('--timeout-rate', type=float, default=0.0)
+        parser.add_argument('--timeout-seconds', type=float, default=60.0)
+        parser.add_argument('--requests-per-minute', type=int, default=500)
+        parser.add_argument('--tokens-per-minute', type=int, default=30000)
+        parser.add_argument('--response-text', default=DEFAULT_RESPONSE_TEXT)
+        parser.add_argument('--seed', type=int, default=None)
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        server = FakeOpenAIServer(
+            host=options['host'],
+            port=options['port'],
+            latency_distribution=options['latency_distribution'],
+            latency_mean=options['latency_mean'],
+            latency_stddev=options['latency_stddev'],
+            rate_limit_error_rate=options['rate_limit_error_rate'],
+            server_error_rate=options['server_error_rate'],
+            timeout_rate=options['timeout_rate'],
+            timeout_seconds=options['timeout_seconds'],
+            requests_per_minute=options['requests_per_minute'],
+            tokens_per_minute=options['tokens_per_minute'],
+            response_text=options['response_text'],
+            seed=options['seed'],
+        )
+
+        self.stdout.write(f'Serving a stand-in OpenAI API at {server.base_url}')
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            server.httpd.server_close()
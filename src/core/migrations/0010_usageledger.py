@@ -0,0 +1,81 @@
+# Generated by Django 5.1 on 2026-10-19 02:31
+
+from datetime import date
+from typing import Any, Dict, Tuple
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Sum
+from django.db.models.functions import TruncMonth
+
+
+def fill_usage_ledger(apps: Any, schema_editor: Any) -> None:
+    """Sums up the costs of the existing results into the monthly buckets of their users."""
+    UsageLedger = apps.get_model('core', 'UsageLedger')
+    result_models = (
+        apps.get_model('text_search', 'TextSearchQueryResult'),
+        apps.get_model('document_search', 'DocumentSearchQueryResult'),
+    )
+
+    costs: Dict[Tuple[int, date], float] = {}
+    for result_model in result_models:
+        monthly_costs = (
+            result_model.objects.exclude(total_cost=None)
+            .annotate(month=TruncMonth('created_at'))
+            .values('conversation__auth_user_id', 'month')
+            .annotate(cost=Sum('total_cost'))
+        )
+        for row in monthly_costs:
+            key = (row['conversation__auth_user_id'], row['month'].date())
+            costs[key] = costs.get(key, 0.0) + row['cost']
+
+    UsageLedger.objects.bulk_create(
+        UsageLedger(auth_user_id=auth_user_id, month=month, cost=cost)
+        for (auth_user_id, month), cost in costs.items()
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('core', '0009_rename_index_query_dataset_index'),
+        ('document_search', '0007_aggregationtask_timings_documenttask_timings'),
+        ('text_search', '0007_textsearchbatch_timings_texttask_timings'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UsageLedger',
+            fields=[
+                (
+                    'id',
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name='ID',
+                    ),
+                ),
+                ('month', models.DateField()),
+                ('cost', models.FloatField(default=0.0)),
+                ('modified_at', models.DateTimeField(auto_now=True)),
+                (
+                    'auth_user',
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.PROTECT,
+                        related_name='usage_ledger',
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                'constraints': [
+                    models.UniqueConstraint(
+                        fields=('auth_user', 'month'), name='unique_usage_month'
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(fill_usage_ledger, migrations.RunPython.noop),
+    ]
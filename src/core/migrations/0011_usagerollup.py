@@ -0,0 +1,45 @@
+# Generated by Django 5.1 on 2026-10-19 02:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('core', '0010_usageledger'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UsageRollup',
+            fields=[
+                (
+                    'id',
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name='ID',
+                    ),
+                ),
+                ('month', models.DateField(unique=True)),
+                ('log_in_count', models.IntegerField(default=0)),
+                ('log_out_count', models.IntegerField(default=0)),
+                ('user_count', models.IntegerField(default=0)),
+                ('user_with_query_count', models.IntegerField(default=0)),
+                ('new_user_with_query_count', models.IntegerField(default=0)),
+                ('text_query_count', models.IntegerField(default=0)),
+                ('document_query_count', models.IntegerField(default=0)),
+                ('text_conversation_count', models.IntegerField(default=0)),
+                ('new_text_conversation_count', models.IntegerField(default=0)),
+                ('document_conversation_count', models.IntegerField(default=0)),
+                ('new_document_conversation_count', models.IntegerField(default=0)),
+                ('cost', models.FloatField(default=0.0)),
+                ('year_usage_counts', models.JSONField(default=list)),
+                ('dataset_usage_counts', models.JSONField(default=list)),
+                ('year_reference_counts', models.JSONField(default=list)),
+                ('dataset_reference_counts', models.JSONField(default=list)),
+                ('is_stale', models.BooleanField(default=False)),
+                ('built_at', models.DateTimeField()),
+            ],
+        ),
+    ]
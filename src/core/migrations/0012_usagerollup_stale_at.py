@@ -0,0 +1,31 @@
+# Generated by Django 5.1 on 2026-10-19 05:40
+
+from datetime import datetime, timezone
+from typing import Any
+
+from django.db import migrations, models
+
+
+def carry_over_stale_rollups(apps: Any, schema_editor: Any) -> None:
+    """Keeps the rollups that were marked stale from being read as fresh."""
+    UsageRollup = apps.get_model('core', 'UsageRollup')
+    UsageRollup.objects.filter(is_stale=True).update(stale_at=datetime.now(timezone.utc))
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('core', '0011_usagerollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='usagerollup',
+            name='stale_at',
+            field=models.DateTimeField(default=None, null=True),
+        ),
+        migrations.RunPython(carry_over_stale_rollups, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='usagerollup',
+            name='is_stale',
+        ),
+    ]
@@ -2,22 +2,39 @@
 # type: ignore
 
 
+import hashlib
+import json
 import logging
 import uuid
+from functools import partial
 from typing import Any, Dict, Iterable, List, Set, Tuple
 
 from django.conf import settings
 from django.contrib.auth.models import User
-from django.db import models
+from django.db import models, transaction
 from django.utils.translation import gettext as _
 from tiktoken import Encoding
 
 from api.utilities.elastic import ElasticKNN
-from api.utilities.gpt import ChatGPT
+from api.utilities.gpt import ChatGPT, LLMResponse
 from api.utilities.vectorizer import Vectorizer
 from core.choices import TASK_STATUS_CHOICES, TaskStatus
-from core.models import CoreVariable
-from core.utilities import exceeds_token_limit, prune_context
+from core.ledger import record_spend, release_budget
+from core.models import CoreVariable, Dataset, UsageRollup
+from core.notifications import publish_task_status
+from core.timings import bind_task_model, time_stage
+from core.utilities import exceeds_token_limit, parse_reference_row, prune_context
+
+# Marks a field that was never loaded from the database.
+_DEFERRED = object()
+
+
+def _fingerprint_references(references: Any) -> Any:
+    # References are mutated in place, so a digest of their JSON is kept instead of the
+    # loaded list, it's cheaper than copying every dict whenever a result is loaded.
+    if references is _DEFERRED:
+        return _DEFERRED
+    return hashlib.sha1(json.dumps(references).encode('utf8')).digest()
 
 
 class ConversationMixin(models.Model):
@@ -190,22 +207,26 @@ class ConversationMixin(models.Model):
         parent_references: Iterable[str],
         task: Any,
     ) -> dict:
+        bind_task_model(task)
         try:
-            input_vector = vectorizer.vectorize([user_input])['vectors'][0]
-
-            knn = ElasticKNN()
-
-            date_query = knn.create_date_query(min_year=self.min_year, max_year=self.max_year)
-            search_query = knn.create_doc_id_query(date_query, parent_references)
-            search_query_wrapper = {'search_query': search_query} if search_query else {}
-            matching_documents = knn.search_vector(
-                vector=input_vector, indices=dataset_index_queries, **search_query_wrapper
-            )
-
-            hits = matching_documents['hits']['hits']
-            question_and_references = self.parse_gpt_question_and_references(
-                user_input=user_input, hits=hits, encoder=encoder
-            )
+            with time_stage('embedding'):
+                input_vector = vectorizer.vectorize([user_input])['vectors'][0]
+
+            with time_stage('knn'):
+                knn = ElasticKNN()
+
+                date_query = knn.create_date_query(min_year=self.min_year, max_year=self.max_year)
+                search_query = knn.create_doc_id_query(date_query, parent_references)
+                search_query_wrapper = {'search_query': search_query} if search_query else {}
+                matching_documents = knn.search_vector(
+                    vector=input_vector, indices=dataset_index_queries, **search_query_wrapper
+                )
+
+            with time_stage('pruning'):
+                hits = matching_documents['hits']['hits']
+                question_and_references = self.parse_gpt_question_and_references(
+                    user_input=user_input, hits=hits, encoder=encoder
+                )
             return question_and_references
         except Exception as exception:
             logging.getLogger(settings.ERROR_LOGGER).exception(
@@ -238,7 +259,36 @@ class ResultMixin(models.Model):
 
     created_at = models.DateTimeField(auto_now_add=True)
 
+    # Fingerprint of the references as they were last written into the database, their rows
+    # in the reference table (see ReferenceMixin) are only rewritten when they've changed since.
+    _saved_references = _fingerprint_references(None)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.remember_saved_references()
+        return instance
+
+    def remember_saved_references(self) -> None:
+        self._saved_references = _fingerprint_references(self.__dict__.get('references', _DEFERRED))
+
+    def save(self, *args, **kwargs) -> None:
+        references = self.__dict__.get('references', _DEFERRED)
+        fingerprint = _fingerprint_references(references)
+        if references is _DEFERRED or fingerprint == self._saved_references:
+            super().save(*args, **kwargs)
+            return
+
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            self.reference_rows.all().delete()
+            self.reference_rows.model.objects.bulk_create(
+                self.reference_rows.model.from_references(self, references or [])
+            )
+        self._saved_references = fingerprint
+
     def commit_search(self, task, context_and_references: dict, user_input: str) -> dict:
+        bind_task_model(task)
         task.set_started()
 
         user_input_with_context = context_and_references['context']
@@ -249,9 +299,21 @@ class ResultMixin(models.Model):
             {'role': 'user', 'content': user_input_with_context}
         ]
 
-        chat_gpt = ChatGPT()
-        llm_response = chat_gpt.chat(messages=messages)
+        with time_stage('llm'):
+            chat_gpt = ChatGPT()
+            llm_response = chat_gpt.chat(messages=messages)
+
+        return self.build_results(
+            llm_response=llm_response,
+            user_input=user_input,
+            references=references,
+            is_context_pruned=is_context_pruned,
+        )
 
+    @staticmethod
+    def build_results(
+        llm_response: LLMResponse, user_input: str, references: List[dict], is_context_pruned: bool
+    ) -> dict:
         gpt_references = llm_response.used_references
 
         # Adds binary field 'used_by_gpt'
@@ -274,6 +336,7 @@ class ResultMixin(models.Model):
         }
 
     def save_results(self, results: dict) -> None:
+        bind_task_model(self.celery_task)
         try:
             self.model = results['model']
             self.user_input = results['user_input']
@@ -284,9 +347,13 @@ class ResultMixin(models.Model):
             self.total_cost = results['total_cost']
             self.response_headers = results['response_headers']
             self.references = results['references']
-            self.save()
 
-            self.celery_task.set_success()
+            with time_stage('db_save'):
+                with transaction.atomic():
+                    self.save()
+                    record_spend(self.conversation.auth_user_id, self.total_cost)
+                    UsageRollup.mark_stale(self.created_at)
+                self.celery_task.set_success()
 
         except Exception as exception:
             logging.getLogger(settings.ERROR_LOGGER).exception("Couldn't store database results!")
@@ -312,6 +379,36 @@ class ResultMixin(models.Model):
         abstract = True
 
 
+# References of a result, one row each, so that statistics on the sources can be
+# grouped and counted by the database instead of decoding every result's JSON.
+class ReferenceMixin(models.Model):
+    # Order of the reference within the result.
+    position = models.PositiveSmallIntegerField()
+    document_id = models.CharField(max_length=255, default='')
+    index = models.CharField(max_length=255, db_index=True)
+    parent = models.CharField(max_length=255, default='', db_index=True)
+    year = models.IntegerField(null=True, default=None, db_index=True)
+    # Resolved from the index when the reference is stored.
+    dataset = models.ForeignKey(Dataset, on_delete=models.SET_NULL, null=True, default=None)
+    # Unknown until the answer has been received.
+    used_by_gpt = models.BooleanField(null=True, default=None)
+
+    @classmethod
+    def from_references(cls, result: ResultMixin, references: List[dict]) -> List[Any]:
+        datasets = {dataset.index: dataset for dataset in Dataset.objects.all()}
+        return [
+            cls(result=result, position=position, **parse_reference_row(reference, datasets))
+            for position, reference in enumerate(references)
+        ]
+
+    def __str__(self) -> str:
+        return f'{self.index} @ {self.year}'
+
+    class Meta:
+        abstract = True
+        ordering = ('position',)
+
+
 class TaskMixin(models.Model):
     status = models.CharField(
         choices=TASK_STATUS_CHOICES, max_length=50, default=TaskStatus.PENDING
@@ -319,19 +416,52 @@ class TaskMixin(models.Model):
     error = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
     modified_at = models.DateTimeField(auto_now=True)
+    # Seconds spent within each stage of the pipeline, see core.timings.
+    timings = models.JSONField(default=dict)
+
+    def _save_and_notify(self) -> None:
+        self.save()
+        # Listeners re-read the task from the database, so the change has to be committed.
+        transaction.on_commit(partial(publish_task_status, self))
+        if self.status in (TaskStatus.SUCCESS, TaskStatus.FAILURE):
+            # By now the cost has been added onto the ledger, if there was any.
+            transaction.on_commit(self._release_budget)
+
+    def _release_budget(self) -> None:
+        release_budget(*self.get_owner_and_uuid())
 
     def set_success(self) -> None:
         self.status = TaskStatus.SUCCESS
-        self.save()
+        self._save_and_notify()
 
     def set_failed(self, error: str) -> None:
         self.status = TaskStatus.FAILURE
         self.error = error
-        self.save()
+        self._save_and_notify()
 
     def set_started(self) -> None:
         self.status = TaskStatus.STARTED
-        self.save()
+        self._save_and_notify()
+
+    def get_owner_and_uuid(self) -> Tuple[int, str]:
+        # The user the task is run for and the uuid the client and the budget reservation
+        # know it by.
+        return self.result.conversation.auth_user_id, str(self.result.uuid)
+
+    @property
+    def etag(self) -> str:
+        # Every status change goes through save(), which bumps modified_at.
+        return f'"{self._meta.label_lower}-{self.pk}-{self.modified_at.timestamp()}"'
+
+    def add_timings(self, timings: Dict[str, float]) -> None:
+        # Stages of a chain are timed in separate tasks, so they're merged into what's stored.
+        self.refresh_from_db(fields=['timings'])
+        merged = dict(self.timings or {})
+        for stage, seconds in timings.items():
+            merged[stage] = round(merged.get(stage, 0.0) + seconds, 4)
+
+        self.timings = merged
+        self.save(update_fields=['timings'])
 
     def __str__(self) -> str:
         return f'Task {self.status} @ {self.modified_at}'
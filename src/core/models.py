@@ -1,6 +1,9 @@
-from typing import Any, List, Optional
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
 
+from dateutil.relativedelta import relativedelta
 from django.conf import settings
+from django.contrib.auth.models import User
 from django.db import models
 from django.utils.translation import gettext as _
 from rest_framework.exceptions import ValidationError
@@ -15,13 +18,25 @@ class CoreVariable(models.Model):
     def __str__(self) -> str:
         return f'{self.name} - {self.value}'
 
+    @staticmethod
+    def _parse_value(value: str) -> Any:
+        # pylint: disable=too-many-return-statements
+        if is_float(value):
+            return float(value)
+        if str.isnumeric(value):
+            return int(value)
+        if value.lower() == 'false':
+            return False
+        if value.lower() == 'true':
+            return True
+        return value
+
     @staticmethod
     def get_core_setting(setting_name: str) -> Any:
         """
         Retrieves value for a variable from core settings.
         :param: str variable_name: Name for the variable whose value will be returned.
         """
-        # pylint: disable=too-many-return-statements
         variable_match: Optional[CoreVariable] = CoreVariable.objects.filter(
             name=setting_name
         ).first()
@@ -33,17 +48,25 @@ class CoreVariable(models.Model):
             return None
 
         # return value from db
-        value = variable_match.value
+        return CoreVariable._parse_value(variable_match.value)
 
-        if is_float(value):
-            return float(value)
-        if str.isnumeric(value):
-            return int(value)
-        if value.lower() == 'false':
-            return False
-        if value.lower() == 'true':
-            return True
-        return value
+    @staticmethod
+    def get_core_settings(*setting_names: str) -> Dict[str, Any]:
+        """
+        Retrieves values for several variables from core settings with a single query.
+        :param: str setting_names: Names of the variables whose values will be returned.
+        """
+        database_values = dict(
+            CoreVariable.objects.filter(name__in=setting_names).values_list('name', 'value')
+        )
+
+        values = {}
+        for setting_name in setting_names:
+            if setting_name in database_values:
+                values[setting_name] = CoreVariable._parse_value(database_values[setting_name])
+            else:
+                values[setting_name] = settings.CORE_SETTINGS.get(setting_name, None)
+        return values
 
 
 class Dataset(models.Model):
@@ -78,3 +101,80 @@ class Dataset(models.Model):
                 'bad_dataset_names': erronous_datasets
             }
             raise ValidationError(message)
+
+
+# Running total of what each user has spent in a month, updated along with every stored result
+# so that the spending limit never has to sum up the whole history of the user (see core.ledger).
+class UsageLedger(models.Model):
+    auth_user = models.ForeignKey(User, on_delete=models.PROTECT, related_name='usage_ledger')
+    # First day of the month the costs were incurred in.
+    month = models.DateField()
+    cost = models.FloatField(default=0.0)
+    modified_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self) -> str:
+        return f'{self.auth_user.username} @ {self.month:%Y-%m}: {self.cost}'
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['auth_user', 'month'], name='unique_usage_month')
+        ]
+
+
+# Usage statistics of a single month, aggregated from the results, users and log in events
+# of that month so that the statistics report never has to scan the whole history (see
+# core.rollups). Totals of a report are the sums of the rows up to its month.
+class UsageRollup(models.Model):
+    # First day of the month, in UTC.
+    month = models.DateField(unique=True)
+
+    log_in_count = models.IntegerField(default=0)
+    log_out_count = models.IntegerField(default=0)
+    user_count = models.IntegerField(default=0)
+    # Users with a query within the month and the ones among them who had none before it,
+    # the latter add up to the count of distinct users over several months.
+    user_with_query_count = models.IntegerField(default=0)
+    new_user_with_query_count = models.IntegerField(default=0)
+
+    text_query_count = models.IntegerField(default=0)
+    document_query_count = models.IntegerField(default=0)
+    text_conversation_count = models.IntegerField(default=0)
+    new_text_conversation_count = models.IntegerField(default=0)
+    document_conversation_count = models.IntegerField(default=0)
+    new_document_conversation_count = models.IntegerField(default=0)
+    cost = models.FloatField(default=0.0)
+
+    # Counters are stored as lists of [value, count] pairs to keep the type of the values.
+    year_usage_counts = models.JSONField(default=list)
+    dataset_usage_counts = models.JSONField(default=list)
+    year_reference_counts = models.JSONField(default=list)
+    dataset_reference_counts = models.JSONField(default=list)
+
+    # When the build of the row started and when a result was last stored into its month,
+    # results stored during a build are only partly counted and so make the row stale too.
+    built_at = models.DateTimeField()
+    stale_at = models.DateTimeField(null=True, default=None)
+
+    def __str__(self) -> str:
+        return f'{self.month:%Y-%m}'
+
+    @property
+    def is_stale(self) -> bool:
+        return self.stale_at is not None and self.stale_at >= self.built_at
+
+    @property
+    def is_fresh(self) -> bool:
+        """Whether the row was built after its month ended and nothing has been added since."""
+        next_month = self.month + relativedelta(months=1)
+        return not self.is_stale and self.built_at.astimezone(timezone.utc).date() >= next_month
+
+    @staticmethod
+    def mark_stale(created_at: datetime) -> None:
+        """
+        Marks the month of a stored result to be built again. Results of the ongoing
+        month are left alone, as that month is always built anew.
+        """
+        month = created_at.astimezone(timezone.utc).date().replace(day=1)
+        if month == datetime.now(timezone.utc).date().replace(day=1):
+            return
+        UsageRollup.objects.filter(month=month).update(stale_at=datetime.now(timezone.utc))
@@ -0,0 +1,175 @@
+import json
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Optional
+
+import redis
+import redis.asyncio
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Every state transition of a TaskMixin instance is published onto a channel of its own,
+# so that anyone waiting on the task can wake up instead of polling the database.
+TASK_CHANNEL_PREFIX = 'rk:task:'
+# They're also published onto a channel of the user who owns the task,
+# which the event stream endpoint relays to the browser.
+USER_CHANNEL_PREFIX = 'rk:user:'
+
+# When Redis is down, publishing is skipped for a while instead of
+# making every status change of every task wait on a connection error.
+REDIS_RETRY_INTERVAL = 30
+
+_REDIS_CLIENT: Optional[redis.Redis] = None
+_REDIS_RETRY_AT = 0.0
+
+
+def _get_redis_client() -> redis.Redis:
+    global _REDIS_CLIENT  # pylint: disable=global-statement
+    if _REDIS_CLIENT is None:
+        _REDIS_CLIENT = redis.Redis.from_url(
+            settings.TASK_NOTIFICATION_URL, socket_connect_timeout=1
+        )
+    return _REDIS_CLIENT
+
+
+def _is_redis_available() -> bool:
+    return time.monotonic() >= _REDIS_RETRY_AT
+
+
+def _set_redis_unavailable(exception: Exception) -> None:
+    global _REDIS_RETRY_AT  # pylint: disable=global-statement
+    _REDIS_RETRY_AT = time.monotonic() + REDIS_RETRY_INTERVAL
+    logger.warning(f'Task notifications are unavailable for a while: {exception}')
+
+
+def get_task_channel(task: Any) -> str:
+    return f'{TASK_CHANNEL_PREFIX}{task._meta.label_lower}:{task.pk}'
+
+
+def get_user_channel(auth_user_id: int) -> str:
+    return f'{USER_CHANNEL_PREFIX}{auth_user_id}'
+
+
+def format_task_event(task: Any, uuid: str) -> str:
+    return json.dumps(
+        {
+            'task': task._meta.label_lower,
+            'uuid': uuid,
+            'status': task.status,
+            'error': task.error,
+            'modified_at': task.modified_at.isoformat(),
+        }
+    )
+
+
+def publish_task_status(task: Any) -> None:
+    if not _is_redis_available():
+        return
+
+    auth_user_id, uuid = task.get_owner_and_uuid()
+    try:
+        with _get_redis_client().pipeline(transaction=False) as pipeline:
+            pipeline.publish(get_task_channel(task), json.dumps({'status': task.status}))
+            pipeline.publish(get_user_channel(auth_user_id), format_task_event(task, uuid))
+            pipeline.execute()
+    except redis.RedisError as exception:
+        _set_redis_unavailable(exception)
+
+
+async def _close_subscription(
+    client: redis.asyncio.Redis, pubsub: redis.asyncio.client.PubSub
+) -> None:
+    # redis 5.0.1 deprecated close() for aclose(), which the stubs of types-redis don't know.
+    await pubsub.aclose()  # type: ignore[attr-defined]
+    await client.aclose()  # type: ignore[attr-defined]
+
+
+@asynccontextmanager
+async def subscribe_to_task(task: Any) -> AsyncIterator[Callable[[float], Awaitable[bool]]]:
+    """
+    Subscribes to the state transitions of the task and yields a coroutine function which
+    waits until the next transition or the timeout and returns whether a transition happened.
+    Subscribe before checking the state of the task, so that no transition goes amiss.
+    When Redis is unavailable, the function returns False without waiting.
+    """
+    client = None
+    pubsub = None
+    if _is_redis_available():
+        client = redis.asyncio.Redis.from_url(
+            settings.TASK_NOTIFICATION_URL, socket_connect_timeout=1
+        )
+        pubsub = client.pubsub(ignore_subscribe_messages=True)
+        try:
+            await pubsub.subscribe(get_task_channel(task))
+        except redis.RedisError as exception:
+            _set_redis_unavailable(exception)
+            await _close_subscription(client, pubsub)
+            client, pubsub = None, None
+
+    async def wait(timeout: float) -> bool:
+        if pubsub is None:
+            return False
+
+        deadline = time.monotonic() + timeout
+        try:
+            while (remaining := deadline - time.monotonic()) > 0:
+                if await pubsub.get_message(timeout=remaining) is not None:
+                    return True
+        except redis.RedisError as exception:
+            _set_redis_unavailable(exception)
+        return False
+
+    try:
+        yield wait
+    finally:
+        if client is not None and pubsub is not None:
+            await _close_subscription(client, pubsub)
+
+
+def format_server_sent_event(data: str, event: Optional[str] = None) -> str:
+    lines = [f'event: {event}'] if event else []
+    lines += [f'data: {line}' for line in data.splitlines()]
+    return '\n'.join(lines) + '\n\n'
+
+
+async def _relay_user_events(
+    client: redis.asyncio.Redis, pubsub: redis.asyncio.client.PubSub
+) -> AsyncIterator[str]:
+    try:
+        # Tells the browser how long to wait before reconnecting and that the stream is live.
+        yield f'retry: {settings.TASK_EVENTS_RETRY * 1000}\n\n'
+        yield format_server_sent_event('{}', event='ready')
+
+        heartbeat_at = time.monotonic() + settings.TASK_EVENTS_HEARTBEAT
+        while True:
+            timeout = max(heartbeat_at - time.monotonic(), 0.0)
+            message = await pubsub.get_message(timeout=timeout)
+            if message is not None:
+                yield format_server_sent_event(message['data'].decode(), event='task')
+            elif time.monotonic() >= heartbeat_at:
+                # Keeps proxies from closing the idle connection, clients ignore comments.
+                yield ': heartbeat\n\n'
+                heartbeat_at = time.monotonic() + settings.TASK_EVENTS_HEARTBEAT
+    finally:
+        # Runs when the client disconnects and the response gets cancelled.
+        await _close_subscription(client, pubsub)
+
+
+async def stream_user_events(auth_user_id: int) -> AsyncIterator[str]:
+    """
+    Subscribes to the task events of the user and returns an iterator relaying them as
+    Server-Sent Events until the client disconnects. Events published while the client
+    was away are not replayed, so clients should re-read the state of whatever they're
+    waiting on after (re)connecting. Raises redis.RedisError when Redis is unavailable.
+    """
+    client = redis.asyncio.Redis.from_url(settings.TASK_NOTIFICATION_URL, socket_connect_timeout=1)
+    pubsub = client.pubsub(ignore_subscribe_messages=True)
+    try:
+        await pubsub.subscribe(get_user_channel(auth_user_id))
+    except redis.RedisError:
+        await _close_subscription(client, pubsub)
+        raise
+
+    return _relay_user_events(client, pubsub)
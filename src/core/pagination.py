@@ -0,0 +1,11 @@
+from django.conf import settings
+from rest_framework.pagination import CursorPagination
+
+
+# Conversations are listed newest first. The cursor seeks on the primary key, so every page
+# costs the same no matter how many conversations the user has or how deep they've scrolled.
+class ConversationCursorPagination(CursorPagination):
+    ordering = '-id'
+    page_size = settings.CONVERSATION_PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = settings.CONVERSATION_MAX_PAGE_SIZE
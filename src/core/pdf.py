@@ -1,20 +1,13 @@
-from base64 import b64encode
-from collections import Counter
-from datetime import datetime, timezone
+from datetime import date
 from io import BytesIO
-from typing import Any, Dict, Iterable, List
+from typing import Any, Dict, List
 
-import matplotlib.pyplot as plt
-from dateutil.relativedelta import relativedelta
-from django.db.models import Q, QuerySet, Sum
 from django.template.loader import render_to_string
 from fpdf import FPDF
 
+from core.charts import DATASET_CHART, YEAR_CHART, render_charts
 from core.mixins import ConversationMixin
-from core.utilities import dataset_indexes_to_names
-from document_search.models import DocumentSearchConversation, DocumentSearchQueryResult
-from text_search.models import TextSearchConversation, TextSearchQueryResult
-from user_profile.models import LogInEvent, LogOutEvent, UserProfile
+from core.rollups import get_counter, get_usage_rollups
 
 
 def _paragraphize(text: str) -> List[str]:
@@ -55,280 +48,102 @@ def _build_conversation_context(
     }
 
 
-def _queries_to_year_list(queries: QuerySet) -> Iterable[int]:
-    year_lists = (
-        range(min_year, max_year + 1)
-        for min_year, max_year in queries.exclude(
-            conversation__min_year__isnull=True, conversation__max_year__isnull=True
-        ).values_list('conversation__min_year', 'conversation__max_year')
-    )
-    return (year for year_list in year_lists for year in year_list)
-
-
-def _text_queries_to_dataset_list(text_queries: QuerySet) -> Iterable[str]:
-    dataset_lists = (text_query.conversation.dataset_names for text_query in text_queries)
-    return (dataset for dataset_list in dataset_lists for dataset in dataset_list)
-
-
-def _document_queries_to_dataset_list(dataset_queries: QuerySet) -> Iterable[str]:
-    return dataset_queries.values_list('dataset_name', flat=True)
-
-
-def _references_to_value_list(
-    references_query_set: QuerySet, key: str, unknown_key: str = 'Teadmata'
-) -> Iterable[Any]:
-    if key == 'dataset':
-        # Dataset name is not in the database or reference and we have to map from index to dataset
-        key = 'index'
-
-    value_list = []
-    for reference_list in references_query_set.all():
-        if reference_list:
-            for reference in reference_list:
-                reference = reference.get(key, unknown_key)
-                value_list.append(reference)
-
-    if key == 'index':
-        value_list = dataset_indexes_to_names(value_list)  # type: ignore
-
-    return value_list
-
-
-def _get_bar_chart_image_base_64_from_year_counter(counter: Counter) -> str:
-    x_y_pairs = counter.most_common()
-    x_y_pairs = [(value, counter) for value, counter in x_y_pairs if isinstance(value, int)]
-
-    x_y_pairs = sorted(x_y_pairs, key=lambda pair: pair[0])
-    x_list, y_list = zip(*x_y_pairs) if x_y_pairs else ([], [])
-
-    _, axis = plt.subplots()
-
-    bar_graph = axis.bar(x_list, y_list)
-    axis.bar_label(bar_graph)
+def _divide(dividend: float, divisor: float, digits: int) -> float:
+    return round(dividend / divisor, digits) if divisor else 0
 
-    axis.set_xlabel('Aasta')
-    axis.set_ylabel('Arv')
 
-    image_bytes_buffer = BytesIO()
-    plt.savefig(image_bytes_buffer)
-    image_bytes_buffer.seek(0)
-    return b64encode(image_bytes_buffer.read()).decode()
+def _percentage(part: int, whole: int) -> float:
+    return round(part / whole * 100, 1) if whole else 0
 
 
-def _get_bar_chart_image_base_64_from_dataset_counter(counter: Counter) -> str:
-    x_y_pairs = counter.most_common()
-    x_list, y_list = zip(*x_y_pairs) if x_y_pairs else ([], [])
-    x_list = [x_value if len(x_list) < 50 else f'{x_value[:47]}...' for x_value in x_list]
-
-    _, axis = plt.subplots()
-
-    bar_graph = axis.barh(x_list, y_list)
-    axis.invert_yaxis()
-    axis.bar_label(bar_graph)
-    axis.set_yticks([])
-    for index, x_value in enumerate(x_list):
-        plt.text(0, index, x_value, va='center')
-
-    axis.set_ylabel('Andmestik')
-    axis.set_xlabel('Arv')
-
-    image_bytes_buffer = BytesIO()
-    plt.savefig(image_bytes_buffer)
-    image_bytes_buffer.seek(0)
-    return b64encode(image_bytes_buffer.read()).decode()
-
-
-# TODO: ideally refactor to decrease repetition.
-#  For example, total and month can probably be 2 calls of 1 function
-# pylint: disable=too-many-statements
+# The counts are read from the monthly rollups (see core.rollups), totals are their sums
+# up to the month of the report.
 def _build_statistics_context(year: int, month: int) -> Dict[str, Any]:
     context: Dict[str, Any] = {}
 
     context['year'] = year
     context['month'] = str(month).zfill(2)
 
-    month_start_datetime = datetime(year=year, month=month, day=1, tzinfo=timezone.utc)
-    month_end_datetime = month_start_datetime + relativedelta(months=1) - relativedelta(days=1)
-
-    total_time_filter = Q(created_at__lte=month_end_datetime)
-    month_time_filter = Q(created_at__lte=month_end_datetime, created_at__gte=month_start_datetime)
+    rollups = get_usage_rollups(date(year=year, month=month, day=1))
+    month_rollups = rollups[-1:]
 
-    context['log_in_count_total'] = LogInEvent.objects.filter(total_time_filter).count()
-    context['log_in_count_month'] = LogInEvent.objects.filter(month_time_filter).count()
-    context['log_out_count_total'] = LogOutEvent.objects.filter(total_time_filter).count()
-    context['log_out_count_month'] = LogOutEvent.objects.filter(month_time_filter).count()
+    def total(field: str) -> Any:
+        return sum(getattr(rollup, field) for rollup in rollups)
 
-    text_queries_total = TextSearchQueryResult.objects.filter(total_time_filter)
-    text_queries_month = TextSearchQueryResult.objects.filter(month_time_filter)
-    document_queries_total = DocumentSearchQueryResult.objects.filter(total_time_filter)
-    document_queries_month = DocumentSearchQueryResult.objects.filter(month_time_filter)
-
-    text_queries_total_conversation_ids = set(
-        text_queries_total.values_list('conversation__id', flat=True)
-    )
-    text_queries_month_conversation_ids = set(
-        text_queries_month.values_list('conversation__id', flat=True)
-    )
-    document_queries_total_conversation_ids = set(
-        document_queries_total.values_list('conversation__id', flat=True)
-    )
-    document_queries_month_conversation_ids = set(
-        document_queries_month.values_list('conversation__id', flat=True)
-    )
-
-    text_conversations_total = TextSearchConversation.objects.filter(
-        id__in=text_queries_total_conversation_ids
-    )
-    text_conversations_month = TextSearchConversation.objects.filter(
-        id__in=text_queries_month_conversation_ids
-    )
-    document_conversations_total = DocumentSearchConversation.objects.filter(
-        id__in=document_queries_total_conversation_ids
-    )
-    document_conversations_month = DocumentSearchConversation.objects.filter(
-        id__in=document_queries_month_conversation_ids
-    )
+    def of_month(field: str) -> Any:
+        return sum(getattr(rollup, field) for rollup in month_rollups)
 
-    text_conversations_total_user_ids = set(
-        text_conversations_total.values_list('auth_user__id', flat=True)
-    )
-    text_conversations_month_user_ids = set(
-        text_conversations_month.values_list('auth_user__id', flat=True)
-    )
-    document_conversations_total_user_ids = set(
-        document_conversations_total.values_list('auth_user__id', flat=True)
-    )
-    document_conversations_month_user_ids = set(
-        document_conversations_month.values_list('auth_user__id', flat=True)
-    )
+    context['log_in_count_total'] = total('log_in_count')
+    context['log_in_count_month'] = of_month('log_in_count')
+    context['log_out_count_total'] = total('log_out_count')
+    context['log_out_count_month'] = of_month('log_out_count')
 
-    user_with_query_count_total = len(
-        text_conversations_total_user_ids | document_conversations_total_user_ids
-    )
-    user_with_query_count_month = len(
-        text_conversations_month_user_ids | document_conversations_month_user_ids
-    )
+    user_with_query_count_total = total('new_user_with_query_count')
+    user_with_query_count_month = of_month('user_with_query_count')
 
-    context['user_count_total'] = UserProfile.objects.filter(total_time_filter).count()
-    context['user_count_month'] = UserProfile.objects.filter(month_time_filter).count()
+    context['user_count_total'] = total('user_count')
+    context['user_count_month'] = of_month('user_count')
     context['user_with_query_count_total'] = user_with_query_count_total
     context['user_with_query_count_month'] = user_with_query_count_month
 
-    text_query_cost_total = text_queries_total.aggregate(Sum('total_cost', default=0.0))[
-        'total_cost__sum'
-    ]
-    text_query_cost_month = text_queries_month.aggregate(Sum('total_cost', default=0.0))[
-        'total_cost__sum'
-    ]
-    document_query_cost_total = document_queries_total.aggregate(Sum('total_cost', default=0.0))[
-        'total_cost__sum'
-    ]
-    document_query_cost_month = document_queries_month.aggregate(Sum('total_cost', default=0.0))[
-        'total_cost__sum'
-    ]
-
-    cost_total = text_query_cost_total + document_query_cost_total
-    cost_month = text_query_cost_month + document_query_cost_month
+    cost_total = total('cost')
+    cost_month = of_month('cost')
 
     context['cost_total'] = round(cost_total, 2)
     context['cost_month'] = round(cost_month, 2)
-    context['cost_per_user_with_query_total'] = (
-        round(cost_total / user_with_query_count_total, 4) if user_with_query_count_total else 0
-    )
-    context['cost_per_user_with_query_month'] = (
-        round(cost_month / user_with_query_count_month, 4) if user_with_query_count_month else 0
-    )
+    context['cost_per_user_with_query_total'] = _divide(cost_total, user_with_query_count_total, 4)
+    context['cost_per_user_with_query_month'] = _divide(cost_month, user_with_query_count_month, 4)
 
-    query_count_total = text_queries_total.count() + document_queries_total.count()
-    query_count_month = text_queries_month.count() + document_queries_month.count()
+    text_query_count_total = total('text_query_count')
+    text_query_count_month = of_month('text_query_count')
+    document_query_count_total = total('document_query_count')
+    document_query_count_month = of_month('document_query_count')
+    query_count_total = text_query_count_total + document_query_count_total
+    query_count_month = text_query_count_month + document_query_count_month
 
-    conversation_count_total = (
-        text_conversations_total.count() + document_conversations_total.count()
+    conversation_count_total = total('new_text_conversation_count') + total(
+        'new_document_conversation_count'
     )
-    conversation_count_month = (
-        text_conversations_month.count() + document_conversations_month.count()
+    conversation_count_month = of_month('text_conversation_count') + of_month(
+        'document_conversation_count'
     )
 
     context['query_count_total'] = query_count_total
     context['query_count_month'] = query_count_month
-    context['query_count_per_user_with_query_total'] = (
-        round(query_count_total / user_with_query_count_total, 2)
-        if user_with_query_count_total
-        else 0
+    context['query_count_per_user_with_query_total'] = _divide(
+        query_count_total, user_with_query_count_total, 2
     )
-    context['query_count_per_user_with_query_month'] = (
-        round(query_count_month / user_with_query_count_month, 2)
-        if user_with_query_count_month
-        else 0
+    context['query_count_per_user_with_query_month'] = _divide(
+        query_count_month, user_with_query_count_month, 2
     )
-    context['query_count_per_conversation_total'] = (
-        round(query_count_total / conversation_count_total, 2) if conversation_count_total else 0
+    context['query_count_per_conversation_total'] = _divide(
+        query_count_total, conversation_count_total, 2
     )
-    context['query_count_per_conversation_month'] = (
-        round(query_count_month / conversation_count_month, 2) if conversation_count_month else 0
+    context['query_count_per_conversation_month'] = _divide(
+        query_count_month, conversation_count_month, 2
     )
 
-    context['text_search_query_proportion_total'] = (
-        round(text_queries_total.count() / query_count_total * 100, 1) if query_count_total else 0
+    context['text_search_query_proportion_total'] = _percentage(
+        text_query_count_total, query_count_total
     )
-    context['text_search_query_proportion_month'] = (
-        round(text_queries_month.count() / query_count_month * 100, 1) if query_count_month else 0
+    context['text_search_query_proportion_month'] = _percentage(
+        text_query_count_month, query_count_month
     )
-    context['document_search_query_proportion_total'] = (
-        round(document_queries_total.count() / query_count_total * 100, 1)
-        if query_count_total
-        else 0
+    context['document_search_query_proportion_total'] = _percentage(
+        document_query_count_total, query_count_total
     )
-    context['document_search_query_proportion_month'] = (
-        round(document_queries_month.count() / query_count_month * 100, 1)
-        if query_count_month
-        else 0
+    context['document_search_query_proportion_month'] = _percentage(
+        document_query_count_month, query_count_month
     )
 
-    year_usage_total_counts: Counter[int] = Counter()
-    year_usage_month_counts: Counter[int] = Counter()
-
-    year_usage_total_counts.update(_queries_to_year_list(text_queries_total))
-    year_usage_total_counts.update(_queries_to_year_list(document_queries_total))
-    year_usage_month_counts.update(_queries_to_year_list(text_queries_month))
-    year_usage_month_counts.update(_queries_to_year_list(document_queries_month))
-
-    dataset_usage_total_counts: Counter[str] = Counter()
-    dataset_usage_month_counts: Counter[str] = Counter()
-
-    dataset_usage_total_counts.update(_text_queries_to_dataset_list(text_queries_total))
-    dataset_usage_total_counts.update(_document_queries_to_dataset_list(document_queries_total))
-    dataset_usage_month_counts.update(_text_queries_to_dataset_list(text_queries_month))
-    dataset_usage_month_counts.update(_document_queries_to_dataset_list(document_queries_month))
-
-    text_references_total = text_queries_total.values_list('references', flat=True)
-    text_references_month = text_queries_month.values_list('references', flat=True)
-    document_references_total = document_queries_total.values_list('references', flat=True)
-    document_references_month = document_queries_month.values_list('references', flat=True)
-
-    year_reference_total_counts: Counter[int] = Counter()
-    year_reference_month_counts: Counter[int] = Counter()
-
-    year_reference_total_counts.update(_references_to_value_list(text_references_total, 'year'))
-    year_reference_total_counts.update(_references_to_value_list(document_references_total, 'year'))
-    year_reference_month_counts.update(_references_to_value_list(text_references_month, 'year'))
-    year_reference_month_counts.update(_references_to_value_list(document_references_month, 'year'))
-
-    dataset_reference_total_counts: Counter[str] = Counter()
-    dataset_reference_month_counts: Counter[str] = Counter()
-
-    dataset_reference_total_counts.update(
-        _references_to_value_list(text_references_total, 'dataset')
-    )
-    dataset_reference_total_counts.update(
-        _references_to_value_list(document_references_total, 'dataset')
-    )
-    dataset_reference_month_counts.update(
-        _references_to_value_list(text_references_month, 'dataset')
-    )
-    dataset_reference_month_counts.update(
-        _references_to_value_list(document_references_month, 'dataset')
-    )
+    year_usage_total_counts = get_counter(rollups, 'year_usage_counts')
+    year_usage_month_counts = get_counter(month_rollups, 'year_usage_counts')
+    dataset_usage_total_counts = get_counter(rollups, 'dataset_usage_counts')
+    dataset_usage_month_counts = get_counter(month_rollups, 'dataset_usage_counts')
+    year_reference_total_counts = get_counter(rollups, 'year_reference_counts')
+    year_reference_month_counts = get_counter(month_rollups, 'year_reference_counts')
+    dataset_reference_total_counts = get_counter(rollups, 'dataset_reference_counts')
+    dataset_reference_month_counts = get_counter(month_rollups, 'dataset_reference_counts')
 
     # for testing purposes only
     context['year_usage_total_counts'] = dict(year_usage_total_counts)
@@ -341,31 +156,19 @@ def _build_statistics_context(year: int, month: int) -> Dict[str, Any]:
     context['dataset_reference_total_counts'] = dict(dataset_reference_total_counts)
     context['dataset_reference_month_counts'] = dict(dataset_reference_month_counts)
 
-    context['year_usage_total_graph_base_64'] = _get_bar_chart_image_base_64_from_year_counter(
-        year_usage_total_counts
-    )
-    context['year_usage_month_graph_base_64'] = _get_bar_chart_image_base_64_from_year_counter(
-        year_usage_month_counts
-    )
-    context['year_reference_total_graph_base_64'] = _get_bar_chart_image_base_64_from_year_counter(
-        year_reference_total_counts
-    )
-    context['year_reference_month_graph_base_64'] = _get_bar_chart_image_base_64_from_year_counter(
-        year_reference_month_counts
-    )
-
-    context[
-        'dataset_usage_total_graph_base_64'
-    ] = _get_bar_chart_image_base_64_from_dataset_counter(dataset_usage_total_counts)
-    context[
-        'dataset_usage_month_graph_base_64'
-    ] = _get_bar_chart_image_base_64_from_dataset_counter(dataset_usage_month_counts)
-    context[
-        'dataset_reference_total_graph_base_64'
-    ] = _get_bar_chart_image_base_64_from_dataset_counter(dataset_reference_total_counts)
-    context[
-        'dataset_reference_month_graph_base_64'
-    ] = _get_bar_chart_image_base_64_from_dataset_counter(dataset_reference_month_counts)
+    # The counts of a closed month can only change when it's rolled up again.
+    closed_month = all(rollup.is_fresh for rollup in rollups)
+    charts = {
+        'year_usage_total_graph_base_64': (YEAR_CHART, year_usage_total_counts),
+        'year_usage_month_graph_base_64': (YEAR_CHART, year_usage_month_counts),
+        'year_reference_total_graph_base_64': (YEAR_CHART, year_reference_total_counts),
+        'year_reference_month_graph_base_64': (YEAR_CHART, year_reference_month_counts),
+        'dataset_usage_total_graph_base_64': (DATASET_CHART, dataset_usage_total_counts),
+        'dataset_usage_month_graph_base_64': (DATASET_CHART, dataset_usage_month_counts),
+        'dataset_reference_total_graph_base_64': (DATASET_CHART, dataset_reference_total_counts),
+        'dataset_reference_month_graph_base_64': (DATASET_CHART, dataset_reference_month_counts),
+    }
+    context.update(render_charts(charts, memoize=closed_month))
 
     return context
 
@@ -0,0 +1,134 @@
+import hashlib
+import os
+import pathlib
+import time
+from datetime import date, datetime, timezone
+from typing import BinaryIO
+
+from django.conf import settings
+from django.db.models import Max
+
+from core.choices import TaskStatus
+from core.mixins import ConversationMixin
+from core.pdf import get_conversation_pdf_file_bytes, get_statistics_pdf_file_bytes
+from core.rollups import get_month, get_usage_rollups
+
+# Conversation PDFs are rendered by a Celery task into a directory shared with the web
+# processes, one file per conversation named after the state it was rendered from.
+# A conversation that changes gets a new name, so files never have to be invalidated.
+
+
+def get_conversation_pdf_version(conversation: ConversationMixin) -> str:
+    # Only answered questions end up in the PDF, their tasks are last touched on success.
+    last_answered_at = conversation.query_results.filter(
+        celery_task__status=TaskStatus.SUCCESS
+    ).aggregate(last=Max('celery_task__modified_at'))['last']
+    state = f'{conversation.title}:{conversation.modified_at.timestamp()}'
+    if last_answered_at:
+        state += f':{last_answered_at.timestamp()}'
+    return hashlib.sha1(state.encode('utf8')).hexdigest()[:16]
+
+
+def _get_prefix(conversation: ConversationMixin) -> str:
+    label = conversation._meta.label_lower  # pylint: disable=protected-access
+    return f'{label.replace(".", "-")}-{conversation.pk}-'
+
+
+def get_cached_pdf_path(conversation: ConversationMixin, version: str) -> pathlib.Path:
+    return pathlib.Path(settings.PDF_CACHE_DIR) / f'{_get_prefix(conversation)}{version}.pdf'
+
+
+def claim_rendering(path: pathlib.Path) -> bool:
+    """
+    Marks the PDF as being rendered so that clients polling for it don't queue it
+    over and over again. Marks older than the time limit of rendering are taken over.
+    """
+    pending_path = path.with_suffix('.pending')
+    try:
+        if time.time() - pending_path.stat().st_mtime < settings.PDF_RENDER_TIMEOUT:
+            return False
+        pending_path.unlink(missing_ok=True)
+    except FileNotFoundError:
+        pass
+
+    try:
+        os.close(os.open(pending_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+    except FileExistsError:
+        return False
+    return True
+
+
+def _write_atomically(path: pathlib.Path, data: bytes) -> None:
+    # Written and renamed so that a reader never sees a half written file.
+    temporary_path = path.with_suffix(f'.{os.getpid()}.tmp')
+    temporary_path.write_bytes(data)
+    temporary_path.replace(path)
+
+
+def store_conversation_pdf(conversation: ConversationMixin) -> pathlib.Path:
+    """Renders the PDF of the conversation into the cache, replacing its older versions."""
+    directory = pathlib.Path(settings.PDF_CACHE_DIR)
+    directory.mkdir(parents=True, exist_ok=True)
+    path = get_cached_pdf_path(conversation, get_conversation_pdf_version(conversation))
+
+    _write_atomically(path, get_conversation_pdf_file_bytes(conversation).getvalue())
+
+    for old_path in directory.glob(f'{_get_prefix(conversation)}*'):
+        if old_path != path and old_path.suffix in ('.pdf', '.pending'):
+            old_path.unlink(missing_ok=True)
+
+    return path
+
+
+def release_conversation_pdf(conversation: ConversationMixin) -> None:
+    """Drops the rendering marks of the conversation, so that a failed rendering can be retried."""
+    for pending_path in pathlib.Path(settings.PDF_CACHE_DIR).glob(
+        f'{_get_prefix(conversation)}*.pending'
+    ):
+        pending_path.unlink(missing_ok=True)
+
+
+# Statistics of a closed month only change when a late result gets its month rolled up
+# again, so their PDFs are kept under the build times of the rollups they're made of.
+# The ongoing month changes all the time and its PDF is only kept for a short while.
+def get_statistics_pdf_path(year: int, month: int) -> pathlib.Path:
+    """Returns the path of the statistics PDF of the month, generating it if need be."""
+    directory = pathlib.Path(settings.STATISTICS_CACHE_DIR)
+    directory.mkdir(parents=True, exist_ok=True)
+    prefix = f'statistics_{year}_{str(month).zfill(2)}-'
+
+    month_start = date(year=year, month=month, day=1)
+    if month_start >= get_month(datetime.now(timezone.utc)):
+        path = directory / f'{prefix}live.pdf'
+        try:
+            if time.time() - path.stat().st_mtime < settings.STATISTICS_LIVE_TTL:
+                return path
+        except FileNotFoundError:
+            pass
+        _write_atomically(path, get_statistics_pdf_file_bytes(year, month).getvalue())
+        return path
+
+    rollups = get_usage_rollups(month_start)
+    state = ','.join(f'{rollup.month}:{rollup.built_at.timestamp()}' for rollup in rollups)
+    version = hashlib.sha1(state.encode('utf8')).hexdigest()[:16]
+    path = directory / f'{prefix}{version}.pdf'
+    if path.exists():
+        return path
+
+    _write_atomically(path, get_statistics_pdf_file_bytes(year, month).getvalue())
+    for old_path in directory.glob(f'{prefix}*.pdf'):
+        if old_path != path:
+            old_path.unlink(missing_ok=True)
+    return path
+
+
+def open_statistics_pdf(year: int, month: int) -> BinaryIO:
+    """Opens the statistics PDF of the month, generating it if need be."""
+    # Another process can replace the file between its path being returned and it being
+    # opened. The file is looked up again then, and rendered in memory if that fails too.
+    for _ in range(2):
+        try:
+            return get_statistics_pdf_path(year, month).open('rb')
+        except FileNotFoundError:
+            continue
+    return get_statistics_pdf_file_bytes(year, month)
@@ -0,0 +1,201 @@
+from collections import Counter
+from datetime import date, datetime, timezone
+from typing import Any, Iterable, List, Optional, Tuple, Type
+
+from dateutil.relativedelta import relativedelta
+from django.db.models import Count, Min, Model, QuerySet, Sum
+
+from core.models import Dataset, UsageRollup
+from document_search.models import DocumentSearchQueryResult, DocumentSearchReference
+from text_search.models import TextSearchQueryResult, TextSearchReference
+from user_profile.models import LogInEvent, LogOutEvent, UserProfile
+
+# Every month is rolled up on its own with a handful of grouped queries. Closed months are
+# built once and only again when a late result lands in them, the ongoing month is always
+# built anew. A report then only reads the rows up to its month.
+
+
+def get_month(moment: datetime) -> date:
+    return moment.astimezone(timezone.utc).date().replace(day=1)
+
+
+def _get_month_range(month: date) -> Tuple[datetime, datetime]:
+    start = datetime(year=month.year, month=month.month, day=1, tzinfo=timezone.utc)
+    return start, start + relativedelta(months=1)
+
+
+def _count_distinct(queryset: QuerySet, field: str) -> int:
+    return queryset.values(field).distinct().count()
+
+
+def _count_new(queryset: QuerySet, earlier_queryset: QuerySet, field: str) -> int:
+    earlier_values = earlier_queryset.values(field)
+    return queryset.exclude(**{f'{field}__in': earlier_values}).values(field).distinct().count()
+
+
+def _count_years(queryset: QuerySet, counter: Counter) -> None:
+    year_ranges = (
+        queryset.exclude(conversation__min_year__isnull=True, conversation__max_year__isnull=True)
+        .values('conversation__min_year', 'conversation__max_year')
+        .annotate(count=Count('id'))
+    )
+    for year_range in year_ranges:
+        for year in range(
+            year_range['conversation__min_year'], year_range['conversation__max_year'] + 1
+        ):
+            counter[year] += year_range['count']
+
+
+def _count_text_datasets(queryset: QuerySet, counter: Counter) -> None:
+    dataset_names_strings = queryset.values('conversation__dataset_names_string').annotate(
+        count=Count('id')
+    )
+    for item in dataset_names_strings:
+        # Conversations without datasets search through all of them.
+        dataset_names_string = item['conversation__dataset_names_string']
+        if dataset_names_string:
+            dataset_names = dataset_names_string.split(',')
+        else:
+            dataset_names = Dataset.get_all_dataset_values()
+        for dataset_name in dataset_names:
+            counter[dataset_name] += item['count']
+
+
+def _count_references(queryset: QuerySet, field: str, counter: Counter) -> None:
+    # References without a year or a known dataset are counted under the same name.
+    for item in queryset.values(field).annotate(count=Count('id')):
+        counter[item[field] if item[field] is not None else 'Teadmata'] += item['count']
+
+
+def _to_pairs(counter: Counter) -> List[List[Any]]:
+    return [[value, count] for value, count in counter.items()]
+
+
+def build_usage_rollup(month: date) -> UsageRollup:
+    built_at = datetime.now(timezone.utc)
+    start, end = _get_month_range(month)
+    text_queries = TextSearchQueryResult.objects.filter(created_at__gte=start, created_at__lt=end)
+    document_queries = DocumentSearchQueryResult.objects.filter(
+        created_at__gte=start, created_at__lt=end
+    )
+    earlier_text_queries = TextSearchQueryResult.objects.filter(created_at__lt=start)
+    earlier_document_queries = DocumentSearchQueryResult.objects.filter(created_at__lt=start)
+
+    # Users are counted over both kinds of queries, so their ids are gathered in Python.
+    user_field = 'conversation__auth_user_id'
+    user_ids = set(text_queries.values_list(user_field, flat=True))
+    user_ids |= set(document_queries.values_list(user_field, flat=True))
+    earlier_user_ids = set(
+        earlier_text_queries.filter(**{f'{user_field}__in': user_ids}).values_list(
+            user_field, flat=True
+        )
+    )
+    earlier_user_ids |= set(
+        earlier_document_queries.filter(**{f'{user_field}__in': user_ids}).values_list(
+            user_field, flat=True
+        )
+    )
+
+    text_cost = text_queries.aggregate(Sum('total_cost', default=0.0))['total_cost__sum']
+    document_cost = document_queries.aggregate(Sum('total_cost', default=0.0))['total_cost__sum']
+
+    year_usage_counts: Counter[int] = Counter()
+    _count_years(text_queries, year_usage_counts)
+    _count_years(document_queries, year_usage_counts)
+
+    dataset_usage_counts: Counter[str] = Counter()
+    _count_text_datasets(text_queries, dataset_usage_counts)
+    dataset_usage_counts.update(
+        {
+            item['dataset_name']: item['count']
+            for item in document_queries.values('dataset_name').annotate(count=Count('id'))
+        }
+    )
+
+    text_references = TextSearchReference.objects.filter(
+        result__created_at__gte=start, result__created_at__lt=end
+    )
+    document_references = DocumentSearchReference.objects.filter(
+        result__created_at__gte=start, result__created_at__lt=end
+    )
+    year_reference_counts: Counter[Any] = Counter()
+    dataset_reference_counts: Counter[str] = Counter()
+    for references in (text_references, document_references):
+        _count_references(references, 'year', year_reference_counts)
+        _count_references(references, 'dataset__name', dataset_reference_counts)
+
+    month_filter = {'created_at__gte': start, 'created_at__lt': end}
+    rollup, _ = UsageRollup.objects.update_or_create(
+        month=month,
+        defaults={
+            'log_in_count': LogInEvent.objects.filter(**month_filter).count(),
+            'log_out_count': LogOutEvent.objects.filter(**month_filter).count(),
+            'user_count': UserProfile.objects.filter(**month_filter).count(),
+            'user_with_query_count': len(user_ids),
+            'new_user_with_query_count': len(user_ids - earlier_user_ids),
+            'text_query_count': text_queries.count(),
+            'document_query_count': document_queries.count(),
+            'text_conversation_count': _count_distinct(text_queries, 'conversation_id'),
+            'new_text_conversation_count': _count_new(
+                text_queries, earlier_text_queries, 'conversation_id'
+            ),
+            'document_conversation_count': _count_distinct(document_queries, 'conversation_id'),
+            'new_document_conversation_count': _count_new(
+                document_queries, earlier_document_queries, 'conversation_id'
+            ),
+            'cost': text_cost + document_cost,
+            'year_usage_counts': _to_pairs(year_usage_counts),
+            'dataset_usage_counts': _to_pairs(dataset_usage_counts),
+            'year_reference_counts': _to_pairs(year_reference_counts),
+            'dataset_reference_counts': _to_pairs(dataset_reference_counts),
+            'built_at': built_at,
+        },
+    )
+    return rollup
+
+
+def _get_first_month() -> Optional[date]:
+    first_rollup = UsageRollup.objects.order_by('month').first()
+    if first_rollup:
+        return first_rollup.month
+
+    dated_models: Tuple[Type[Model], ...] = (
+        TextSearchQueryResult,
+        DocumentSearchQueryResult,
+        UserProfile,
+        LogInEvent,
+        LogOutEvent,
+    )
+    first_moments = [
+        model.objects.aggregate(first=Min('created_at'))['first'] for model in dated_models
+    ]
+    first_moments = [moment for moment in first_moments if moment]
+    return get_month(min(first_moments)) if first_moments else None
+
+
+def get_usage_rollups(month: date) -> List[UsageRollup]:
+    """
+    Returns the rollups of every month up to and including the given one,
+    building the ones that are missing or out of date.
+    """
+    first_month = _get_first_month()
+    if first_month is None or first_month > month:
+        return []
+
+    rollups = {rollup.month: rollup for rollup in UsageRollup.objects.filter(month__lte=month)}
+    current_month = first_month
+    while current_month <= month:
+        rollup = rollups.get(current_month)
+        if rollup is None or not rollup.is_fresh:
+            rollups[current_month] = build_usage_rollup(current_month)
+        current_month += relativedelta(months=1)
+
+    return [rollups[key] for key in sorted(rollups)]
+
+
+def get_counter(rollups: Iterable[UsageRollup], field: str) -> Counter:
+    counter: Counter = Counter()
+    for rollup in rollups:
+        for value, count in getattr(rollup, field):
+            counter[value] += count
+    return counter
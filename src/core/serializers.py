@@ -75,3 +75,16 @@ class StatisticsSerializer(serializers.Serializer):
         if data['year'] == datetime.now().year and data['month'] > datetime.now().month:
             raise ValidationError("Can't make statistics for after the current month!")
         return data
+
+
+# Objects are never modified through views, so the serializer is used only for reading
+class TaskStatusSerializer(serializers.Serializer):
+    status = serializers.CharField(read_only=True)
+    error = serializers.CharField(read_only=True)
+    created_at = serializers.DateTimeField(read_only=True)
+    modified_at = serializers.DateTimeField(read_only=True)
+
+
+class TaskStatusQuerySerializer(serializers.Serializer):
+    # How many seconds to wait for the status to change from the one in If-None-Match.
+    wait = serializers.IntegerField(default=0, min_value=0)
@@ -0,0 +1,76 @@
+import logging
+from datetime import date, datetime, timezone
+from typing import Optional
+
+from dateutil.relativedelta import relativedelta
+from django.apps import apps
+from django.conf import settings
+
+from api.celery_handler import app
+from core.pdf_cache import (
+    get_statistics_pdf_path,
+    release_conversation_pdf,
+    store_conversation_pdf,
+)
+from core.rollups import build_usage_rollup, get_month, get_usage_rollups
+
+logger = logging.getLogger(__name__)
+
+
+@app.task(name='refresh_usage_rollups', ignore_result=True)
+def refresh_usage_rollups() -> None:
+    """
+    Rebuilds the rollup of the ongoing month and of the previous ones that are missing
+    or have gone stale, so that statistics reports only have to read them.
+    """
+    current_month = get_month(datetime.now(timezone.utc))
+    rollups = get_usage_rollups(current_month - relativedelta(months=1))
+    build_usage_rollup(current_month)
+    logger.info(
+        f'Refreshed usage rollups up to {current_month:%Y-%m}, {len(rollups) + 1} in total.'
+    )
+
+
+@app.task(
+    name='render_conversation_pdf',
+    ignore_result=True,
+    soft_time_limit=settings.PDF_RENDER_TIMEOUT,
+)
+def render_conversation_pdf(conversation_label: str, conversation_id: int) -> None:
+    """
+    Renders the PDF of a conversation into the cache the pdf endpoints serve it from.
+
+    :param conversation_label: Label of the conversation model.
+    :param conversation_id: ID of the conversation.
+    """
+    conversation = apps.get_model(conversation_label).objects.get(pk=conversation_id)
+    try:
+        store_conversation_pdf(conversation)
+    except Exception as exception:
+        logging.getLogger(settings.ERROR_LOGGER).exception("Couldn't render the conversation PDF!")
+        # Lets the next request for the PDF try again.
+        release_conversation_pdf(conversation)
+        raise exception
+
+
+@app.task(
+    name='generate_statistics_pdf',
+    ignore_result=True,
+    soft_time_limit=settings.PDF_RENDER_TIMEOUT,
+)
+def generate_statistics_pdf(year: Optional[int] = None, month: Optional[int] = None) -> None:
+    """
+    Generates the statistics PDF of a month into the cache the statistics endpoint
+    serves it from, by default of the month that has just ended.
+
+    :param year: Year of the month.
+    :param month: Number of the month.
+    """
+    month_start: date
+    if year is None or month is None:
+        month_start = get_month(datetime.now(timezone.utc)) - relativedelta(months=1)
+    else:
+        month_start = date(year, month, 1)
+
+    path = get_statistics_pdf_path(month_start.year, month_start.month)
+    logger.info(f'Generated the statistics of {month_start:%Y-%m} into {path}.')
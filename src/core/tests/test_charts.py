@@ -0,0 +1,50 @@
+from base64 import b64decode
+from collections import Counter
+from typing import Dict, Tuple
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+
+from api.utilities.testing import use_temporary_directory
+from core.charts import DATASET_CHART, YEAR_CHART, render_charts
+
+PNG_SIGNATURE = b'\x89PNG'
+
+
+class TestCharts(SimpleTestCase):
+    def setUp(self) -> None:  # pylint: disable=invalid-name
+        self.chart_cache_dir = use_temporary_directory(self)
+
+        self.charts: Dict[str, Tuple[str, Counter]] = {
+            'years': (YEAR_CHART, Counter({2021: 2, 2020: 1, 'Teadmata': 4})),
+            'datasets': (DATASET_CHART, Counter({'a': 1, 'b': 3})),
+        }
+
+    def test_charts_being_rendered_in_the_pool(self) -> None:
+        with override_settings(CHART_WORKERS=2, CHART_CACHE_DIR=self.chart_cache_dir):
+            charts = render_charts(self.charts, memoize=False)
+
+        self.assertEqual(set(charts), {'years', 'datasets'})
+        for chart in charts.values():
+            self.assertEqual(b64decode(chart)[:4], PNG_SIGNATURE)
+
+    def test_charts_not_being_left_in_pyplot(self) -> None:
+        # pylint: disable=import-outside-toplevel
+        from matplotlib import pyplot
+
+        with override_settings(CHART_WORKERS=1, CHART_CACHE_DIR=self.chart_cache_dir):
+            render_charts(self.charts, memoize=False)
+        self.assertEqual(pyplot.get_fignums(), [])
+
+    def test_memoized_charts_being_rendered_once(self) -> None:
+        with override_settings(CHART_WORKERS=1, CHART_CACHE_DIR=self.chart_cache_dir):
+            charts = render_charts(self.charts, memoize=True)
+            with mock.patch('core.charts._render') as mock_render:
+                self.assertEqual(render_charts(self.charts, memoize=True), charts)
+            mock_render.assert_not_called()
+
+            # Different counts make for a chart of their own.
+            self.charts['datasets'][1]['a'] += 1
+            with mock.patch('core.charts._render', return_value={'datasets': ''}) as mock_render:
+                render_charts(self.charts, memoize=True)
+            mock_render.assert_called_once()
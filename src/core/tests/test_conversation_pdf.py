@@ -0,0 +1,75 @@
+from unittest import mock
+
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.reverse import reverse
+from rest_framework.test import APITestCase
+
+from api.utilities.testing import use_temporary_directory
+from core.tasks import render_conversation_pdf
+from text_search.models import TextSearchConversation, TextSearchQueryResult, TextTask
+from user_profile.utilities import create_test_user_with_user_profile
+
+
+class TestConversationPdf(APITestCase):
+    def setUp(self) -> None:  # pylint: disable=invalid-name
+        auth_user = create_test_user_with_user_profile(
+            self, 'tester', 'tester@email.com', 'password', is_manager=False
+        )
+        token, _ = Token.objects.get_or_create(user=auth_user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+
+        self.conversation = TextSearchConversation.objects.create(
+            auth_user=auth_user, system_input='', title='Kommionu'
+        )
+        result = TextSearchQueryResult.objects.create(
+            conversation=self.conversation,
+            user_input='Kas Kommionu paneb?',
+            response='Kommionu paneb.',
+            references=[{'title': 'Kommionu', 'url': 'https://kommionu.ee'}],
+        )
+        TextTask.objects.create(result=result).set_success()
+
+        self.pdf_endpoint_url = reverse('v1:text_search-pdf', kwargs={'pk': self.conversation.pk})
+
+        use_temporary_directory(self, 'PDF_CACHE_DIR')
+
+    def _render(self) -> None:
+        render_conversation_pdf(
+            conversation_label='text_search.textsearchconversation',
+            conversation_id=self.conversation.pk,
+        )
+
+    def test_pdf_being_generated_once_in_the_background(self) -> None:
+        with mock.patch('core.views.render_conversation_pdf.apply_async') as mock_render:
+            response = self.client.get(self.pdf_endpoint_url)
+            self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+            self.assertTrue(response['Location'].endswith(self.pdf_endpoint_url))
+
+            # Polling doesn't queue it again.
+            response = self.client.get(self.pdf_endpoint_url)
+            self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+            mock_render.assert_called_once()
+
+        self._render()
+        response = self.client.get(self.pdf_endpoint_url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(b''.join(response.streaming_content)[:4], b'%PDF')
+
+        etag = response['ETag']
+        response = self.client.get(self.pdf_endpoint_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_changed_conversation_being_generated_again(self) -> None:
+        self._render()
+        response = self.client.get(self.pdf_endpoint_url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        etag = response['ETag']
+
+        self.conversation.title = 'Kommionu paneb'
+        self.conversation.save()
+
+        with mock.patch('core.views.render_conversation_pdf.apply_async') as mock_render:
+            response = self.client.get(self.pdf_endpoint_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        mock_render.assert_called_once()
@@ -0,0 +1,130 @@
+import gzip
+import json
+import pathlib
+from datetime import datetime, timedelta, timezone
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from rest_framework.test import APITestCase
+
+from api.utilities.testing import use_temporary_directory
+from core.choices import TaskStatus
+from document_search.models import (
+    DocumentSearchConversation,
+    DocumentSearchQueryResult,
+    DocumentTask,
+)
+from text_search.models import TextSearchConversation, TextSearchQueryResult, TextTask
+from user_profile.models import LogInEvent, LogOutEvent
+from user_profile.utilities import create_test_user_with_user_profile
+
+
+def _mock_time(replacement: datetime):  # type: ignore
+    return mock.patch('django.utils.timezone.now', return_value=replacement)
+
+
+class TestEventExport(APITestCase):
+    def setUp(self) -> None:  # pylint: disable=invalid-name
+        self.export_dir = use_temporary_directory(self)
+
+        self.auth_user = create_test_user_with_user_profile(
+            self, 'tester', 'tester@email.com', 'password'
+        )
+        self.text_conversation = TextSearchConversation.objects.create(
+            auth_user=self.auth_user, system_input='', dataset_names_string='a,b'
+        )
+        self.document_conversation = DocumentSearchConversation.objects.create(
+            auth_user=self.auth_user, system_input='', user_input='Kommionu'
+        )
+
+        with _mock_time(datetime(2024, 7, 1, tzinfo=timezone.utc)):
+            LogInEvent.objects.create(auth_user=self.auth_user)
+        with _mock_time(datetime(2024, 7, 2, tzinfo=timezone.utc)):
+            text_result = TextSearchQueryResult.objects.create(
+                conversation=self.text_conversation,
+                user_input='Kas Kommionu paneb?',
+                references=[{'id': '1', 'index': 'a_1', 'parent': 'p', 'year': 2021}],
+            )
+            TextTask.objects.create(result=text_result, status=TaskStatus.SUCCESS)
+        with _mock_time(datetime(2024, 7, 3, tzinfo=timezone.utc)):
+            document_result = DocumentSearchQueryResult.objects.create(
+                conversation=self.document_conversation, dataset_name='b'
+            )
+            DocumentTask.objects.create(result=document_result, status=TaskStatus.FAILURE)
+        with _mock_time(datetime(2024, 7, 4, tzinfo=timezone.utc)):
+            LogOutEvent.objects.create(auth_user=self.auth_user)
+
+    def _export(self, path: pathlib.Path, *args: str) -> str:
+        stderr = StringIO()
+        call_command(
+            'export_events', '--output', str(path), '--chunk-size', '1', *args, stderr=stderr
+        )
+        return stderr.getvalue()
+
+    def test_events_being_exported_oldest_first(self) -> None:
+        path = self.export_dir / 'dump.jsonl.gz'
+        self._export(path)
+
+        with gzip.open(path, 'rt', encoding='utf-8') as export_file:
+            events = [json.loads(line) for line in export_file]
+
+        self.assertEqual(
+            [event['event'] for event in events],
+            ['log-in', 'text-search', 'document-search', 'log-out'],
+        )
+        self.assertEqual(events[1]['datasets'], ['a', 'b'])
+        self.assertEqual(events[1]['references'], [{'id': '1', 'index': 'a_1', 'parent': 'p'}])
+        self.assertEqual(events[2]['datasets'], 'b')
+        self.assertEqual(events[3]['user'], 'tester')
+
+    def test_events_of_the_same_time_being_paged_through(self) -> None:
+        with _mock_time(datetime(2024, 7, 1, tzinfo=timezone.utc)):
+            LogInEvent.objects.create(auth_user=self.auth_user)
+            LogInEvent.objects.create(auth_user=self.auth_user)
+
+        path = self.export_dir / 'dump.jsonl'
+        self._export(path)
+
+        events = [json.loads(line) for line in path.read_text(encoding='utf-8').splitlines()]
+        self.assertEqual(
+            [event['event'] for event in events],
+            ['log-in', 'log-in', 'log-in', 'text-search', 'document-search', 'log-out'],
+        )
+
+    def test_export_continuing_from_the_cursor(self) -> None:
+        path = self.export_dir / 'dump.jsonl'
+        output = self._export(path, '--since', '2024-07-02T12:00:00')
+
+        events = [json.loads(line) for line in path.read_text(encoding='utf-8').splitlines()]
+        self.assertEqual([event['event'] for event in events], ['document-search', 'log-out'])
+
+        cursor = output.split('--since ')[-1].strip()
+        self._export(path, '--since', cursor)
+        self.assertEqual(path.read_text(encoding='utf-8'), '')
+
+        with _mock_time(datetime.now(timezone.utc)):
+            LogInEvent.objects.create(auth_user=self.auth_user)
+        with _mock_time(datetime.now(timezone.utc) + timedelta(minutes=2)):
+            self._export(path, '--since', cursor)
+        events = [json.loads(line) for line in path.read_text(encoding='utf-8').splitlines()]
+        self.assertEqual([event['event'] for event in events], ['log-in'])
+
+    def test_search_being_exported_once_it_has_finished(self) -> None:
+        path = self.export_dir / 'dump.jsonl'
+        with _mock_time(datetime(2024, 7, 5, tzinfo=timezone.utc)):
+            result = TextSearchQueryResult.objects.create(
+                conversation=self.text_conversation, user_input='Kas Kommionu paneb?'
+            )
+            task = TextTask.objects.create(result=result)
+        with _mock_time(datetime(2024, 7, 6, tzinfo=timezone.utc)):
+            output = self._export(path, '--since', '2024-07-04T12:00:00')
+        self.assertEqual(path.read_text(encoding='utf-8'), '')
+
+        with _mock_time(datetime(2024, 7, 7, tzinfo=timezone.utc)):
+            task.set_success()
+        with _mock_time(datetime(2024, 7, 8, tzinfo=timezone.utc)):
+            self._export(path, '--since', output.split('--since ')[-1].strip())
+        events = [json.loads(line) for line in path.read_text(encoding='utf-8').splitlines()]
+        self.assertEqual([event['event'] for event in events], ['text-search'])
+        self.assertEqual(events[0]['created_at'], '2024-07-05 00:00:00+00:00')
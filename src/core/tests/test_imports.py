@@ -0,0 +1,35 @@
+import os
+import subprocess
+import sys
+
+from django.conf import settings
+from django.test import SimpleTestCase
+
+MODEL_STACK = ('torch', 'transformers', 'FlagEmbedding', 'huggingface_hub')
+
+WEB_PROCESS_IMPORTS = f"""
+import sys
+
+import django
+
+django.setup()
+
+import api.urls
+
+print([module for module in {MODEL_STACK!r} if module in sys.modules])
+"""
+
+
+class TestImports(SimpleTestCase):
+    def test_web_process_not_importing_the_model_stack(self) -> None:
+        # Run in a fresh interpreter, as the test process may have imported anything by now.
+        process = subprocess.run(
+            [sys.executable, '-c', WEB_PROCESS_IMPORTS],
+            cwd=settings.BASE_DIR,
+            env={**os.environ, 'DJANGO_SETTINGS_MODULE': 'api.settings'},
+            capture_output=True,
+            text=True,
+            check=True,
+            timeout=120,
+        )
+        self.assertEqual(process.stdout.strip().splitlines()[-1], '[]')
@@ -0,0 +1,186 @@
+import time
+from typing import Any, Optional
+from unittest import mock
+
+import fakeredis
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.reverse import reverse
+from rest_framework.test import APITestCase
+
+from core.ledger import (
+    estimate_chat_cost,
+    get_used_cost,
+    release_budget,
+    reserve_budget,
+)
+from core.models import Dataset, UsageLedger
+from text_search.models import TextSearchConversation, TextSearchQueryResult, TextTask
+from user_profile.utilities import create_test_user_with_user_profile
+
+
+class FakeRedis:
+    """Keeps the values of the few commands the ledger caches the balance with."""
+
+    def __init__(self) -> None:
+        self.values: dict = {}
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self.values.get(key, None)
+
+    def set(self, key: str, value: Any, **_: Any) -> None:
+        self.values[key] = str(value).encode()
+
+    def incr(self, key: str) -> None:
+        self.values[key] = str(int(self.values.get(key, 0)) + 1).encode()
+
+    def hdel(self, *args: Any) -> None:
+        pass
+
+
+class TestUsageLedger(APITestCase):
+    def setUp(self) -> None:  # pylint: disable=invalid-name
+        self.auth_user = create_test_user_with_user_profile(
+            self, 'tester', 'tester@email.com', 'password', is_manager=False
+        )
+        self.conversation = TextSearchConversation.objects.create(
+            auth_user=self.auth_user, system_input='', title='Kommionu', dataset_names_string='a'
+        )
+        Dataset(name='a', type='', index='a_*', description='').save()
+
+    def _save_result(self, total_cost: float) -> None:
+        result = TextSearchQueryResult.objects.create(conversation=self.conversation)
+        TextTask.objects.create(result=result)
+        result.save_results(
+            {
+                'model': 'gpt-4o',
+                'user_input': '?',
+                'is_context_pruned': False,
+                'response': 'Kommionu paneb.',
+                'input_tokens': 100,
+                'output_tokens': 10,
+                'total_cost': total_cost,
+                'response_headers': {},
+                'references': [],
+            }
+        )
+
+    def test_stored_results_being_added_onto_the_monthly_bucket(self) -> None:
+        self._save_result(0.25)
+        self._save_result(0.5)
+
+        ledger = UsageLedger.objects.get(auth_user=self.auth_user)
+        self.assertEqual(ledger.cost, 0.75)
+        self.assertEqual(ledger.month.day, 1)
+
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(self.auth_user.user_profile.used_cost, 0.75)
+        # Only the ledger is summed, never the results.
+        self.assertEqual(len(context.captured_queries), 1)
+
+    def test_reservation_being_refused_over_the_limit(self) -> None:
+        profile = self.auth_user.user_profile
+        profile.custom_usage_limit_euros = 1.0
+        profile.save()
+
+        cost = estimate_chat_cost([], 'Kas Kommionu paneb?')
+        self.assertGreater(cost, 0)
+
+        self._save_result(1.0 - cost / 2)
+        self.assertFalse(reserve_budget(self.auth_user, 'kommionu', cost))
+        self.assertTrue(reserve_budget(self.auth_user, 'kommionu', cost / 4))
+
+    def test_leaked_reservation_expiring_while_others_keep_coming(self) -> None:
+        profile = self.auth_user.user_profile
+        profile.custom_usage_limit_euros = 1.0
+        profile.save()
+
+        def reserve_at(now: float, reservation_id: str, cost: float) -> bool:
+            # Only the clock of the ledger is moved, the reservations are stored in real time.
+            with mock.patch('core.ledger.time') as mock_time:
+                mock_time.monotonic = time.monotonic
+                mock_time.time.return_value = now
+                return reserve_budget(self.auth_user, reservation_id, cost)
+
+        with mock.patch(
+            'core.ledger._get_redis_client', return_value=fakeredis.FakeRedis()
+        ), mock.patch('core.ledger._REDIS_RETRY_AT', 0.0), self.settings(
+            SPEND_RESERVATION_TTL=1800
+        ):
+            # Never released, its task was killed.
+            self.assertTrue(reserve_at(0, 'leaked', 0.6))
+            for now in range(600, 1800, 600):
+                self.assertFalse(reserve_at(now, 'kommionu', 0.6))
+                self.assertTrue(reserve_at(now, 'kommionu', 0.3))
+                release_budget(self.auth_user.pk, 'kommionu')
+
+            self.assertTrue(reserve_at(1800, 'kommionu', 0.6))
+
+    def test_batch_reservation_outliving_the_reservations_around_it(self) -> None:
+        profile = self.auth_user.user_profile
+        profile.custom_usage_limit_euros = 1.0
+        profile.save()
+
+        def reserve_at(now: float, reservation_id: str, cost: float, **kwargs: Any) -> bool:
+            with mock.patch('core.ledger.time') as mock_time:
+                mock_time.monotonic = time.monotonic
+                mock_time.time.return_value = now
+                return reserve_budget(self.auth_user, reservation_id, cost, **kwargs)
+
+        with mock.patch(
+            'core.ledger._get_redis_client', return_value=fakeredis.FakeRedis()
+        ), mock.patch('core.ledger._REDIS_RETRY_AT', 0.0), self.settings(
+            SPEND_RESERVATION_TTL=1800
+        ):
+            self.assertTrue(reserve_at(0, 'batch', 0.6, ttl=90000))
+            # The batch holds its share of the budget through the whole completion window.
+            self.assertFalse(reserve_at(3600, 'kommionu', 0.6))
+            self.assertTrue(reserve_at(3600, 'kommionu', 0.3))
+            self.assertFalse(reserve_at(86400, 'kommionu_2', 0.6))
+            self.assertTrue(reserve_at(90000, 'kommionu_2', 0.6))
+
+    def test_estimate_covering_the_conversation_so_far(self) -> None:
+        self._save_result(0.1)
+        messages = self.conversation.messages
+        self.assertEqual(len(messages), 3)
+
+        first_cost = estimate_chat_cost([], 'Kas Kommionu paneb?')
+        follow_up_cost = estimate_chat_cost(messages * 100, 'Kas Kommionu paneb?')
+        self.assertGreater(follow_up_cost, first_cost)
+
+    def test_balance_summed_before_a_spend_not_outliving_it(self) -> None:
+        redis_client = FakeRedis()
+
+        def sum_while_spending(_auth_user_id: int) -> float:
+            # The spend is committed after the ledger was summed, but before the sum is cached.
+            with self.captureOnCommitCallbacks(execute=True):
+                self._save_result(0.5)
+            return 0.0
+
+        with mock.patch('core.ledger._get_redis_client', return_value=redis_client), mock.patch(
+            'core.ledger._REDIS_RETRY_AT', 0.0
+        ):
+            with mock.patch('core.ledger._sum_ledger', side_effect=sum_while_spending):
+                self.assertEqual(get_used_cost(self.auth_user.pk), 0.0)
+
+            self.assertEqual(get_used_cost(self.auth_user.pk), 0.5)
+            # Cached from now on.
+            with mock.patch('core.ledger._sum_ledger') as mock_sum:
+                self.assertEqual(get_used_cost(self.auth_user.pk), 0.5)
+            mock_sum.assert_not_called()
+
+    def test_chat_being_refused_when_the_reservation_fails(self) -> None:
+        token, _ = Token.objects.get_or_create(user=self.auth_user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        chat_url = reverse('v1:text_search-chat', kwargs={'pk': self.conversation.pk})
+
+        with mock.patch('text_search.views.reserve_budget', return_value=False), mock.patch(
+            'text_search.serializers.async_call_celery_task_chain'
+        ) as mock_chain:
+            response = self.client.post(chat_url, data={'user_input': 'Kas Kommionu paneb?'})
+
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        mock_chain.assert_not_called()
+        self.assertFalse(TextSearchQueryResult.objects.exists())
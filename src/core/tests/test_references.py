@@ -0,0 +1,77 @@
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APITestCase
+
+from core.models import Dataset
+from text_search.models import (
+    TextSearchConversation,
+    TextSearchQueryResult,
+    TextSearchReference,
+    TextTask,
+)
+from user_profile.utilities import create_test_user_with_user_profile
+
+
+class TestReferenceRows(APITestCase):
+    def setUp(self) -> None:  # pylint: disable=invalid-name
+        auth_user = create_test_user_with_user_profile(
+            self, 'tester', 'tester@email.com', 'password'
+        )
+        self.conversation = TextSearchConversation.objects.create(
+            auth_user=auth_user, system_input='', dataset_names_string='a'
+        )
+        self.dataset = Dataset.objects.create(name='a', type='', index='a_*', description='')
+        self.references = [
+            {'id': '1', 'index': 'a_1', 'parent': 'p1', 'year': 2020},
+            {'id': '2', 'index': 'b_1', 'year': '2021'},
+            {'id': '3', 'index': 'a_2', 'parent': 'p1', 'year': None},
+        ]
+
+    def test_references_being_stored_as_rows(self) -> None:
+        result = TextSearchQueryResult.objects.create(
+            conversation=self.conversation, references=self.references
+        )
+
+        rows = list(result.reference_rows.values_list('document_id', 'parent', 'year', 'dataset'))
+        self.assertEqual(
+            rows,
+            [
+                ('1', 'p1', 2020, self.dataset.pk),
+                ('2', '', 2021, None),
+                ('3', 'p1', None, self.dataset.pk),
+            ],
+        )
+
+    def test_rows_following_the_answer(self) -> None:
+        result = TextSearchQueryResult.objects.create(
+            conversation=self.conversation, references=self.references
+        )
+        TextTask.objects.create(result=result)
+        result = TextSearchQueryResult.objects.get(pk=result.pk)
+
+        # Changing something else leaves the rows be.
+        with CaptureQueriesContext(connection) as context:
+            result.user_input = '?'
+            result.save()
+        self.assertEqual(len(context.captured_queries), 1)
+
+        references = result.references
+        for index, reference in enumerate(references):
+            reference['used_by_gpt'] = index == 0
+        result.save_results(
+            {
+                'model': 'gpt-4o',
+                'user_input': '?',
+                'is_context_pruned': False,
+                'response': 'Kommionu paneb.',
+                'input_tokens': 100,
+                'output_tokens': 10,
+                'total_cost': 0.01,
+                'response_headers': {},
+                'references': references,
+            }
+        )
+
+        rows = TextSearchReference.objects.filter(result=result)
+        self.assertEqual(rows.count(), 3)
+        self.assertEqual(list(rows.values_list('used_by_gpt', flat=True)), [True, False, False])
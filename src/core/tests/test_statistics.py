@@ -7,7 +7,7 @@ from rest_framework.authtoken.models import Token
 from rest_framework.reverse import reverse
 from rest_framework.test import APITestCase
 
-from api.utilities.testing import IsType
+from api.utilities.testing import IsType, use_temporary_directory
 from core.models import Dataset
 from core.pdf import _build_statistics_context
 from document_search.models import DocumentSearchConversation, DocumentSearchQueryResult
@@ -26,6 +26,8 @@ class TestStatistics(APITestCase):
         cls.statistics_endpoint_url = reverse('v1:statistics')
 
     def setUp(self) -> None:  # pylint: disable=invalid-name
+        use_temporary_directory(self, 'CHART_CACHE_DIR', 'STATISTICS_CACHE_DIR')
+
         self.year = 2024
         self.month = 7
         self.input_data = {
@@ -0,0 +1,107 @@
+from datetime import datetime, timezone
+from io import BytesIO
+from unittest import mock
+
+from django.test import override_settings
+from rest_framework.test import APITestCase
+
+from api.utilities.testing import use_temporary_directory
+from core.pdf_cache import get_statistics_pdf_path, open_statistics_pdf
+from core.tasks import generate_statistics_pdf
+from text_search.models import TextSearchConversation, TextSearchQueryResult, TextTask
+from user_profile.utilities import create_test_user_with_user_profile
+
+
+def _mock_time(replacement: datetime):  # type: ignore
+    return mock.patch('django.utils.timezone.now', return_value=replacement)
+
+
+def _mock_rendering():  # type: ignore
+    return mock.patch(
+        'core.pdf_cache.get_statistics_pdf_file_bytes', side_effect=lambda *_: BytesIO(b'%PDF')
+    )
+
+
+class TestStatisticsCache(APITestCase):
+    def setUp(self) -> None:  # pylint: disable=invalid-name
+        use_temporary_directory(self, 'STATISTICS_CACHE_DIR')
+
+        self.july = datetime(year=2024, month=7, day=15, tzinfo=timezone.utc)
+        with _mock_time(self.july):
+            auth_user = create_test_user_with_user_profile(
+                self, 'tester', 'tester@email.com', 'password'
+            )
+        self.conversation = TextSearchConversation.objects.create(
+            auth_user=auth_user, system_input=''
+        )
+
+    def _create_result(self) -> TextSearchQueryResult:
+        with _mock_time(self.july):
+            result = TextSearchQueryResult.objects.create(conversation=self.conversation)
+        TextTask.objects.create(result=result)
+        return result
+
+    def test_closed_month_being_generated_once(self) -> None:
+        result = self._create_result()
+
+        with _mock_rendering() as mock_render:
+            path = get_statistics_pdf_path(2024, 7)
+            self.assertEqual(get_statistics_pdf_path(2024, 7), path)
+        mock_render.assert_called_once_with(2024, 7)
+
+        # A late result has the month rolled up and generated again.
+        result.save_results(
+            {
+                'model': 'gpt-4o',
+                'user_input': '?',
+                'is_context_pruned': False,
+                'response': 'Kommionu paneb.',
+                'input_tokens': 100,
+                'output_tokens': 10,
+                'total_cost': 0.01,
+                'response_headers': {},
+                'references': [],
+            }
+        )
+        with _mock_rendering() as mock_render:
+            new_path = get_statistics_pdf_path(2024, 7)
+        mock_render.assert_called_once()
+        self.assertNotEqual(new_path, path)
+        self.assertFalse(path.exists())
+
+    def test_ongoing_month_being_cached_for_a_while(self) -> None:
+        now = datetime.now(timezone.utc)
+
+        with _mock_rendering() as mock_render:
+            get_statistics_pdf_path(now.year, now.month)
+            get_statistics_pdf_path(now.year, now.month)
+        mock_render.assert_called_once()
+
+        with override_settings(STATISTICS_LIVE_TTL=0), _mock_rendering() as mock_render:
+            get_statistics_pdf_path(now.year, now.month)
+        mock_render.assert_called_once()
+
+    def test_file_removed_before_being_opened(self) -> None:
+        self._create_result()
+        with _mock_rendering():
+            path = get_statistics_pdf_path(2024, 7)
+        removed_path = path.with_name('statistics_2024_07-removed.pdf')
+
+        with mock.patch('core.pdf_cache.get_statistics_pdf_path', side_effect=[removed_path, path]):
+            with open_statistics_pdf(2024, 7) as pdf_file:
+                self.assertEqual(pdf_file.read(), b'%PDF')
+
+        with mock.patch(
+            'core.pdf_cache.get_statistics_pdf_path', return_value=removed_path
+        ), _mock_rendering() as mock_render:
+            with open_statistics_pdf(2024, 7) as pdf_file:
+                self.assertEqual(pdf_file.read(), b'%PDF')
+        mock_render.assert_called_once_with(2024, 7)
+
+    def test_task_generating_the_month_that_ended(self) -> None:
+        with mock.patch('core.tasks.get_statistics_pdf_path') as mock_generate, mock.patch(
+            'core.tasks.datetime'
+        ) as mock_datetime:
+            mock_datetime.now.return_value = datetime(2024, 8, 1, 4, tzinfo=timezone.utc)
+            generate_statistics_pdf()
+        mock_generate.assert_called_once_with(2024, 7)
@@ -0,0 +1,97 @@
+import json
+from unittest import mock
+
+import redis
+from django.test import override_settings
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.reverse import reverse
+from rest_framework.test import APITestCase
+
+from core.notifications import get_task_channel
+from text_search.models import TextSearchConversation, TextSearchQueryResult, TextTask
+from user_profile.utilities import create_test_user_with_user_profile
+
+
+class TestTaskEvents(APITestCase):
+    def setUp(self) -> None:  # pylint: disable=invalid-name
+        self.auth_user = create_test_user_with_user_profile(
+            self, 'tester', 'tester@email.com', 'password', is_manager=False
+        )
+        conversation = TextSearchConversation.objects.create(
+            auth_user=self.auth_user, system_input='', title='Kommionu', dataset_names_string='a'
+        )
+        self.result = TextSearchQueryResult.objects.create(conversation=conversation)
+        self.task = TextTask.objects.create(result=self.result)
+
+        token, _ = Token.objects.get_or_create(user=self.auth_user)
+        self.headers = {'Authorization': f'Token {token.key}'}
+        self.endpoint_url = reverse('v1:task_events')
+
+    def test_transitions_being_published_onto_the_user_channel(self) -> None:
+        mock_client = mock.MagicMock()
+        with mock.patch(
+            'core.notifications._get_redis_client', return_value=mock_client
+        ), mock.patch('core.notifications._REDIS_RETRY_AT', 0.0):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.task.set_failed('Kommionu is out of jam!')
+
+        pipeline = mock_client.pipeline.return_value.__enter__.return_value
+        channels = [call.args[0] for call in pipeline.publish.call_args_list]
+        self.assertEqual(channels, [get_task_channel(self.task), f'rk:user:{self.auth_user.pk}'])
+
+        event = json.loads(pipeline.publish.call_args_list[1].args[1])
+        self.assertEqual(event['uuid'], str(self.result.uuid))
+        self.assertEqual(event['status'], self.task.status)
+        self.assertEqual(event['error'], 'Kommionu is out of jam!')
+
+    async def test_events_being_streamed(self) -> None:
+        message = {'type': 'message', 'data': json.dumps({'status': 'SUCCESS'}).encode()}
+        mock_pubsub = mock.AsyncMock()
+        mock_pubsub.get_message.side_effect = [message]
+        mock_client = mock.AsyncMock()
+        mock_client.pubsub = mock.Mock(return_value=mock_pubsub)
+
+        with mock.patch('redis.asyncio.Redis.from_url', return_value=mock_client):
+            response = await self.async_client.get(self.endpoint_url, headers=self.headers)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(response['Content-Type'], 'text/event-stream')
+
+            chunks = aiter(response.streaming_content)
+            self.assertTrue((await anext(chunks)).startswith(b'retry: '))
+            self.assertEqual(await anext(chunks), b'event: ready\ndata: {}\n\n')
+            self.assertEqual(await anext(chunks), b'event: task\ndata: {"status": "SUCCESS"}\n\n')
+
+        mock_pubsub.subscribe.assert_awaited_once_with(f'rk:user:{self.auth_user.pk}')
+
+    async def test_stream_being_refused(self) -> None:
+        response = await self.async_client.get(self.endpoint_url)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+        mock_client = mock.AsyncMock()
+        mock_client.pubsub = mock.Mock(return_value=mock.AsyncMock())
+        mock_client.pubsub.return_value.subscribe.side_effect = redis.ConnectionError()
+        with mock.patch('redis.asyncio.Redis.from_url', return_value=mock_client):
+            response = await self.async_client.get(self.endpoint_url, headers=self.headers)
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+
+    async def test_stream_being_opened_with_a_query_string_token(self) -> None:
+        token_url = reverse('v1:task_events_token')
+        response = await self.async_client.post(token_url, headers=self.headers)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        token = response.json()['token']
+
+        mock_client = mock.AsyncMock()
+        mock_client.pubsub = mock.Mock(return_value=mock.AsyncMock())
+        with mock.patch('redis.asyncio.Redis.from_url', return_value=mock_client):
+            response = await self.async_client.get(self.endpoint_url, {'token': token})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        mock_client.pubsub.return_value.subscribe.assert_awaited_once_with(
+            f'rk:user:{self.auth_user.pk}'
+        )
+
+        response = await self.async_client.get(self.endpoint_url, {'token': f'{token}x'})
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        with override_settings(TASK_EVENTS_TOKEN_MAX_AGE=-1):
+            response = await self.async_client.get(self.endpoint_url, {'token': token})
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
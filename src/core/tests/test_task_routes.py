@@ -0,0 +1,30 @@
+from django.conf import settings
+from django.test import TestCase
+
+from api.celery_handler import app
+
+
+class TestTaskRoutes(TestCase):
+    def test_every_application_task_being_routed_to_a_queue(self) -> None:
+        app.loader.import_default_modules()
+        task_names = {
+            name
+            for name in app.tasks
+            if not name.startswith('celery.') and name != 'api.celery_handler.debug_task'
+        }
+
+        self.assertEqual(task_names, set(settings.CELERY_TASK_ROUTES))
+
+    def test_vectorizing_tasks_not_landing_on_io_queue(self) -> None:
+        app.loader.import_default_modules()
+        for task_name, task in app.tasks.items():
+            route = settings.CELERY_TASK_ROUTES.get(task_name, {})
+            if route.get('queue') == settings.CELERY_IO_QUEUE:
+                self.assertNotIn('vectorizer', dir(task), task_name)
+
+    def test_database_heavy_tasks_not_landing_on_io_queue(self) -> None:
+        # A gevent pool can't switch to other tasks while a query runs.
+        self.assertEqual(
+            settings.CELERY_TASK_ROUTES['refresh_usage_rollups'],
+            {'queue': settings.CELERY_EMBED_QUEUE},
+        )
@@ -0,0 +1,90 @@
+import uuid
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+from unittest import mock
+
+from asgiref.sync import sync_to_async
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.reverse import reverse
+from rest_framework.test import APITestCase
+
+from core.choices import TaskStatus
+from text_search.models import TextSearchConversation, TextSearchQueryResult, TextTask
+from user_profile.utilities import create_test_user_with_user_profile
+
+
+class TestTaskStatus(APITestCase):
+    def setUp(self) -> None:  # pylint: disable=invalid-name
+        self.auth_user = create_test_user_with_user_profile(
+            self, 'tester', 'tester@email.com', 'password', is_manager=False
+        )
+        self.other_auth_user = create_test_user_with_user_profile(
+            self, 'tester2', 'tester2@email.com', 'password', is_manager=False
+        )
+
+        conversation = TextSearchConversation.objects.create(
+            auth_user=self.auth_user, system_input='', title='Kommionu', dataset_names_string='a'
+        )
+        self.result = TextSearchQueryResult.objects.create(conversation=conversation)
+        self.task = TextTask.objects.create(result=self.result)
+        self.endpoint_url = reverse('v1:task_status', kwargs={'result_uuid': self.result.uuid})
+
+        self._authenticate(self.auth_user)
+
+    def _authenticate(self, auth_user: object) -> None:
+        token, _ = Token.objects.get_or_create(user=auth_user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+
+    def test_status_being_returned_with_etag(self) -> None:
+        response = self.client.get(self.endpoint_url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['status'], TaskStatus.PENDING)
+        self.assertEqual(
+            set(response.json()), {'uuid', 'status', 'error', 'created_at', 'modified_at'}
+        )
+        etag = response.headers['ETag']
+
+        response = self.client.get(self.endpoint_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        self.task.set_success()
+
+        response = self.client.get(self.endpoint_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['status'], TaskStatus.SUCCESS)
+        self.assertNotEqual(response.headers['ETag'], etag)
+
+    def test_long_poll_returning_on_transition(self) -> None:
+        etag = self.client.get(self.endpoint_url).headers['ETag']
+
+        @asynccontextmanager
+        async def subscribe_to_task(_task: TextTask) -> AsyncIterator:
+            async def wait(_timeout: float) -> bool:
+                # Simulates the worker finishing the task while the request waits.
+                task = await TextTask.objects.aget(pk=self.task.pk)
+                await sync_to_async(task.set_failed)('Kommionu is out of jam!')
+                return True
+
+            yield wait
+
+        with mock.patch('core.views.subscribe_to_task', subscribe_to_task):
+            response = self.client.get(f'{self.endpoint_url}?wait=10', HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['status'], TaskStatus.FAILURE)
+        self.assertEqual(response.json()['error'], 'Kommionu is out of jam!')
+
+    def test_long_poll_without_redis_not_waiting(self) -> None:
+        etag = self.client.get(self.endpoint_url).headers['ETag']
+
+        response = self.client.get(f'{self.endpoint_url}?wait=10', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_someone_elses_or_unknown_results_not_being_found(self) -> None:
+        unknown_url = reverse('v1:task_status', kwargs={'result_uuid': uuid.uuid4()})
+        self.assertEqual(self.client.get(unknown_url).status_code, status.HTTP_404_NOT_FOUND)
+
+        self._authenticate(self.other_auth_user)
+        response = self.client.get(self.endpoint_url)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
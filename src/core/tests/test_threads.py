@@ -0,0 +1,77 @@
+import os
+from io import StringIO
+from unittest import mock
+
+import celery
+import torch
+from django.core.management import call_command
+from django.test import SimpleTestCase, override_settings
+
+from core import threads
+from core.base_task import ResourceTask
+from text_search.tasks import prepare_text_search_batch
+
+
+class FakeVectorizer:
+    def vectorize(self, texts: list) -> dict:
+        vectors = torch.ones(len(texts), 64) @ torch.ones(64, 64)
+        return {'vectors': vectors}
+
+
+class TestThreads(SimpleTestCase):
+    def setUp(self) -> None:  # pylint: disable=invalid-name
+        self.addCleanup(torch.set_num_threads, torch.get_num_threads())
+        self.addCleanup(setattr, threads, '_THREAD_COUNT', None)
+        environment_patcher = mock.patch.dict(os.environ)
+        environment_patcher.start()
+        self.addCleanup(environment_patcher.stop)
+
+    def test_cores_being_split_between_the_processes(self) -> None:
+        with mock.patch('core.threads.get_cpu_count', return_value=8):
+            self.assertEqual(threads.get_thread_count(concurrency=3), 2)
+            self.assertEqual(threads.get_thread_count(concurrency=16), 1)
+            with override_settings(TORCH_THREADS=3):
+                self.assertEqual(threads.get_thread_count(concurrency=3), 3)
+
+    def test_worker_processes_getting_their_thread_count(self) -> None:
+        with mock.patch('core.threads.get_cpu_count', return_value=8):
+            threads.configure_worker(concurrency=4)
+
+        self.assertEqual(os.environ['OMP_NUM_THREADS'], '2')
+        self.assertEqual(os.environ['MKL_NUM_THREADS'], '2')
+
+        threads.apply_thread_limit()
+        self.assertEqual(torch.get_num_threads(), 2)
+
+    def test_task_running_on_its_own_thread_count(self) -> None:
+        torch.set_num_threads(1)
+
+        def run(*_args: object, **_kwargs: object) -> int:
+            return torch.get_num_threads()
+
+        with mock.patch.object(prepare_text_search_batch, 'torch_threads', 2), mock.patch.object(
+            celery.Task, '__call__', side_effect=run
+        ):
+            self.assertEqual(ResourceTask.__call__(prepare_text_search_batch), 2)
+        self.assertEqual(torch.get_num_threads(), 1)
+
+    def test_benchmark_reporting_the_throughput(self) -> None:
+        stdout = StringIO()
+        with mock.patch('core.warmup.get_vectorizer'), mock.patch(
+            'core.management.commands.benchmark_threads.get_vectorizer',
+            return_value=FakeVectorizer(),
+        ), mock.patch('gc.freeze'):
+            call_command(
+                'benchmark_threads',
+                '--concurrency',
+                '1',
+                '2',
+                '--threads',
+                '1',
+                '--rounds',
+                '2',
+                stdout=stdout,
+            )
+
+        rows = stdout.getvalue().splitlines()[2:]
+        self.assertEqual([row.split()[:2] for row in rows], [['1', '1'], ['2', '1']])
@@ -0,0 +1,86 @@
+import tempfile
+
+from django.test import TestCase, override_settings
+from rest_framework import status
+from rest_framework.reverse import reverse
+from rest_framework.test import APITestCase
+
+from api.utilities.testing import create_test_user
+from core.choices import TaskStatus
+from core.timings import bind_task_model, start_timer, stop_timer, time_stage
+from health.tasks import refresh_health_snapshot
+from text_search.models import TextSearchConversation, TextSearchQueryResult, TextTask
+from user_profile.utilities import create_test_user_with_user_profile
+
+
+def _create_text_task(test_case: TestCase) -> TextTask:
+    auth_user = create_test_user_with_user_profile(
+        test_case, 'tester', 'tester@email.com', 'password', is_manager=False
+    )
+    conversation = TextSearchConversation.objects.create(
+        auth_user=auth_user, system_input='', title='Kommionu', dataset_names_string='a'
+    )
+    result = TextSearchQueryResult.objects.create(conversation=conversation, user_input='?')
+    return TextTask.objects.create(result=result)
+
+
+class TestTimings(APITestCase):
+    def test_stage_timings_being_added_onto_the_bound_task(self) -> None:
+        task = _create_text_task(self)
+
+        # First task of a chain.
+        start_timer(queue_wait=0.5)
+        bind_task_model(task)
+        with time_stage('embedding'):
+            pass
+        stop_timer()
+
+        # Second task of a chain.
+        start_timer(queue_wait=0.25)
+        bind_task_model(TextTask.objects.get(pk=task.pk))
+        with time_stage('llm'):
+            pass
+        stop_timer()
+
+        task.refresh_from_db()
+        self.assertEqual(set(task.timings), {'queue_wait', 'embedding', 'llm'})
+        self.assertAlmostEqual(task.timings['queue_wait'], 0.75)
+
+    def test_stages_outside_of_tasks_not_being_recorded(self) -> None:
+        task = _create_text_task(self)
+
+        bind_task_model(task)
+        with time_stage('llm'):
+            pass
+
+        task.refresh_from_db()
+        self.assertEqual(task.timings, {})
+
+    def test_metrics_and_latencies_being_exposed(self) -> None:
+        task = _create_text_task(self)
+        start_timer(queue_wait=0.1)
+        bind_task_model(task)
+        stop_timer()
+        task.set_success()
+        self.assertEqual(task.status, TaskStatus.SUCCESS)
+
+        response = self.client.get(reverse('v1:metrics'))
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+        self.client.force_authenticate(task.result.conversation.auth_user)
+        response = self.client.get(reverse('v1:metrics'))
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+        self.client.force_authenticate(create_test_user('admin', 'admin@email.com', 'p', True))
+        response = self.client.get(reverse('v1:metrics'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn(b'rk_pipeline_stage_seconds_bucket', response.content)
+
+        with tempfile.TemporaryDirectory() as snapshot_dir, override_settings(
+            HEALTH_SNAPSHOT_PATH=f'{snapshot_dir}/health.json'
+        ):
+            refresh_health_snapshot()
+            response = self.client.get(reverse('v1:health'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        latency = response.data['api']['latency']['TextTask']
+        self.assertEqual(latency['queue_wait'], {'p50': 0.1, 'p95': 0.1})
@@ -0,0 +1,123 @@
+from collections import Counter
+from datetime import date, datetime, timezone
+from unittest import mock
+
+from django.db import connection
+from django.db.models import QuerySet
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APITestCase
+
+from api.utilities.testing import use_temporary_directory
+from core.models import Dataset, UsageRollup
+from core.pdf import _build_statistics_context
+from core.rollups import _count_years
+from core.tasks import refresh_usage_rollups
+from text_search.models import TextSearchConversation, TextSearchQueryResult, TextTask
+from user_profile.utilities import create_test_user_with_user_profile
+
+
+def _mock_time(replacement: datetime):  # type: ignore
+    return mock.patch('django.utils.timezone.now', return_value=replacement)
+
+
+class TestUsageRollups(APITestCase):
+    def setUp(self) -> None:  # pylint: disable=invalid-name
+        use_temporary_directory(self, 'CHART_CACHE_DIR')
+
+        self.june = datetime(year=2024, month=6, day=30, hour=23, tzinfo=timezone.utc)
+        self.july = datetime(year=2024, month=7, day=1, tzinfo=timezone.utc)
+
+        with _mock_time(self.june):
+            self.auth_user = create_test_user_with_user_profile(
+                self, 'tester', 'tester@email.com', 'password'
+            )
+        self.conversation = TextSearchConversation.objects.create(
+            auth_user=self.auth_user,
+            system_input='',
+            min_year=2020,
+            max_year=2021,
+            dataset_names_string='a',
+        )
+        Dataset(name='a', type='', index='a_*', description='').save()
+
+    def _create_result(self, moment: datetime) -> TextSearchQueryResult:
+        with _mock_time(moment):
+            result = TextSearchQueryResult.objects.create(
+                conversation=self.conversation,
+                total_cost=0.01,
+                references=[{'year': 2021, 'index': 'a_1'}],
+            )
+        TextTask.objects.create(result=result)
+        return result
+
+    def test_closed_months_being_read_from_the_rollups(self) -> None:
+        self._create_result(self.june)
+        self._create_result(self.july)
+
+        context = _build_statistics_context(2024, 7)
+        self.assertEqual(UsageRollup.objects.count(), 2)
+        # The last hour of June is not counted into July.
+        self.assertEqual(context['query_count_month'], 1)
+        self.assertEqual(context['query_count_total'], 2)
+        self.assertEqual(context['user_with_query_count_total'], 1)
+        self.assertEqual(context['query_count_per_conversation_total'], 2.0)
+        self.assertEqual(context['year_usage_total_counts'], {2020: 2, 2021: 2})
+        self.assertEqual(context['dataset_reference_total_counts'], {'a': 2})
+
+        with CaptureQueriesContext(connection) as queries:
+            context = _build_statistics_context(2024, 7)
+        # The first rollup and the rollups up to the month.
+        self.assertEqual(len(queries.captured_queries), 2)
+        self.assertEqual(context['query_count_total'], 2)
+
+    def test_late_results_marking_their_month_stale(self) -> None:
+        result = self._create_result(self.june)
+        _build_statistics_context(2024, 6)
+        self.assertFalse(UsageRollup.objects.get(month=date(2024, 6, 1)).is_stale)
+
+        result.save_results(
+            {
+                'model': 'gpt-4o',
+                'user_input': '?',
+                'is_context_pruned': False,
+                'response': 'Kommionu paneb.',
+                'input_tokens': 100,
+                'output_tokens': 10,
+                'total_cost': 0.5,
+                'response_headers': {},
+                'references': [],
+            }
+        )
+        self.assertTrue(UsageRollup.objects.get(month=date(2024, 6, 1)).is_stale)
+
+        context = _build_statistics_context(2024, 6)
+        self.assertEqual(context['cost_month'], 0.5)
+        self.assertFalse(UsageRollup.objects.get(month=date(2024, 6, 1)).is_stale)
+
+    def test_results_stored_during_a_build_keeping_the_month_stale(self) -> None:
+        result = self._create_result(self.june)
+        _build_statistics_context(2024, 6)
+        UsageRollup.mark_stale(result.created_at)
+
+        def count_years(queryset: QuerySet, counter: Counter) -> None:
+            # A late result lands after the build has already read the results of its month.
+            UsageRollup.mark_stale(result.created_at)
+            _count_years(queryset, counter)
+
+        with mock.patch('core.rollups._count_years', side_effect=count_years):
+            _build_statistics_context(2024, 6)
+        self.assertTrue(UsageRollup.objects.get(month=date(2024, 6, 1)).is_stale)
+
+        _build_statistics_context(2024, 6)
+        self.assertFalse(UsageRollup.objects.get(month=date(2024, 6, 1)).is_stale)
+
+    def test_refresh_task_building_every_month(self) -> None:
+        self._create_result(self.june)
+
+        refresh_usage_rollups()
+
+        months = list(UsageRollup.objects.order_by('month').values_list('month', flat=True))
+        current_month = datetime.now(timezone.utc).date().replace(day=1)
+        self.assertEqual(months[0], date(2024, 6, 1))
+        self.assertEqual(months[-1], current_month)
+        self.assertTrue(all(not rollup.is_stale for rollup in UsageRollup.objects.all()))
@@ -0,0 +1,119 @@
+import tempfile
+from types import SimpleNamespace
+from unittest import mock
+
+from django.test import override_settings
+from rest_framework import status
+from rest_framework.reverse import reverse
+from rest_framework.test import APITestCase
+
+from api import celery_handler
+from api.utilities.vectorizer import Vectorizer
+from core import base_task, warmup
+from core.base_task import ResourceTask
+from health.tasks import refresh_health_snapshot
+
+
+class TestWarmup(APITestCase):
+    def setUp(self) -> None:  # pylint: disable=invalid-name
+        redis_patcher = mock.patch('core.warmup._get_redis_client')
+        self.redis_client = redis_patcher.start().return_value
+        self.addCleanup(redis_patcher.stop)
+
+    def test_warm_worker_being_marked_ready(self) -> None:
+        with mock.patch('core.warmup.get_vectorizer') as mock_get_vectorizer, mock.patch(
+            'threading.Thread'
+        ) as mock_thread, override_settings(WORKER_READINESS_TTL=30):
+            warmup.warm_up_worker()
+
+        mock_get_vectorizer.return_value.vectorize.assert_called_once_with(warmup.WARMUP_TEXTS)
+        key = self.redis_client.set.call_args.args[0]
+        self.assertTrue(key.startswith(warmup.READY_KEY_PREFIX))
+        self.assertEqual(self.redis_client.set.call_args.kwargs, {'ex': 30})
+        mock_thread.return_value.start.assert_called_once()
+
+    def test_failed_warmup_not_marking_ready(self) -> None:
+        with mock.patch('core.warmup.get_vectorizer', side_effect=FileNotFoundError):
+            warmup.warm_up_worker()
+
+        self.redis_client.set.assert_not_called()
+
+    def test_tasks_sharing_the_vectorizer(self) -> None:
+        self.addCleanup(setattr, base_task, '_VECTORIZER', None)
+        with mock.patch('api.utilities.vectorizer.Vectorizer.load_model_interface') as mock_load:
+            first_vectorizer = ResourceTask().vectorizer
+            second_vectorizer = ResourceTask().vectorizer
+
+        self.assertIs(first_vectorizer, second_vectorizer)
+        mock_load.assert_called_once()
+
+    def test_health_reporting_the_warm_workers(self) -> None:
+        self.redis_client.scan_iter.return_value = [b'rk:workers:ready:host:1']
+        self.redis_client.mget.return_value = [b'1720000000.5']
+
+        with mock.patch(
+            'health.utils.WORKER_WARMUP', True
+        ), tempfile.TemporaryDirectory() as snapshot_dir, override_settings(
+            HEALTH_SNAPSHOT_PATH=f'{snapshot_dir}/health.json'
+        ):
+            refresh_health_snapshot()
+            response = self.client.get(reverse('v1:health'))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['workers']['warm_count'], 1)
+        self.assertEqual(
+            response.data['workers']['warm_workers'],
+            [{'name': 'host:1', 'warm_since': 1720000000.5}],
+        )
+
+    def test_shared_model_being_loaded_only_by_the_embed_worker(self) -> None:
+        def worker(pool: str, queues: list) -> SimpleNamespace:
+            return SimpleNamespace(
+                pool_cls=pool,
+                concurrency=2,
+                app=SimpleNamespace(
+                    amqp=SimpleNamespace(queues=SimpleNamespace(consume_from=queues))
+                ),
+            )
+
+        with mock.patch('core.warmup.load_shared_model') as mock_load, mock.patch(
+            'core.threads.configure_worker'
+        ) as mock_configure, override_settings(
+            WORKER_SHARED_MODEL=True, CELERY_EMBED_QUEUE='embed'
+        ):
+            celery_handler.set_up_embed_worker(sender=worker('threads', ['io']))
+            celery_handler.set_up_embed_worker(sender=worker('prefork', ['io']))
+            mock_load.assert_not_called()
+            mock_configure.assert_not_called()
+
+            celery_handler.set_up_embed_worker(sender=worker('prefork', ['embed', 'celery']))
+            mock_load.assert_called_once()
+            mock_configure.assert_called_once_with(2)
+
+    def test_shared_model_being_frozen_before_fork(self) -> None:
+        # pylint: disable=import-outside-toplevel
+        import torch
+
+        self.addCleanup(torch.set_num_threads, torch.get_num_threads())
+
+        with mock.patch('core.warmup.get_vectorizer') as mock_get_vectorizer, mock.patch(
+            'gc.freeze'
+        ) as mock_freeze:
+            warmup.load_shared_model()
+
+        mock_get_vectorizer.return_value.freeze.assert_called_once()
+        mock_get_vectorizer.return_value.vectorize.assert_not_called()
+        mock_freeze.assert_called_once()
+        self.assertEqual(torch.get_num_threads(), 1)
+
+    def test_frozen_weights_not_requiring_gradients(self) -> None:
+        # pylint: disable=import-outside-toplevel
+        import torch
+
+        vectorizer = Vectorizer('model', {}, {}, model_directory=mock.MagicMock())
+        vectorizer.model_interface = SimpleNamespace(model=torch.nn.Linear(2, 2).train())
+        vectorizer.freeze()
+
+        model = vectorizer.model_interface.model
+        self.assertFalse(model.training)
+        self.assertFalse(any(parameter.requires_grad for parameter in model.parameters()))
@@ -0,0 +1,73 @@
+import contextlib
+import logging
+import os
+import sys
+from typing import Iterator, Optional
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Left alone, torch runs every process on as many threads as there are cores, so the processes
+# of the embed worker oversubscribe the node as soon as several of them encode at once. Each
+# process gets its share of the cores instead, the variables are read by OpenMP and MKL when
+# torch is imported and torch.set_num_threads covers processes which imported it before.
+THREAD_ENVIRONMENT_VARIABLES = ('OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS')
+
+_THREAD_COUNT: Optional[int] = None
+
+
+def get_cpu_count() -> int:
+    try:
+        # The cores the process may run on, which can be fewer than the node has.
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def get_thread_count(concurrency: int) -> int:
+    if settings.TORCH_THREADS:
+        return settings.TORCH_THREADS
+    return max(1, get_cpu_count() // max(1, concurrency))
+
+
+def set_torch_threads(thread_count: int) -> None:
+    # pylint: disable=import-outside-toplevel
+    import torch
+
+    torch.set_num_threads(thread_count)
+
+
+def configure_worker(concurrency: int) -> int:
+    """Sets the thread count of the processes the worker is about to fork, returns it."""
+    global _THREAD_COUNT  # pylint: disable=global-statement
+    _THREAD_COUNT = get_thread_count(concurrency)
+    for variable in THREAD_ENVIRONMENT_VARIABLES:
+        os.environ[variable] = str(_THREAD_COUNT)
+
+    logger.info(f'Running {concurrency} processes on {_THREAD_COUNT} threads each.')
+    return _THREAD_COUNT
+
+
+def apply_thread_limit() -> None:
+    """Sets the thread count in a forked process which inherited torch already imported."""
+    if _THREAD_COUNT is not None and 'torch' in sys.modules:
+        set_torch_threads(_THREAD_COUNT)
+
+
+@contextlib.contextmanager
+def thread_limit(thread_count: Optional[int]) -> Iterator[None]:
+    """Runs the block on thread_count torch threads, without it on those of the process."""
+    if not thread_count:
+        yield
+        return
+
+    # pylint: disable=import-outside-toplevel
+    import torch
+
+    previous_thread_count = torch.get_num_threads()
+    torch.set_num_threads(thread_count)
+    try:
+        yield
+    finally:
+        torch.set_num_threads(previous_thread_count)
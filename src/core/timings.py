@@ -0,0 +1,77 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, Optional
+
+from prometheus_client import Histogram
+
+# Every Celery task gets a StageTimer of its own (see api.celery_handler) which the
+# stages of the pipelines report into. Once the task is done, the timings are added
+# onto the task model they were bound to and observed into the histograms below.
+
+# Stages range from milliseconds (database) to minutes (OpenAI under load).
+STAGE_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+
+STAGE_SECONDS = Histogram(
+    'rk_pipeline_stage_seconds',
+    'Time spent within each stage of the RAG pipelines.',
+    ['pipeline', 'stage'],
+    buckets=STAGE_BUCKETS,
+)
+
+_CURRENT_TIMER: ContextVar[Optional['StageTimer']] = ContextVar('stage_timer', default=None)
+
+
+class StageTimer:
+    def __init__(self, queue_wait: Optional[float] = None):
+        self.timings: Dict[str, float] = {}
+        self.task_model: Any = None
+        if queue_wait is not None:
+            self.add('queue_wait', queue_wait)
+
+    def add(self, stage: str, seconds: float) -> None:
+        self.timings[stage] = self.timings.get(stage, 0.0) + max(seconds, 0.0)
+
+    def flush(self) -> None:
+        if self.task_model is None or not self.timings:
+            return
+
+        pipeline = self.task_model.__class__.__name__
+        for stage, seconds in self.timings.items():
+            STAGE_SECONDS.labels(pipeline=pipeline, stage=stage).observe(seconds)
+        self.task_model.add_timings(self.timings)
+
+
+def start_timer(queue_wait: Optional[float] = None) -> StageTimer:
+    timer = StageTimer(queue_wait=queue_wait)
+    _CURRENT_TIMER.set(timer)
+    return timer
+
+
+def stop_timer() -> None:
+    timer = _CURRENT_TIMER.get()
+    _CURRENT_TIMER.set(None)
+    if timer is not None:
+        timer.flush()
+
+
+def bind_task_model(task_model: Any) -> None:
+    """
+    Sets the TaskMixin instance the timings of the running Celery task are stored on.
+    The first one wins, so tasks handling many results can bind their own model first.
+    """
+    timer = _CURRENT_TIMER.get()
+    if timer is not None and timer.task_model is None:
+        timer.task_model = task_model
+
+
+@contextmanager
+def time_stage(stage: str) -> Iterator[None]:
+    # Outside of Celery tasks there is no timer and this costs only the clock reads.
+    start = time.monotonic()
+    try:
+        yield
+    finally:
+        timer = _CURRENT_TIMER.get()
+        if timer is not None:
+            timer.add(stage, time.monotonic() - start)
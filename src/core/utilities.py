@@ -66,3 +66,28 @@ def dataset_indexes_to_names(indexes: List[str]) -> Iterable[str]:
     for index in indexes:
         name = match_pattern(index, dataset_index_wildcard_to_name_map)
         yield name if name else 'Teadmata'
+
+
+def parse_year(year: Any) -> Optional[int]:
+    try:
+        return int(year)
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_reference_row(reference: Dict[str, Any], datasets: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Returns the fields of the reference table row (see ReferenceMixin) of a reference stored
+    with a result. Shared with the migrations, which only have the historical models.
+
+    :param datasets: Datasets by their index pattern.
+    """
+    index = str(reference.get('index') or '')[:255]
+    return {
+        'document_id': str(reference.get('id') or '')[:255],
+        'index': index,
+        'parent': str(reference.get('parent') or '')[:255],
+        'year': parse_year(reference.get('year')),
+        'dataset': match_pattern(index, datasets),
+        'used_by_gpt': reference.get('used_by_gpt'),
+    }
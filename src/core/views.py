@@ -1,25 +1,88 @@
-from typing import List
+from typing import Any, List, Optional, Tuple, Type
+from uuid import UUID
 
-from django.db.models import QuerySet
-from django.http import FileResponse, HttpResponseBase
-from rest_framework import status, views, viewsets
+import redis
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core import signing
+from django.db.models import Model, QuerySet
+from django.http import (
+    FileResponse,
+    HttpRequest,
+    HttpResponseBase,
+    HttpResponseNotModified,
+    JsonResponse,
+    StreamingHttpResponse,
+)
+from django.utils.translation import gettext as _
+from django.views import View
+from rest_framework import exceptions, status, views, viewsets
 from rest_framework.permissions import IsAdminUser
 from rest_framework.request import Request
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 
 from api.utilities.elastic import ElasticCore
+from core.choices import TaskStatus
 from core.models import CoreVariable, Dataset
-from core.pdf import get_statistics_pdf_file_bytes
+from core.notifications import stream_user_events, subscribe_to_task
+from core.pdf_cache import (
+    claim_rendering,
+    get_cached_pdf_path,
+    get_conversation_pdf_version,
+    open_statistics_pdf,
+)
 from core.serializers import (
     CoreVariableSerializer,
     DatasetSerializer,
     StatisticsSerializer,
+    TaskStatusQuerySerializer,
+    TaskStatusSerializer,
 )
+from core.tasks import render_conversation_pdf
+from document_search.models import AggregationTask, DocumentTask
+from text_search.models import TextTask
 from user_profile.permissions import (  # type: ignore
     IsAcceptedPermission,
     IsManagerPermission,
 )
 
+# Seconds a client should wait before asking again for a PDF that is being generated.
+PDF_RETRY_AFTER = 2
+
+
+def get_conversation_pdf_response(
+    request: Request, conversation: Any, filename: str
+) -> HttpResponseBase:
+    """
+    Serves the cached PDF of the conversation. When it hasn't been generated yet, a task
+    is queued for it and 202 is returned until the PDF is ready at the same address.
+    """
+    version = get_conversation_pdf_version(conversation)
+    headers = {'ETag': f'"{version}"'}
+    if request.headers.get('If-None-Match', None) == headers['ETag']:
+        return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    path = get_cached_pdf_path(conversation, version)
+    if not path.exists() and claim_rendering(path):
+        label = conversation._meta.label_lower  # pylint: disable=protected-access
+        render_conversation_pdf.apply_async(
+            kwargs={'conversation_label': label, 'conversation_id': conversation.pk}
+        )
+
+    try:
+        pdf_file = path.open('rb')
+    except FileNotFoundError:
+        data = {'status': TaskStatus.PENDING, 'detail': _('The PDF is being generated!')}
+        headers = {'Location': request.build_absolute_uri(), 'Retry-After': str(PDF_RETRY_AFTER)}
+        return Response(data, status=status.HTTP_202_ACCEPTED, headers=headers)
+
+    response = FileResponse(pdf_file, as_attachment=True, filename=filename)
+    response['ETag'] = headers['ETag']
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
 
 class ElasticDocumentDetailView(views.APIView):
     permission_classes = (IsAcceptedPermission,)
@@ -69,6 +132,134 @@ class StatisticsView(views.APIView):
         month = serializer.validated_data['month']
 
         filename = f'statistics_{year}_{str(month).zfill(2)}.pdf'
-        pdf_file_bytes = get_statistics_pdf_file_bytes(year, month)
+        pdf_file = open_statistics_pdf(year, month)
+
+        return FileResponse(pdf_file, as_attachment=True, filename=filename)
+
+
+# Browsers can't set headers on an EventSource, so the stream also accepts a short-lived
+# token in its query string. It's signed with the secret key, nothing is stored for it.
+TASK_EVENTS_TOKEN_SALT = 'core.task_events'
+
+
+class TaskEventsTokenView(views.APIView):
+    permission_classes = (IsAcceptedPermission,)
+
+    def post(self, request: Request) -> Response:
+        token = signing.dumps(request.user.pk, salt=TASK_EVENTS_TOKEN_SALT)
+        return Response({'token': token, 'expires_in': settings.TASK_EVENTS_TOKEN_MAX_AGE})
+
+
+# DRF views can't be async, so these authenticate by themselves. They're served by the ASGI
+# server (see docker/supervisord.conf), where waiting on Redis doesn't tie up a uWSGI worker.
+class AsyncAcceptedView(View):
+    @staticmethod
+    def _get_token_user(token: str) -> Any:
+        try:
+            user_id = signing.loads(
+                token, salt=TASK_EVENTS_TOKEN_SALT, max_age=settings.TASK_EVENTS_TOKEN_MAX_AGE
+            )
+        except signing.BadSignature as exception:
+            raise exceptions.AuthenticationFailed(_('Invalid or expired token.')) from exception
+
+        user = User.objects.filter(pk=user_id, is_active=True).first()
+        if user is None:
+            raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+        return user
+
+    @classmethod
+    def _authenticate(cls, request: HttpRequest) -> Tuple[Any, Optional[JsonResponse]]:
+        authenticators = [
+            authenticator() for authenticator in api_settings.DEFAULT_AUTHENTICATION_CLASSES
+        ]
+        drf_request = Request(request, authenticators=authenticators)
+        token = request.GET.get('token', None)
+        try:
+            if token is not None:
+                drf_request.user = cls._get_token_user(token)
+            user = drf_request.user
+        except exceptions.AuthenticationFailed as exception:
+            return None, JsonResponse(
+                {'detail': exception.detail}, status=status.HTTP_401_UNAUTHORIZED
+            )
+
+        permission = IsAcceptedPermission()
+        if not user.is_authenticated:
+            detail = exceptions.NotAuthenticated.default_detail
+            return None, JsonResponse({'detail': detail}, status=status.HTTP_401_UNAUTHORIZED)
+        if not permission.has_permission(drf_request, None):
+            return None, JsonResponse(
+                {'detail': permission.message}, status=status.HTTP_403_FORBIDDEN
+            )
+
+        return user, None
+
+
+# Clients waiting on an answer poll this instead of re-serializing the whole conversation.
+class TaskStatusView(AsyncAcceptedView):
+    @staticmethod
+    def _get_task(user: Any, result_uuid: UUID) -> Optional[Any]:
+        task_models: Tuple[Type[Model], ...] = (TextTask, DocumentTask, AggregationTask)
+        for model in task_models:
+            task = (
+                model.objects.filter(
+                    result__uuid=result_uuid,
+                    result__conversation__auth_user=user,
+                    result__conversation__is_deleted=False,
+                )
+                .only('id', 'status', 'error', 'created_at', 'modified_at')
+                .first()
+            )
+            if task is not None:
+                return task
+        return None
+
+    async def get(self, request: HttpRequest, result_uuid: UUID) -> HttpResponseBase:
+        user, error_response = await sync_to_async(self._authenticate)(request)
+        if error_response is not None:
+            return error_response
+
+        query_serializer = TaskStatusQuerySerializer(data=request.GET)
+        if not query_serializer.is_valid():
+            return JsonResponse(query_serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        wait = min(query_serializer.validated_data['wait'], settings.TASK_STATUS_MAX_WAIT)
+
+        task = await sync_to_async(self._get_task)(user, result_uuid)
+        if task is None:
+            detail = exceptions.NotFound.default_detail
+            return JsonResponse({'detail': detail}, status=status.HTTP_404_NOT_FOUND)
+
+        if_none_match = request.headers.get('If-None-Match', None)
+        if wait and task.etag == if_none_match:
+            refresh = sync_to_async(task.refresh_from_db)
+            async with subscribe_to_task(task) as wait_for_transition:
+                # Checked again after subscribing, so that no transition goes amiss.
+                await refresh(fields=['status', 'error', 'modified_at'])
+                if task.etag == if_none_match and await wait_for_transition(wait):
+                    await refresh(fields=['status', 'error', 'modified_at'])
+
+        headers = {'ETag': task.etag}
+        if task.etag == if_none_match:
+            return HttpResponseNotModified(headers=headers)
+
+        data = {'uuid': result_uuid, **TaskStatusSerializer(task).data}
+        return JsonResponse(data, headers=headers)
+
+
+class TaskEventsView(AsyncAcceptedView):
+    async def get(self, request: HttpRequest) -> HttpResponseBase:
+        user, error_response = await sync_to_async(self._authenticate)(request)
+        if error_response is not None:
+            return error_response
+
+        try:
+            events = await stream_user_events(user.pk)
+        except redis.RedisError:
+            detail = _('Task events are unavailable, poll the task status instead!')
+            return JsonResponse({'detail': detail}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
 
-        return FileResponse(pdf_file_bytes, as_attachment=True, filename=filename)
+        response = StreamingHttpResponse(events, content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        # Keeps nginx from buffering the events.
+        response['X-Accel-Buffering'] = 'no'
+        return response
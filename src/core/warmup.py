@@ -0,0 +1,115 @@
+import gc
+import logging
+import os
+import socket
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import redis
+from django.conf import settings
+
+from core.base_task import get_vectorizer
+from core.threads import set_torch_threads
+
+logger = logging.getLogger(__name__)
+
+# Worker processes load the vectorization model and run an encode through it when they start,
+# instead of on their first task, and then announce in Redis that they're warm. The keys
+# expire unless refreshed, so processes that are killed fall out of the count on their own.
+READY_KEY_PREFIX = 'rk:workers:ready:'
+WARMUP_TEXTS = ['Kommionu paneb.']
+
+_REDIS_CLIENT: Optional[redis.Redis] = None
+
+
+def _get_redis_client() -> redis.Redis:
+    global _REDIS_CLIENT  # pylint: disable=global-statement
+    if _REDIS_CLIENT is None:
+        _REDIS_CLIENT = redis.Redis.from_url(
+            settings.WORKER_READINESS_URL, socket_connect_timeout=1, socket_timeout=3
+        )
+    return _REDIS_CLIENT
+
+
+def _get_ready_key() -> str:
+    return f'{READY_KEY_PREFIX}{socket.gethostname()}:{os.getpid()}'
+
+
+def _mark_ready(warm_since: float) -> None:
+    _get_redis_client().set(_get_ready_key(), warm_since, ex=settings.WORKER_READINESS_TTL)
+
+
+def _keep_marking_ready(warm_since: float) -> None:
+    while True:
+        time.sleep(settings.WORKER_READINESS_TTL / 3)
+        try:
+            _mark_ready(warm_since)
+        except redis.RedisError as exception:
+            logger.warning(f'Could not refresh the readiness of the worker: {exception}')
+
+
+def load_shared_model() -> None:
+    """
+    Loads the vectorization model in the parent worker process before its pool is forked.
+    The children inherit it and share the pages of its weights copy-on-write, so the model
+    takes memory once per node instead of once per process.
+    """
+    # Loading runs single threaded, OpenMP threads started in the parent don't survive a fork.
+    # Nothing is encoded in the parent for the same reason, warm-up happens in the children,
+    # which get their thread count back in worker_process_init (see threads.py).
+    set_torch_threads(1)
+
+    started_at = time.monotonic()
+    get_vectorizer().freeze()
+    logger.info(f'Loaded the shared model in {time.monotonic() - started_at:.1f}s.')
+
+    # Moves every object into the permanent generation, so that the garbage collector of the
+    # children never writes into them and copies the pages they are in.
+    gc.collect()
+    gc.freeze()
+
+
+def warm_up_worker() -> None:
+    """
+    Loads the vectorization model, runs a first encode through it and marks the process as
+    warm. Failures are logged, the first task loads the model then.
+    """
+    started_at = time.monotonic()
+    try:
+        get_vectorizer().vectorize(WARMUP_TEXTS)
+    except Exception:  # pylint: disable=broad-exception-caught
+        logger.exception('Could not warm up the worker, the first task will load the model.')
+        return
+    logger.info(f'Worker warmed up in {time.monotonic() - started_at:.1f}s.')
+
+    warm_since = time.time()
+    try:
+        _mark_ready(warm_since)
+    except redis.RedisError as exception:
+        logger.warning(f'Could not mark the worker as ready: {exception}')
+    threading.Thread(target=_keep_marking_ready, args=(warm_since,), daemon=True).start()
+
+
+def mark_worker_gone() -> None:
+    try:
+        _get_redis_client().delete(_get_ready_key())
+    except redis.RedisError as exception:
+        logger.warning(f'Could not remove the readiness of the worker: {exception}')
+
+
+def get_warm_workers() -> List[Dict[str, Any]]:
+    """Returns the worker processes that are warm, raises RedisError without Redis."""
+    client = _get_redis_client()
+    keys = sorted(client.scan_iter(match=f'{READY_KEY_PREFIX}*', count=100))
+    values = client.mget(keys) if keys else []
+
+    workers = []
+    for key, warm_since in zip(keys, values):
+        if warm_since is None:
+            # Expired between the scan and the read.
+            continue
+        workers.append(
+            {'name': key.decode()[len(READY_KEY_PREFIX) :], 'warm_since': float(warm_since)}
+        )
+    return workers
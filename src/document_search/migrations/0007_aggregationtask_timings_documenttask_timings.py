@@ -0,0 +1,22 @@
+# Generated by Django 5.1 on 2026-10-19 02:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('document_search', '0006_documentsearchconversation_is_deleted_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='aggregationtask',
+            name='timings',
+            field=models.JSONField(default=dict),
+        ),
+        migrations.AddField(
+            model_name='documenttask',
+            name='timings',
+            field=models.JSONField(default=dict),
+        ),
+    ]
@@ -0,0 +1,79 @@
+# Generated by Django 5.1 on 2026-10-19 02:52
+
+from typing import Any
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+from core.utilities import parse_reference_row
+
+
+def fill_references(apps: Any, schema_editor: Any) -> None:
+    """Copies the references of the existing results into the reference table."""
+    Dataset = apps.get_model('core', 'Dataset')
+    QueryResult = apps.get_model('document_search', 'DocumentSearchQueryResult')
+    Reference = apps.get_model('document_search', 'DocumentSearchReference')
+
+    datasets = {dataset.index: dataset for dataset in Dataset.objects.all()}
+    results = QueryResult.objects.exclude(references=None).values_list('id', 'references')
+    rows = []
+    for result_id, references in results.iterator(chunk_size=1000):
+        for position, reference in enumerate(references or []):
+            fields = parse_reference_row(reference, datasets)
+            rows.append(Reference(result_id=result_id, position=position, **fields))
+        if len(rows) >= 1000:
+            Reference.objects.bulk_create(rows)
+            rows = []
+    Reference.objects.bulk_create(rows)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('core', '0011_usagerollup'),
+        ('document_search', '0007_aggregationtask_timings_documenttask_timings'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentSearchReference',
+            fields=[
+                (
+                    'id',
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name='ID',
+                    ),
+                ),
+                ('position', models.PositiveSmallIntegerField()),
+                ('document_id', models.CharField(default='', max_length=255)),
+                ('index', models.CharField(db_index=True, max_length=255)),
+                ('parent', models.CharField(db_index=True, default='', max_length=255)),
+                ('year', models.IntegerField(db_index=True, default=None, null=True)),
+                ('used_by_gpt', models.BooleanField(default=None, null=True)),
+                (
+                    'dataset',
+                    models.ForeignKey(
+                        default=None,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        to='core.dataset',
+                    ),
+                ),
+                (
+                    'result',
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name='reference_rows',
+                        to='document_search.documentsearchqueryresult',
+                    ),
+                ),
+            ],
+            options={
+                'ordering': ('position',),
+                'abstract': False,
+            },
+        ),
+        migrations.RunPython(fill_references, migrations.RunPython.noop),
+    ]
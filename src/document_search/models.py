@@ -2,7 +2,7 @@ import uuid
 
 from django.db import models
 
-from core.mixins import ConversationMixin, ResultMixin, TaskMixin
+from core.mixins import ConversationMixin, ReferenceMixin, ResultMixin, TaskMixin
 
 
 # Create your models here.
@@ -35,3 +35,9 @@ class DocumentTask(TaskMixin):
     result = models.OneToOneField(
         DocumentSearchQueryResult, on_delete=models.PROTECT, related_name='celery_task'
     )
+
+
+class DocumentSearchReference(ReferenceMixin):
+    result = models.ForeignKey(
+        DocumentSearchQueryResult, on_delete=models.CASCADE, related_name='reference_rows'
+    )
@@ -1,5 +1,4 @@
 from rest_framework import serializers
-from rest_framework.authtoken.admin import User
 
 from core.models import Dataset
 from core.utilities import validate_min_max_years
@@ -77,7 +76,7 @@ class DocumentSearchConversationSerializer(serializers.ModelSerializer):
     aggregation_result = AggregationTaskSerializer(read_only=True)
 
     def get_auth_user(self, obj: DocumentSearchConversation) -> dict:
-        user = User.objects.get(pk=obj.auth_user.id)
+        user = obj.auth_user
         return {
             'username': user.username,
             'email': user.email,
@@ -100,3 +99,39 @@ class DocumentSearchConversationSerializer(serializers.ModelSerializer):
             'modified_at',
         )
         model = DocumentSearchConversation
+
+
+# Lists leave out the references, responses and aggregations,
+# the conversation is retrieved for those.
+class DocumentSearchQueryResultListSerializer(serializers.ModelSerializer):
+    celery_task = DocumentTaskSerializer(read_only=True, many=False)
+
+    class Meta:
+        model = DocumentSearchQueryResult
+        fields = (
+            'id',
+            'uuid',
+            'user_input',
+            'dataset_name',
+            'total_cost',
+            'celery_task',
+            'created_at',
+        )
+        read_only_fields = ('__all__',)
+
+
+class DocumentSearchConversationListSerializer(serializers.ModelSerializer):
+    query_results = DocumentSearchQueryResultListSerializer(many=True, read_only=True)
+
+    class Meta:
+        model = DocumentSearchConversation
+        fields = (
+            'id',
+            'title',
+            'min_year',
+            'max_year',
+            'created_at',
+            'modified_at',
+            'query_results',
+        )
+        read_only_fields = ('__all__',)
@@ -8,9 +8,12 @@ from django.utils.translation import gettext as _
 
 from api.celery_handler import app
 from api.utilities.elastic import ElasticKNN
-from core.base_task import ResourceTask
+from api.utilities.payload_store import delete_payload, load_payload, store_payload
+from core.base_task import IOTask, ResourceTask
+from core.choices import TaskStatus
 from core.exceptions import OPENAI_EXCEPTIONS
 from core.models import Dataset
+from core.timings import bind_task_model, time_stage
 from document_search.models import (
     DocumentAggregationResult,
     DocumentSearchConversation,
@@ -21,6 +24,25 @@ from document_search.utilities import parse_aggregation
 # pylint: disable=unused-argument,too-many-arguments
 
 
+def async_call_celery_task_chain(
+    result_uuid: str,
+    conversation_id: int,
+    user_input: str,
+    dataset_index_queries: List[str],
+    dataset_name: str,
+) -> None:
+    if settings.RAG_PIPELINE_MODE == 'single':
+        run_document_search_pipeline.s(
+            result_uuid, conversation_id, user_input, dataset_index_queries, dataset_name
+        ).apply_async()
+        return
+
+    prompt_task = generate_openai_prompt.s(result_uuid, conversation_id, dataset_index_queries)
+    gpt_task = send_document_search.s(conversation_id, user_input, result_uuid)
+    save_task = save_openai_results_for_doc.s(conversation_id, result_uuid, dataset_name)
+    (prompt_task | gpt_task | save_task).apply_async()
+
+
 # Using bind=True sets the Celery Task object to the first argument, in this case celery_task.
 @app.task(
     name='generate_aggregations',
@@ -37,27 +59,33 @@ def generate_aggregations(
             uuid=result_uuid, conversation=conversation
         )
         task = aggregation_result.celery_task
+        bind_task_model(task)
         task.set_started()
 
         knn = ElasticKNN()
         indices = Dataset.get_all_dataset_values('index')
 
-        question_vector = celery_task.vectorizer.vectorize([user_input])['vectors'][0]
-        output_count = 100
-        hits = knn.search_vector(
-            vector=question_vector,
-            k=output_count,
-            num_candidates=500,
-            size=output_count,
-            indices=indices,
-        ).to_dict()
+        with time_stage('embedding'):
+            question_vector = celery_task.vectorizer.vectorize([user_input])['vectors'][0]
+
+        with time_stage('knn'):
+            output_count = 100
+            hits = knn.search_vector(
+                vector=question_vector,
+                k=output_count,
+                num_candidates=500,
+                size=output_count,
+                indices=indices,
+            ).to_dict()
 
         hits = hits['hits']['hits']
         aggregations = parse_aggregation(hits)
-        aggregation_result.aggregations = aggregations
-        aggregation_result.save()
 
-        task.set_success()
+        with time_stage('db_save'):
+            aggregation_result.aggregations = aggregations
+            aggregation_result.save()
+
+            task.set_success()
 
     except SoftTimeLimitExceeded as exception:
         conversation = DocumentSearchConversation.objects.get(pk=conversation_id)
@@ -79,6 +107,7 @@ def generate_aggregations(
 @app.task(
     name='generate_openai_prompt',
     bind=True,
+    ignore_result=True,
     base=ResourceTask,
     soft_time_limit=settings.CELERY_VECTOR_SEARCH_SOFT_LIMIT,
 )
@@ -101,7 +130,7 @@ def generate_openai_prompt(
             parent_references=parents,
             task=task.celery_task,
         )
-        return context_and_references
+        return store_payload(context_and_references)
 
     except SoftTimeLimitExceeded as exception:
         conversation = DocumentSearchConversation.objects.get(pk=conversation_id)
@@ -114,13 +143,16 @@ def generate_openai_prompt(
 # Using bind=True sets the Celery Task object to the first argument, in this case celery_task.
 @app.task(
     name='send_document_search',
+    base=IOTask,
     autoretry_for=OPENAI_EXCEPTIONS,
     retry_backoff=1,
     retry_jitter=True,
     retry_backoff_max=5*60,
     max_retries=10,
     soft_time_limit=settings.CELERY_OPENAI_SOFT_LIMIT,
+    time_limit=settings.CELERY_OPENAI_SOFT_LIMIT + settings.CELERY_HARD_LIMIT_GRACE,
     bind=True,
+    ignore_result=True,
 )
 def send_document_search(
     celery_task: Task,
@@ -133,11 +165,12 @@ def send_document_search(
     Task for fetching the RAG context from pre-processed vectors in ElasticSearch.
 
     :param celery_task: Contains access to the Celery Task instance.
-    :param context_and_references: Text containing user input and relevant context documents.
+    :param context_and_references: Claim check of the text containing user input
+        and relevant context documents.
     :param conversation_id: ID of the conversation this API call is a part of.
     :param user_input: User sent input to send to the LLM.
     :param result_uuid: UUID of the TaskResult.
-    :return: Dict needed to build a TextSearchQueryResult.
+    :return: Claim check of the dict needed to build a TextSearchQueryResult.
     """
     try:
         conversation = DocumentSearchConversation.objects.get(id=conversation_id)
@@ -145,10 +178,15 @@ def send_document_search(
         task = result.celery_task
 
         api_results = result.commit_search(
-            task=task, context_and_references=context_and_references, user_input=user_input
+            task=task,
+            context_and_references=load_payload(context_and_references),
+            user_input=user_input,
         )
 
-        return api_results
+        results_handle = store_payload(api_results)
+        # Only removed after success since retries need the context again.
+        delete_payload(context_and_references)
+        return results_handle
 
     # Reraise these since they'd be necessary for a retry.
     except OPENAI_EXCEPTIONS as exception:
@@ -173,9 +211,11 @@ def send_document_search(
 # Using bind=True sets the Celery Task object to the first argument, in this case celery_task.
 @app.task(
     name='save_openai_results_for_doc',
+    base=IOTask,
     bind=True,
-    ignore_results=True,
+    ignore_result=True,
     soft_time_limit=settings.CELERY_RESULT_STORE_SOFT_LIMIT,
+    time_limit=settings.CELERY_RESULT_STORE_SOFT_LIMIT + settings.CELERY_HARD_LIMIT_GRACE,
 )
 def save_openai_results_for_doc(
     celery_task: Task, results: dict, conversation_id: int, result_uuid: str, dataset_name: str
@@ -185,10 +225,87 @@ def save_openai_results_for_doc(
         result: DocumentSearchQueryResult = conversation.query_results.filter(
             uuid=result_uuid
         ).first()
-        result.save_results(results)
+        result.save_results(load_payload(results))
+        delete_payload(results)
     except SoftTimeLimitExceeded as exception:
         conversation = DocumentSearchConversation.objects.get(pk=conversation_id)
         DocumentSearchConversation.handle_celery_timeouts(
             conversation=conversation, result_uuid=result_uuid
         )
         raise exception
+
+
+# Using bind=True sets the Celery Task object to the first argument, in this case celery_task.
+@app.task(
+    name='run_document_search_pipeline',
+    bind=True,
+    base=ResourceTask,
+    ignore_result=True,
+    soft_time_limit=settings.CELERY_PIPELINE_SOFT_LIMIT,
+)
+def run_document_search_pipeline(
+    celery_task: ResourceTask,
+    result_uuid: str,
+    conversation_id: int,
+    user_input: str,
+    dataset_index_queries: List[str],
+    dataset_name: str,
+) -> None:
+    """
+    Task for running generate_openai_prompt, send_document_search and save_openai_results_for_doc
+    within a single task. When OpenAI needs to be retried, the rest of the work is handed
+    over to the chained tasks so that only the LLM call gets repeated.
+
+    :param celery_task: Contains access to the Celery Task instance.
+    :param result_uuid: UUID of the Result model to keep track of status.
+    :param conversation_id: ID of the conversation.
+    :param user_input: User sent input to send to the LLM.
+    :param dataset_index_queries: Which wildcarded indexes to search from in Elasticsearch.
+    :param dataset_name: Name of the dataset the question is about.
+    """
+    conversation = DocumentSearchConversation.objects.get(pk=conversation_id)
+    result: DocumentSearchQueryResult = conversation.query_results.select_related(
+        'celery_task'
+    ).get(uuid=result_uuid)
+    task = result.celery_task
+
+    try:
+        context_and_references = conversation.generate_conversations_and_references(
+            user_input=conversation.user_input,
+            dataset_index_queries=dataset_index_queries,
+            vectorizer=celery_task.vectorizer,
+            encoder=celery_task.encoder,
+            parent_references=conversation.get_previous_results_parents_ids(),
+            task=task,
+        )
+
+        try:
+            api_results = result.commit_search(
+                task=task, context_and_references=context_and_references, user_input=user_input
+            )
+        except OPENAI_EXCEPTIONS:
+            logging.getLogger(settings.INFO_LOGGER).info(
+                'OpenAI API needs a retry, handing the result over to send_document_search.'
+            )
+            gpt_task = send_document_search.s(
+                store_payload(context_and_references), conversation_id, user_input, result_uuid
+            )
+            save_task = save_openai_results_for_doc.s(conversation_id, result_uuid, dataset_name)
+            (gpt_task | save_task).apply_async(countdown=1)
+            return
+
+        result.save_results(api_results)
+
+    except SoftTimeLimitExceeded as exception:
+        DocumentSearchConversation.handle_celery_timeouts(
+            conversation=conversation, result_uuid=result_uuid
+        )
+        raise exception
+
+    except Exception as exception:
+        # Retrieval and storing the results mark the task as failed themselves.
+        if task.status != TaskStatus.FAILURE:
+            logging.getLogger(settings.ERROR_LOGGER).exception('Failed to connect to OpenAI API!')
+            message = _("Unknown error, couldn't handle response from ChatGPT!")
+            task.set_failed(message)
+        raise exception
@@ -0,0 +1,71 @@
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.reverse import reverse
+from rest_framework.test import APITestCase
+
+from document_search.models import (
+    AggregationTask,
+    DocumentAggregationResult,
+    DocumentSearchConversation,
+    DocumentSearchQueryResult,
+    DocumentTask,
+)
+from user_profile.utilities import create_test_user_with_user_profile
+
+
+class TestDocumentSearchList(APITestCase):
+    def setUp(self) -> None:  # pylint: disable=invalid-name
+        self.auth_user = create_test_user_with_user_profile(
+            self, 'tester', 'tester@email.com', 'password', is_manager=False
+        )
+        token, _ = Token.objects.get_or_create(user=self.auth_user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        self.list_endpoint_url = reverse('v1:document_search-list')
+
+    def _create_conversations(self, count: int) -> None:
+        for index in range(count):
+            conversation = DocumentSearchConversation.objects.create(
+                auth_user=self.auth_user, system_input='', title=f'Kommionu {index}'
+            )
+            aggregation_result = DocumentAggregationResult.objects.create(conversation=conversation)
+            AggregationTask.objects.create(result=aggregation_result)
+            for _ in range(2):
+                result = DocumentSearchQueryResult.objects.create(
+                    conversation=conversation, user_input='?', references=[{'doc_id': '1'}]
+                )
+                DocumentTask.objects.create(result=result)
+
+    def _get(self, url: str) -> tuple:
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data, len(context.captured_queries)
+
+    def test_list_being_paginated_and_compact(self) -> None:
+        self._create_conversations(1)
+        _, query_count = self._get(self.list_endpoint_url)
+
+        self._create_conversations(10)
+        data, query_count_of_many = self._get(f'{self.list_endpoint_url}?page_size=5')
+
+        self.assertEqual(query_count, query_count_of_many)
+        self.assertEqual(len(data['results']), 5)
+        self.assertIsNotNone(data['next'])
+
+        conversation = data['results'][0]
+        self.assertEqual(conversation['title'], 'Kommionu 9')
+        self.assertNotIn('aggregation_result', conversation)
+        self.assertNotIn('references', conversation['query_results'][0])
+
+    def test_retrieve_not_refetching_the_user(self) -> None:
+        self._create_conversations(1)
+        conversation = DocumentSearchConversation.objects.get()
+        url = reverse('v1:document_search-detail', kwargs={'pk': conversation.pk})
+
+        data, query_count = self._get(url)
+        self.assertEqual(data['auth_user']['username'], 'tester')
+        self.assertEqual(len(data['query_results']), 2)
+        # Token, user profile, conversation and the prefetched results.
+        self.assertEqual(query_count, 4)
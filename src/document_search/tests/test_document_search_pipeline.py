@@ -0,0 +1,109 @@
+from unittest import mock
+
+import httpx
+import openai
+from django.test import override_settings
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.reverse import reverse
+from rest_framework.test import APITransactionTestCase
+
+from api.utilities.gpt import LLMResponse
+from core.base_task import ResourceTask
+from core.choices import TaskStatus
+from core.models import Dataset
+from document_search.models import DocumentSearchConversation, DocumentSearchQueryResult
+from user_profile.utilities import create_test_user_with_user_profile
+
+PIPELINE_QUESTION = 'Kuidas saab piim kookuse sisse?'
+PIPELINE_CONTEXT = {
+    'context': f'Kontekst: Kookused migreeruvad. Küsimus: {PIPELINE_QUESTION}',
+    'references': [
+        {'doc_id': '1', 'text': '', 'url': '', 'title': '', 'dataset_name': 'a', 'parent': '1'}
+    ],
+    'is_context_pruned': False,
+}
+PIPELINE_LLM_RESPONSE = LLMResponse(
+    message='Kookused migreeruvad.\n\nAllikad: 0',
+    model='gpt-4o',
+    user_input=PIPELINE_QUESTION,
+    input_tokens=100,
+    response_tokens=10,
+    headers={},
+)
+RATE_LIMIT_ERROR = openai.RateLimitError(
+    'Rate limit reached!',
+    response=httpx.Response(429, request=httpx.Request('POST', 'https://api.openai.com')),
+    body=None,
+)
+
+
+# We use APITransactionTestCase here because the pipeline is started on transaction commit.
+@override_settings(
+    CELERY_TASK_ALWAYS_EAGER=True, RAG_PIPELINE_MODE='single', PAYLOAD_STORE_BACKEND='inline'
+)
+class TestDocumentSearchPipeline(APITransactionTestCase):
+    def setUp(self) -> None:  # pylint: disable=invalid-name
+        auth_user = create_test_user_with_user_profile(
+            self, 'tester', 'tester@email.com', 'password', is_manager=False
+        )
+        token, _ = Token.objects.get_or_create(user=auth_user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+
+        Dataset(name='a', type='', index='a_*', description='').save()
+
+        # Created directly, as the endpoint would also start the aggregations on Elasticsearch.
+        conversation = DocumentSearchConversation.objects.create(
+            auth_user=auth_user, system_input='', title='Kookused', user_input=PIPELINE_QUESTION
+        )
+        self.chat_endpoint_url = reverse('v1:document_search-chat', kwargs={'pk': conversation.pk})
+
+        patches = (
+            mock.patch.object(ResourceTask, 'vectorizer', new_callable=mock.PropertyMock),
+            mock.patch.object(ResourceTask, 'encoder', new_callable=mock.PropertyMock),
+        )
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def _chat(self, chat_side_effect: list) -> mock.Mock:
+        with mock.patch.object(
+            DocumentSearchConversation,
+            'generate_conversations_and_references',
+            return_value=PIPELINE_CONTEXT,
+        ) as mock_retrieval, mock.patch(
+            'api.utilities.gpt.ChatGPT.chat', side_effect=chat_side_effect
+        ) as mock_chat:
+            response = self.client.post(
+                self.chat_endpoint_url,
+                data={'user_input': PIPELINE_QUESTION, 'dataset_name': 'a'},
+            )
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        mock_retrieval.assert_called_once()
+        return mock_chat
+
+    def test_pipeline_storing_results_within_a_single_task(self) -> None:
+        with mock.patch('document_search.tasks.send_document_search.s') as mock_openai_task:
+            mock_chat = self._chat([PIPELINE_LLM_RESPONSE])
+
+        mock_chat.assert_called_once()
+        mock_openai_task.assert_not_called()
+
+        result = DocumentSearchQueryResult.objects.get()
+        self.assertEqual(result.celery_task.status, TaskStatus.SUCCESS)
+        self.assertEqual(result.dataset_name, 'a')
+        self.assertEqual(result.response, 'Kookused migreeruvad.')
+        self.assertTrue(result.references[0]['used_by_gpt'])
+        self.assertEqual(set(result.celery_task.timings), {'llm', 'db_save'})
+
+    def test_pipeline_handing_the_llm_call_over_to_send_document_search(self) -> None:
+        mock_chat = self._chat([RATE_LIMIT_ERROR, PIPELINE_LLM_RESPONSE])
+
+        # Retrieval happened only once while OpenAI was called again.
+        self.assertEqual(mock_chat.call_count, 2)
+
+        result = DocumentSearchQueryResult.objects.get()
+        self.assertEqual(result.celery_task.status, TaskStatus.SUCCESS)
+        self.assertEqual(result.response, 'Kookused migreeruvad.')
+        self.assertEqual(result.total_cost, PIPELINE_LLM_RESPONSE.total_cost)
@@ -1,21 +1,25 @@
-from typing import Any
+import uuid
+from typing import Any, Type
 
 from django.db import transaction
-from django.db.models import QuerySet
-from django.http import FileResponse
+from django.db.models import Prefetch, QuerySet
+from django.http import HttpResponseBase
 from django.utils.translation import gettext as _
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
 from rest_framework.generics import get_object_or_404
 from rest_framework.request import Request
 from rest_framework.response import Response
+from rest_framework.serializers import BaseSerializer
 
+from core.ledger import estimate_chat_cost, reserve_budget
 from core.models import CoreVariable, Dataset
-from core.pdf import get_conversation_pdf_file_bytes
+from core.pagination import ConversationCursorPagination
 from core.serializers import (
     ConversationBulkDeleteSerializer,
     ConversationSetTitleSerializer,
 )
+from core.views import get_conversation_pdf_response
 from document_search.models import (
     AggregationTask,
     DocumentAggregationResult,
@@ -25,14 +29,10 @@ from document_search.models import (
 )
 from document_search.serializers import (
     DocumentSearchChatSerializer,
+    DocumentSearchConversationListSerializer,
     DocumentSearchConversationSerializer,
 )
-from document_search.tasks import (
-    generate_aggregations,
-    generate_openai_prompt,
-    save_openai_results_for_doc,
-    send_document_search,
-)
+from document_search.tasks import async_call_celery_task_chain, generate_aggregations
 from user_profile.permissions import (  # type: ignore
     CanSpendResourcesPermission,
     IsAcceptedPermission,
@@ -49,6 +49,7 @@ from user_profile.permissions import (  # type: ignore
 class DocumentSearchConversationViewset(viewsets.ModelViewSet):
     permission_classes = (IsAcceptedPermission,)
     serializer_class = DocumentSearchConversationSerializer
+    pagination_class = ConversationCursorPagination
 
     # pylint: disable=unused-argument,invalid-name
 
@@ -57,10 +58,30 @@ class DocumentSearchConversationViewset(viewsets.ModelViewSet):
         # 404 will be returned in both situations,
         # as no user should know about the existence of these conversations
         # (403 would imply that it exists).
-        return DocumentSearchConversation.objects.filter(
+        queryset = DocumentSearchConversation.objects.filter(
             auth_user=self.request.user, is_deleted=False
         )
 
+        # Fetches the results and their tasks in one query instead of two per result.
+        if self.action == 'list':
+            # Lists don't show the responses and references, so they're left in the database.
+            results = DocumentSearchQueryResult.objects.select_related('celery_task').defer(
+                'response', 'references', 'response_headers'
+            )
+            return queryset.prefetch_related(Prefetch('query_results', queryset=results))
+        if self.action in ('retrieve', 'partial_update', 'update'):
+            results = DocumentSearchQueryResult.objects.select_related('celery_task')
+            return queryset.select_related(
+                'auth_user', 'aggregation_result__celery_task'
+            ).prefetch_related(Prefetch('query_results', queryset=results))
+
+        return queryset
+
+    def get_serializer_class(self) -> Type[BaseSerializer]:
+        if self.action == 'list':
+            return DocumentSearchConversationListSerializer
+        return super().get_serializer_class()
+
     def perform_create(self, serializer: DocumentSearchConversationSerializer) -> None:
         system_input = serializer.validated_data['system_input']
         user_input = serializer.validated_data['user_input']
@@ -103,18 +124,31 @@ class DocumentSearchConversationViewset(viewsets.ModelViewSet):
         dataset = get_object_or_404(Dataset.objects.all(), name=dataset_name)
         dataset_index_query = dataset.index
 
+        # The reservation is released once the task behind the result is done.
+        result_uuid = uuid.uuid4()
+        cost = estimate_chat_cost(instance.messages, user_input)
+        if not reserve_budget(request.user, result_uuid, cost):
+            message = CanSpendResourcesPermission.message
+            return Response({'detail': message}, status=status.HTTP_403_FORBIDDEN)
+
         result = DocumentSearchQueryResult.objects.create(
-            conversation=instance, user_input=user_input, dataset_name=dataset.name
+            conversation=instance,
+            user_input=user_input,
+            dataset_name=dataset.name,
+            uuid=result_uuid,
         )
         DocumentTask.objects.create(result=result)
 
-        prompt_task = generate_openai_prompt.s(result.uuid, pk, [dataset_index_query])
-        gpt_task = send_document_search.s(pk, user_input, result.uuid)
-        save_task = save_openai_results_for_doc.s(pk, result.uuid, dataset_name)
-
         with transaction.atomic():
-            chain = prompt_task | gpt_task | save_task
-            transaction.on_commit(chain.apply_async)
+            transaction.on_commit(
+                lambda: async_call_celery_task_chain(
+                    result_uuid=result.uuid,
+                    conversation_id=pk,
+                    user_input=user_input,
+                    dataset_index_queries=[dataset_index_query],
+                    dataset_name=dataset_name,
+                )
+            )
 
         instance.refresh_from_db()
         data = DocumentSearchConversationSerializer(instance).data
@@ -158,10 +192,8 @@ class DocumentSearchConversationViewset(viewsets.ModelViewSet):
         raise NotImplementedError
 
     @action(detail=True, methods=['get'])
-    def pdf(self, request: Request, pk: int) -> FileResponse:
+    def pdf(self, request: Request, pk: int) -> HttpResponseBase:
         conversation = get_object_or_404(self.get_queryset(), id=pk)
 
         filename = f'riigikantselei_vestlus_{pk}.pdf'
-        pdf_file_bytes = get_conversation_pdf_file_bytes(conversation)
-
-        return FileResponse(pdf_file_bytes, as_attachment=True, filename=filename)
+        return get_conversation_pdf_response(request, conversation, filename)
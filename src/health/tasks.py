@@ -0,0 +1,12 @@
+import logging
+
+from api.celery_handler import app
+from health.utils import build_health_snapshot, store_health_snapshot
+
+logger = logging.getLogger(__name__)
+
+
+@app.task(name='refresh_health_snapshot', ignore_result=True)
+def refresh_health_snapshot() -> None:
+    """Probes the services and stores the snapshot the health endpoint serves."""
+    store_health_snapshot(build_health_snapshot())
@@ -0,0 +1,49 @@
+import time
+from unittest import mock
+
+from rest_framework import status
+from rest_framework.reverse import reverse
+from rest_framework.test import APITestCase
+
+from api.utilities.testing import use_settings, use_temporary_directory
+from health.tasks import refresh_health_snapshot
+
+
+class TestHealthSnapshot(APITestCase):
+    def setUp(self) -> None:  # pylint: disable=invalid-name
+        snapshot_dir = use_temporary_directory(self)
+        use_settings(
+            self, HEALTH_SNAPSHOT_PATH=snapshot_dir / 'health.json', HEALTH_REFRESH_INTERVAL=15
+        )
+
+        self.health_endpoint_url = reverse('v1:health')
+
+    def test_endpoint_not_probing_the_services(self) -> None:
+        with mock.patch('health.utils.get_elastic_status') as mock_elastic:
+            response = self.client.get(self.health_endpoint_url)
+
+        mock_elastic.assert_not_called()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIsNone(response.data['generated_at'])
+        self.assertTrue(response.data['stale'])
+
+    def test_endpoint_serving_the_refreshed_snapshot(self) -> None:
+        with mock.patch(
+            'health.utils.get_elastic_status', return_value={'alive': True, 'url': 'es'}
+        ), mock.patch('health.utils.redis.Redis.from_url') as mock_redis:
+            mock_redis.return_value.llen.return_value = 3
+            refresh_health_snapshot()
+
+        with mock.patch('health.utils.get_elastic_status') as mock_elastic:
+            response = self.client.get(self.health_endpoint_url)
+        mock_elastic.assert_not_called()
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.data['services']['elastic']['alive'])
+        self.assertEqual(response.data['queues'], {'embed': 3, 'io': 3, 'celery': 3})
+        self.assertIn('version', response.data['api'])
+        self.assertFalse(response.data['stale'])
+
+        with mock.patch('time.time', return_value=time.time() + 60):
+            response = self.client.get(self.health_endpoint_url)
+        self.assertTrue(response.data['stale'])
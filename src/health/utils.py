@@ -1,15 +1,25 @@
 # pylint: disable=bare-except,broad-exception-caught,wrong-import-order
+import json
 import logging
 import os
 import pathlib
-from typing import Optional
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple, Type
 from urllib.parse import urlparse
 
 import redis
+from django.conf import settings
+from django.db.models import Model
+from prometheus_client import REGISTRY, CollectorRegistry, generate_latest, multiprocess
 
-from api.settings import BASE_DIR, CELERY_BROKER_URL
+from api.settings import BASE_DIR, CELERY_BROKER_URL, WORKER_WARMUP
 from api.utilities.elastic import ElasticCore
+from core.choices import TaskStatus
 from core.models import CoreVariable
+from core.warmup import get_warm_workers
+from document_search.models import AggregationTask, DocumentTask
+from text_search.models import TextTask
 
 logger = logging.getLogger(__name__)
 
@@ -59,3 +69,130 @@ def get_redis_status() -> dict:
     except Exception as error:
         logger.error(str(error))
         return redis_status
+
+
+def get_worker_readiness() -> dict:
+    """
+    Lists the worker processes which have loaded the vectorization model, known only
+    when they warm up on start (RK_WORKER_WARMUP).
+    """
+    readiness: Dict[str, Any] = {'warmup': WORKER_WARMUP, 'warm_count': None, 'warm_workers': []}
+    if not WORKER_WARMUP:
+        return readiness
+
+    try:
+        warm_workers = get_warm_workers()
+    except Exception as error:
+        logger.error(str(error))
+        return readiness
+
+    readiness['warm_count'] = len(warm_workers)
+    readiness['warm_workers'] = warm_workers
+    return readiness
+
+
+# How many refreshes the snapshot may miss before it's reported as stale.
+HEALTH_SNAPSHOT_STALE_RUNS = 3
+
+# How many of the latest successful tasks the latency percentiles are calculated from.
+LATENCY_SAMPLE_SIZE = 200
+
+
+def get_metrics() -> bytes:
+    """
+    Renders the metrics in the Prometheus text format. With PROMETHEUS_MULTIPROC_DIR set,
+    the metrics of every web and worker process writing into that directory are included.
+    """
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+    return generate_latest(REGISTRY)
+
+
+def _percentile(values: List[float], percentile: float) -> float:
+    values = sorted(values)
+    index = round(percentile * (len(values) - 1))
+    return round(values[index], 3)
+
+
+def get_latency_percentiles() -> Dict[str, dict]:
+    """
+    Calculates the p50 and p95 of every pipeline stage from the latest successful tasks.
+    """
+    latencies = {}
+    task_models: Tuple[Type[Model], ...] = (TextTask, DocumentTask, AggregationTask)
+    for model in task_models:
+        timings = (
+            model.objects.filter(status=TaskStatus.SUCCESS)
+            .exclude(timings={})
+            .order_by('-id')
+            .values_list('timings', flat=True)[:LATENCY_SAMPLE_SIZE]
+        )
+
+        stages: Dict[str, List[float]] = {'total': []}
+        for task_timings in timings:
+            for stage, seconds in task_timings.items():
+                stages.setdefault(stage, []).append(seconds)
+            stages['total'].append(sum(task_timings.values()))
+
+        latencies[model.__name__] = {
+            stage: {'p50': _percentile(values, 0.5), 'p95': _percentile(values, 0.95)}
+            for stage, values in stages.items()
+            if values
+        }
+    return latencies
+
+
+def get_queue_depths() -> Dict[str, Optional[int]]:
+    """Counts the tasks waiting in every queue of the broker."""
+    queues = (settings.CELERY_EMBED_QUEUE, settings.CELERY_IO_QUEUE, settings.CELERY_DEFAULT_QUEUE)
+    try:
+        client = redis.Redis.from_url(CELERY_BROKER_URL, socket_timeout=3)
+        return {queue: client.llen(queue) for queue in queues}
+    except Exception as error:
+        logger.error(str(error))
+        return {queue: None for queue in queues}
+
+
+def build_health_snapshot() -> dict:
+    """Probes every service the API depends on, which may take seconds when one is slow."""
+    return {
+        'generated_at': time.time(),
+        'services': {'elastic': get_elastic_status(), 'redis': get_redis_status()},
+        'api': {'version': get_version(), 'latency': get_latency_percentiles()},
+        'workers': get_worker_readiness(),
+        'queues': get_queue_depths(),
+    }
+
+
+def store_health_snapshot(snapshot: dict) -> None:
+    path = pathlib.Path(settings.HEALTH_SNAPSHOT_PATH)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Written and renamed so that a reader never sees a half written file. The io worker runs
+    # several tasks in one process, in greenlets by default and in threads with the threads
+    # pool. Gevent patches get_ident to tell greenlets apart, so the name is unique either way.
+    temporary_path = path.with_suffix(f'.{os.getpid()}.{threading.get_ident()}.tmp')
+    temporary_path.write_text(json.dumps(snapshot), encoding='utf8')
+    temporary_path.replace(path)
+
+
+def get_health_snapshot() -> dict:
+    """
+    Reads the snapshot the refresh_health_snapshot task keeps, with how old it is. It's stale
+    when the task missed a few of its runs, which also happens when the io queue is backed up.
+    """
+    try:
+        snapshot = json.loads(pathlib.Path(settings.HEALTH_SNAPSHOT_PATH).read_text('utf8'))
+    except (FileNotFoundError, ValueError):
+        snapshot = {'generated_at': None, 'services': {}, 'api': {}, 'workers': {}, 'queues': {}}
+
+    if snapshot['generated_at'] is None:
+        snapshot['age'] = None
+        snapshot['stale'] = True
+    else:
+        snapshot['age'] = round(time.time() - snapshot['generated_at'], 1)
+        snapshot['stale'] = (
+            snapshot['age'] > HEALTH_SNAPSHOT_STALE_RUNS * settings.HEALTH_REFRESH_INTERVAL
+        )
+    return snapshot
@@ -1,22 +1,29 @@
 # pylint: disable=unused-argument
-from typing import Any, Dict
-
+from django.http import HttpResponse
+from prometheus_client import CONTENT_TYPE_LATEST
 from rest_framework import status, views
 from rest_framework.decorators import permission_classes
-from rest_framework.permissions import AllowAny
+from rest_framework.permissions import AllowAny, IsAdminUser
 from rest_framework.request import Request
 from rest_framework.response import Response
 
-from health.utils import get_elastic_status, get_redis_status, get_version
+from health.utils import get_health_snapshot, get_metrics
 
 
 @permission_classes((AllowAny,))
 class HealthView(views.APIView):
     def get(self, request: Request) -> Response:
-        """Returns health statistics about host machine and running services."""
-        api_status: Dict[str, Any] = {'services': {}, 'api': {}}
-        api_status['services']['elastic'] = get_elastic_status()
-        api_status['services']['redis'] = get_redis_status()
-        api_status['api']['version'] = get_version()
+        """
+        Returns health statistics about the running services from the snapshot refreshed
+        in the background, so that probing this never waits on a slow service.
+        """
+        return Response(get_health_snapshot(), status=status.HTTP_200_OK)
+
+
+# Metrics tell about the load and the users of the API, so scrapers authenticate as an admin.
+class MetricsView(views.APIView):
+    permission_classes = (IsAdminUser,)
 
-        return Response(api_status, status=status.HTTP_200_OK)
+    def get(self, request: Request) -> HttpResponse:
+        """Returns the metrics of the web and worker processes in the Prometheus format."""
+        return HttpResponse(get_metrics(), content_type=CONTENT_TYPE_LATEST)
@@ -1,7 +1,12 @@
 from django.contrib import admin
 
-from text_search.models import TextSearchConversation, TextSearchQueryResult
+from text_search.models import (
+    TextSearchBatch,
+    TextSearchConversation,
+    TextSearchQueryResult,
+)
 
 # Register your models here.
 admin.site.register(TextSearchConversation)
 admin.site.register(TextSearchQueryResult)
+admin.site.register(TextSearchBatch)
@@ -0,0 +1,64 @@
+# Generated by Django 5.1 on 2026-10-19 01:47
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('text_search', '0005_textsearchconversation_is_deleted_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TextSearchBatch',
+            fields=[
+                (
+                    'id',
+                    models.BigAutoField(
+                        auto_created=True, primary_key=True, serialize=False, verbose_name='ID'
+                    ),
+                ),
+                (
+                    'status',
+                    models.CharField(
+                        choices=[
+                            ('PENDING', 'PENDING'),
+                            ('STARTED', 'STARTED'),
+                            ('SUCCESS', 'SUCCESS'),
+                            ('FAILURE', 'FAILURE'),
+                        ],
+                        default='PENDING',
+                        max_length=50,
+                    ),
+                ),
+                ('error', models.TextField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('modified_at', models.DateTimeField(auto_now=True)),
+                ('openai_batch_id', models.CharField(default=None, max_length=100, null=True)),
+                ('openai_status', models.CharField(default=None, max_length=50, null=True)),
+                (
+                    'auth_user',
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.PROTECT, to=settings.AUTH_USER_MODEL
+                    ),
+                ),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.AddField(
+            model_name='textsearchqueryresult',
+            name='batch',
+            field=models.ForeignKey(
+                default=None,
+                null=True,
+                on_delete=django.db.models.deletion.PROTECT,
+                related_name='query_results',
+                to='text_search.textsearchbatch',
+            ),
+        ),
+    ]
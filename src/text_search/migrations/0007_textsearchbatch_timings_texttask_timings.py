@@ -0,0 +1,22 @@
+# Generated by Django 5.1 on 2026-10-19 02:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('text_search', '0006_textsearchbatch'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='textsearchbatch',
+            name='timings',
+            field=models.JSONField(default=dict),
+        ),
+        migrations.AddField(
+            model_name='texttask',
+            name='timings',
+            field=models.JSONField(default=dict),
+        ),
+    ]
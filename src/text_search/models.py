@@ -1,8 +1,9 @@
-from typing import List, Optional
+from typing import List, Optional, Tuple
 
+from django.contrib.auth.models import User
 from django.db import models
 
-from core.mixins import ConversationMixin, ResultMixin, TaskMixin
+from core.mixins import ConversationMixin, ReferenceMixin, ResultMixin, TaskMixin
 from core.models import Dataset
 
 
@@ -18,10 +19,31 @@ class TextSearchConversation(ConversationMixin):
         return datasets
 
 
+# Questions answered offline through the OpenAI Batch API, every question
+# gets a conversation and query result of its own which the batch fills in.
+class TextSearchBatch(TaskMixin):
+    auth_user = models.ForeignKey(User, on_delete=models.PROTECT)
+    openai_batch_id = models.CharField(max_length=100, null=True, default=None)
+    openai_status = models.CharField(max_length=50, null=True, default=None)
+
+    def get_owner_and_uuid(self) -> Tuple[int, str]:
+        return self.auth_user_id, str(self.pk)
+
+    def __str__(self) -> str:
+        return f'Batch {self.openai_batch_id} by {self.auth_user.username} ({self.status})'
+
+
 class TextSearchQueryResult(ResultMixin):
     conversation = models.ForeignKey(
         TextSearchConversation, on_delete=models.PROTECT, related_name='query_results'
     )
+    batch = models.ForeignKey(
+        TextSearchBatch,
+        on_delete=models.PROTECT,
+        related_name='query_results',
+        null=True,
+        default=None,
+    )
 
     def __str__(self) -> str:
         return f"'{self.conversation.title.title()}' @ {self.conversation.auth_user.username}"
@@ -31,3 +53,9 @@ class TextTask(TaskMixin):
     result = models.OneToOneField(
         TextSearchQueryResult, on_delete=models.PROTECT, related_name='celery_task'
     )
+
+
+class TextSearchReference(ReferenceMixin):
+    result = models.ForeignKey(
+        TextSearchQueryResult, on_delete=models.CASCADE, related_name='reference_rows'
+    )
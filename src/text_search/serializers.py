@@ -1,10 +1,20 @@
+import uuid
+from typing import List, Optional
+from uuid import UUID
+
+from django.conf import settings
 from django.db import transaction
 from rest_framework import serializers
 
 from core.models import CoreVariable, Dataset
 from core.utilities import validate_min_max_years
-from text_search.models import TextSearchConversation, TextSearchQueryResult, TextTask
-from text_search.tasks import async_call_celery_task_chain
+from text_search.models import (
+    TextSearchBatch,
+    TextSearchConversation,
+    TextSearchQueryResult,
+    TextTask,
+)
+from text_search.tasks import async_call_batch_task, async_call_celery_task_chain
 
 
 class TextSearchConversationCreateSerializer(serializers.Serializer):
@@ -88,10 +98,47 @@ class TextSearchConversationReadOnlySerializer(serializers.ModelSerializer):
         read_only_fields = ('__all__',)
 
 
+# Lists leave out the references and responses, the conversation is retrieved for those.
+class TextSearchQueryResultListSerializer(serializers.ModelSerializer):
+    celery_task = TextTaskSerializer(read_only=True, many=False)
+
+    class Meta:
+        model = TextSearchQueryResult
+        fields = ('uuid', 'user_input', 'total_cost', 'created_at', 'celery_task')
+        read_only_fields = ('__all__',)
+
+
+class TextSearchConversationListSerializer(serializers.ModelSerializer):
+    query_results = TextSearchQueryResultListSerializer(many=True)
+    dataset_names = serializers.SerializerMethodField()
+
+    def get_dataset_names(self, obj: TextSearchConversation) -> List[str]:
+        if obj.dataset_names_string:
+            return obj.dataset_names_string.split(',')
+
+        # Conversations without datasets use all of them, which is fetched once per page.
+        if 'all_dataset_names' not in self.context:
+            self.context['all_dataset_names'] = Dataset.get_all_dataset_values()
+        return self.context['all_dataset_names']
+
+    class Meta:
+        model = TextSearchConversation
+        fields = (
+            'id',
+            'title',
+            'min_year',
+            'max_year',
+            'dataset_names',
+            'created_at',
+            'query_results',
+        )
+        read_only_fields = ('__all__',)
+
+
 class TextSearchQuerySubmitSerializer(serializers.Serializer):
     user_input = serializers.CharField()
 
-    def save(self, conversation_id: int) -> dict:
+    def save(self, conversation_id: int, result_uuid: Optional[UUID] = None) -> dict:
         user_input = self.validated_data['user_input']
 
         instance = TextSearchConversation.objects.get(id=conversation_id)
@@ -103,7 +150,9 @@ class TextSearchQuerySubmitSerializer(serializers.Serializer):
 
         # TODO: Maybe auto-create the task through a signal or by rewriting
         #  results .save() function in the model?
-        result = TextSearchQueryResult.objects.create(conversation=instance, user_input=user_input)
+        result = TextSearchQueryResult.objects.create(
+            conversation=instance, user_input=user_input, uuid=result_uuid or uuid.uuid4()
+        )
         TextTask.objects.create(result=result)
 
         with transaction.atomic():
@@ -119,3 +168,92 @@ class TextSearchQuerySubmitSerializer(serializers.Serializer):
             )
 
             return TextSearchConversationReadOnlySerializer(instance).data
+
+
+class TextSearchBatchCreateSerializer(serializers.Serializer):
+    questions = serializers.ListField(
+        child=serializers.CharField(),
+        min_length=1,
+        max_length=settings.OPENAI_BATCH_MAX_QUESTIONS,
+    )
+
+    min_year = serializers.IntegerField(default=None, min_value=1700)
+    max_year = serializers.IntegerField(default=None, min_value=1700)
+    dataset_names = serializers.ListField(
+        # By default include all datasets.
+        default=Dataset.get_all_dataset_values,
+        child=serializers.CharField(),
+    )
+
+    def validate(self, data: dict) -> dict:
+        validate_min_max_years(data['min_year'], data['max_year'])
+        Dataset.validate_dataset_names(data['dataset_names'])
+        return data
+
+    def create(self, validated_data: dict) -> TextSearchBatch:
+        dataset_names: List[str] = validated_data['dataset_names']
+        dataset_index_queries = list(
+            Dataset.objects.filter(name__in=dataset_names).values_list('index', flat=True)
+        )
+        system_input = CoreVariable.get_core_setting('OPENAI_SYSTEM_MESSAGE')
+
+        with transaction.atomic():
+            batch = TextSearchBatch.objects.create(auth_user=validated_data['auth_user'])
+
+            # Every question is independent of the others, so each gets its own conversation.
+            for question in validated_data['questions']:
+                conversation = TextSearchConversation.objects.create(
+                    auth_user=validated_data['auth_user'],
+                    system_input=system_input,
+                    title=question[0].upper() + question[1:],
+                    dataset_names_string=','.join(dataset_names),
+                    min_year=validated_data['min_year'],
+                    max_year=validated_data['max_year'],
+                )
+                result = TextSearchQueryResult.objects.create(
+                    conversation=conversation, user_input=question, batch=batch
+                )
+                TextTask.objects.create(result=result)
+
+            transaction.on_commit(
+                lambda: async_call_batch_task(
+                    batch_id=batch.id, dataset_index_queries=dataset_index_queries
+                )
+            )
+
+        return batch
+
+
+# Objects are never modified through views, so the serializer is used only for reading
+class TextSearchBatchQueryResultSerializer(serializers.ModelSerializer):
+    celery_task = TextTaskSerializer(read_only=True, many=False)
+
+    class Meta:
+        model = TextSearchQueryResult
+        fields = (
+            'conversation',
+            'uuid',
+            'user_input',
+            'response',
+            'total_cost',
+            'celery_task',
+        )
+        read_only_fields = ('__all__',)
+
+
+# Objects are never modified through views, so the serializer is used only for reading
+class TextSearchBatchReadOnlySerializer(serializers.ModelSerializer):
+    query_results = TextSearchBatchQueryResultSerializer(many=True)
+
+    class Meta:
+        model = TextSearchBatch
+        fields = (
+            'id',
+            'status',
+            'error',
+            'openai_status',
+            'created_at',
+            'modified_at',
+            'query_results',
+        )
+        read_only_fields = ('__all__',)
@@ -1,14 +1,26 @@
 import logging
+from datetime import timedelta
 from typing import List
 
 from celery import Task
 from celery.exceptions import SoftTimeLimitExceeded
 from django.conf import settings
+from django.utils import timezone
+from django.utils.translation import gettext as _
 
 from api.celery_handler import app
-from core.base_task import ResourceTask
+from api.utilities.gpt import ChatGPT
+from api.utilities.payload_store import delete_payload, load_payload, store_payload
+from core.base_task import IOTask, ResourceTask
+from core.choices import TaskStatus
 from core.exceptions import OPENAI_EXCEPTIONS
-from text_search.models import TextSearchConversation, TextSearchQueryResult, TextTask
+from core.timings import bind_task_model
+from text_search.models import (
+    TextSearchBatch,
+    TextSearchConversation,
+    TextSearchQueryResult,
+    TextTask,
+)
 
 # pylint: disable=unused-argument,too-many-arguments
 
@@ -19,6 +31,15 @@ def async_call_celery_task_chain(
     conversation_id: int,
     result_uuid: str,
 ) -> None:
+    if settings.RAG_PIPELINE_MODE == 'single':
+        run_text_search_pipeline.s(
+            conversation_id=conversation_id,
+            result_uuid=result_uuid,
+            user_input=user_input,
+            dataset_index_queries=dataset_index_queries,
+        ).apply_async()
+        return
+
     rag_task = query_and_format_rag_context.s(
         conversation_id=conversation_id,
         result_uuid=result_uuid,
@@ -40,6 +61,7 @@ def async_call_celery_task_chain(
     name='query_and_format_rag_context',
     max_retries=5,
     bind=True,
+    ignore_result=True,
     base=ResourceTask,
     soft_time_limit=settings.CELERY_VECTOR_SEARCH_SOFT_LIMIT,
 )
@@ -58,7 +80,7 @@ def query_and_format_rag_context(
     :param celery_task: Contains access to the Celery Task instance.
     :param user_input: User sent input to add context to.
     :param dataset_index_queries: Which wildcarded indexes to search from in Elasticsearch.
-    :return: Text containing user input and relevant context documents.
+    :return: Claim check of the text containing user input and relevant context documents.
     """
     try:
         conversation: TextSearchConversation = TextSearchConversation.objects.get(
@@ -75,7 +97,7 @@ def query_and_format_rag_context(
             parent_references=parents,
             task=result.celery_task,
         )
-        return context_and_references
+        return store_payload(context_and_references)
     except SoftTimeLimitExceeded as exception:
         conversation = TextSearchConversation.objects.get(pk=conversation_id)
         TextSearchConversation.handle_celery_timeouts(
@@ -87,12 +109,15 @@ def query_and_format_rag_context(
 # Using bind=True sets the Celery Task object to the first argument, in this case celery_task.
 @app.task(
     name='call_openai_api',
+    base=IOTask,
     autoretry_for=OPENAI_EXCEPTIONS,
     retry_backoff=1,
     retry_jitter=True,
-    retry_backoff_max=5*60,
+    retry_backoff_max=5 * 60,
     bind=True,
+    ignore_result=True,
     soft_time_limit=settings.CELERY_OPENAI_SOFT_LIMIT,
+    time_limit=settings.CELERY_OPENAI_SOFT_LIMIT + settings.CELERY_HARD_LIMIT_GRACE,
 )
 def call_openai_api(
     celery_task: Task,
@@ -105,11 +130,12 @@ def call_openai_api(
     Task for fetching the RAG context from pre-processed vectors in ElasticSearch.
 
     :param celery_task: Contains access to the Celery Task instance.
-    :param context_and_references: Text containing user input and relevant context documents.
+    :param context_and_references: Claim check of the text containing user input
+        and relevant context documents.
     :param conversation_id: ID of the conversation this API call is a part of.
     :param user_input: User sent input to send to the LLM.
     :param result_uuid: UUID of the TaskResult.
-    :return: Dict needed to build a TextSearchQueryResult.
+    :return: Claim check of the dict needed to build a TextSearchQueryResult.
     """
     try:
         conversation = TextSearchConversation.objects.get(id=conversation_id)
@@ -117,10 +143,15 @@ def call_openai_api(
         task: TextTask = result.celery_task
 
         api_results = result.commit_search(
-            task=task, context_and_references=context_and_references, user_input=user_input
+            task=task,
+            context_and_references=load_payload(context_and_references),
+            user_input=user_input,
         )
 
-        return api_results
+        results_handle = store_payload(api_results)
+        # Only removed after success since retries need the context again.
+        delete_payload(context_and_references)
+        return results_handle
 
     # Reraise these since they'd be necessary for a retry.
     except OPENAI_EXCEPTIONS as exception:
@@ -145,9 +176,11 @@ def call_openai_api(
 # Using bind=True sets the Celery Task object to the first argument, in this case celery_task.
 @app.task(
     name='save_openai_results',
+    base=IOTask,
     bind=True,
-    ignore_results=True,
+    ignore_result=True,
     soft_time_limit=settings.CELERY_RESULT_STORE_SOFT_LIMIT,
+    time_limit=settings.CELERY_RESULT_STORE_SOFT_LIMIT + settings.CELERY_HARD_LIMIT_GRACE,
 )
 def save_openai_results(
     celery_task: Task, results: dict, conversation_id: int, result_uuid: str
@@ -155,9 +188,315 @@ def save_openai_results(
     try:
         conversation = TextSearchConversation.objects.get(id=conversation_id)
         result: TextSearchQueryResult = conversation.query_results.filter(uuid=result_uuid).first()
-        result.save_results(results)
+        result.save_results(load_payload(results))
+        delete_payload(results)
     except SoftTimeLimitExceeded as exception:
         conversation = TextSearchConversation.objects.get(pk=conversation_id)
-        conversation.handle_celery_timeouts(
-            conversation=conversation, result_uuid=result_uuid, exception=exception
+        conversation.handle_celery_timeouts(conversation=conversation, result_uuid=result_uuid)
+        raise exception
+
+
+# Using bind=True sets the Celery Task object to the first argument, in this case celery_task.
+@app.task(
+    name='run_text_search_pipeline',
+    bind=True,
+    base=ResourceTask,
+    ignore_result=True,
+    soft_time_limit=settings.CELERY_PIPELINE_SOFT_LIMIT,
+)
+def run_text_search_pipeline(
+    celery_task: ResourceTask,
+    conversation_id: int,
+    result_uuid: str,
+    user_input: str,
+    dataset_index_queries: List[str],
+) -> None:
+    """
+    Task for running query_and_format_rag_context, call_openai_api and save_openai_results
+    within a single task. When OpenAI needs to be retried, the rest of the work is handed
+    over to the chained tasks so that only the LLM call gets repeated.
+
+    :param celery_task: Contains access to the Celery Task instance.
+    :param conversation_id: ID of the conversation.
+    :param result_uuid: UUID of the Result model to keep track of status.
+    :param user_input: User sent input to add context to.
+    :param dataset_index_queries: Which wildcarded indexes to search from in Elasticsearch.
+    """
+    conversation = TextSearchConversation.objects.get(pk=conversation_id)
+    result: TextSearchQueryResult = conversation.query_results.select_related('celery_task').get(
+        uuid=result_uuid
+    )
+    task: TextTask = result.celery_task
+
+    try:
+        context_and_references = conversation.generate_conversations_and_references(
+            user_input=user_input,
+            dataset_index_queries=dataset_index_queries,
+            vectorizer=celery_task.vectorizer,
+            encoder=celery_task.encoder,
+            parent_references=conversation.get_previous_results_parents_ids(),
+            task=task,
+        )
+
+        try:
+            api_results = result.commit_search(
+                task=task, context_and_references=context_and_references, user_input=user_input
+            )
+        except OPENAI_EXCEPTIONS:
+            logging.getLogger(settings.INFO_LOGGER).info(
+                'OpenAI API needs a retry, handing the result over to call_openai_api.'
+            )
+            openai_task = call_openai_api.s(
+                store_payload(context_and_references),
+                conversation_id=conversation_id,
+                user_input=user_input,
+                result_uuid=result_uuid,
+            )
+            save_task = save_openai_results.s(conversation_id, result_uuid)
+            (openai_task | save_task).apply_async(countdown=1)
+            return
+
+        result.save_results(api_results)
+
+    except SoftTimeLimitExceeded as exception:
+        TextSearchConversation.handle_celery_timeouts(
+            conversation=conversation, result_uuid=result_uuid
         )
+        raise exception
+
+    except Exception as exception:
+        # Retrieval and storing the results mark the task as failed themselves.
+        if task.status != TaskStatus.FAILURE:
+            logging.getLogger(settings.ERROR_LOGGER).exception('Failed to connect to OpenAI API!')
+            task.set_failed(str(exception))
+        raise exception
+
+
+# Batch API
+
+# Statuses of an OpenAI batch during which it's still worth waiting for the results.
+# https://platform.openai.com/docs/guides/batch/4-checking-the-status-of-a-batch
+OPENAI_BATCH_RUNNING_STATUSES = ('validating', 'in_progress', 'finalizing', 'cancelling')
+
+
+def async_call_batch_task(batch_id: int, dataset_index_queries: List[str]) -> None:
+    prepare_text_search_batch.s(
+        batch_id=batch_id, dataset_index_queries=dataset_index_queries
+    ).apply_async()
+
+
+def _fail_unanswered_batch_results(batch: TextSearchBatch, message: str) -> None:
+    unanswered_results = batch.query_results.select_related('celery_task').exclude(
+        celery_task__status__in=(TaskStatus.SUCCESS, TaskStatus.FAILURE)
+    )
+    for result in unanswered_results:
+        result.celery_task.set_failed(message)
+
+
+def _store_batch_results(
+    chat_gpt: ChatGPT, batch: TextSearchBatch, batch_results: List[dict]
+) -> None:
+    results = batch.query_results.select_related('celery_task', 'conversation')
+    results_by_uuid = {str(result.uuid): result for result in results}
+
+    for batch_result in batch_results:
+        result = results_by_uuid.get(str(batch_result.get('custom_id')), None)
+        if result is None:
+            continue
+
+        error = chat_gpt.get_batch_result_error(batch_result)
+        if error:
+            logging.getLogger(settings.ERROR_LOGGER).error(
+                f'OpenAI batch {batch.openai_batch_id} failed a request: {error}'
+            )
+            result.celery_task.set_failed(error)
+            continue
+
+        try:
+            llm_response = chat_gpt.parse_batch_result(result.user_input, batch_result)
+            result.save_results(
+                result.build_results(
+                    llm_response=llm_response,
+                    user_input=result.user_input,
+                    references=result.references or [],
+                    is_context_pruned=result.is_context_pruned,
+                )
+            )
+        except Exception:  # pylint: disable=broad-exception-caught
+            logging.getLogger(settings.ERROR_LOGGER).exception(
+                'Failed to store the answer of a batch request!'
+            )
+            result.celery_task.set_failed(_("Couldn't handle response from ChatGPT!"))
+
+
+# Using bind=True sets the Celery Task object to the first argument, in this case celery_task.
+@app.task(
+    name='prepare_text_search_batch',
+    autoretry_for=OPENAI_EXCEPTIONS,
+    retry_backoff=1,
+    retry_jitter=True,
+    retry_backoff_max=5 * 60,
+    bind=True,
+    base=ResourceTask,
+    soft_time_limit=settings.CELERY_BATCH_PREPARE_SOFT_LIMIT,
+    torch_threads=settings.BATCH_TORCH_THREADS,
+)
+def prepare_text_search_batch(
+    celery_task: ResourceTask, batch_id: int, dataset_index_queries: List[str]
+) -> None:
+    """
+    Task for building the RAG contexts of every question in the batch
+    and submitting them to the OpenAI Batch API as a single file.
+
+    :param celery_task: Contains access to the Celery Task instance.
+    :param batch_id: ID of the TextSearchBatch.
+    :param dataset_index_queries: Which wildcarded indexes to search from in Elasticsearch.
+    """
+    batch = TextSearchBatch.objects.get(pk=batch_id)
+    # The timings of every question are summed up onto the batch.
+    bind_task_model(batch)
+
+    try:
+        chat_gpt = ChatGPT()
+        requests = []
+        results = batch.query_results.select_related('conversation', 'celery_task')
+        for result in results:
+            conversation = result.conversation
+            try:
+                context_and_references = conversation.generate_conversations_and_references(
+                    user_input=result.user_input,
+                    dataset_index_queries=dataset_index_queries,
+                    vectorizer=celery_task.vectorizer,
+                    encoder=celery_task.encoder,
+                    parent_references=[],
+                    task=result.celery_task,
+                )
+            except SoftTimeLimitExceeded as exception:
+                raise exception
+            except Exception:  # pylint: disable=broad-exception-caught
+                # The task of the question is already marked as failed,
+                # a single bad question shouldn't sink the rest of the batch.
+                continue
+
+            result.references = context_and_references['references']
+            result.is_context_pruned = context_and_references['is_context_pruned']
+            result.save()
+
+            messages = conversation.messages + [
+                {'role': 'user', 'content': context_and_references['context']}
+            ]
+            requests.append(chat_gpt.build_batch_request(str(result.uuid), messages))
+
+        if not requests:
+            batch.set_failed(_("Couldn't get context for any of the questions!"))
+            return
+
+        openai_batch = chat_gpt.submit_batch(requests)
+
+        batch.openai_batch_id = openai_batch.id
+        batch.openai_status = openai_batch.status
+        batch.set_started()
+        for result in results.exclude(celery_task__status=TaskStatus.FAILURE):
+            result.celery_task.set_started()
+
+    # Reraise these since they'd be necessary for a retry.
+    except OPENAI_EXCEPTIONS as exception:
+        raise exception
+
+    except SoftTimeLimitExceeded as exception:
+        logging.getLogger(settings.ERROR_LOGGER).exception('Celery task soft-time limit exceeded!')
+        message = _('Task toke too much time!')
+        batch.set_failed(message)
+        _fail_unanswered_batch_results(batch, message)
+        raise exception
+
+    except Exception as exception:
+        logging.getLogger(settings.ERROR_LOGGER).exception('Failed to submit the OpenAI batch!')
+        batch.set_failed(str(exception))
+        _fail_unanswered_batch_results(batch, str(exception))
+        raise exception
+
+    poll_text_search_batch.apply_async(
+        kwargs={'batch_id': batch_id}, countdown=settings.OPENAI_BATCH_POLL_INTERVAL
+    )
+
+
+# Using bind=True sets the Celery Task object to the first argument, in this case celery_task.
+@app.task(
+    name='poll_text_search_batch',
+    base=IOTask,
+    autoretry_for=OPENAI_EXCEPTIONS,
+    retry_backoff=1,
+    retry_jitter=True,
+    retry_backoff_max=5 * 60,
+    bind=True,
+    ignore_result=True,
+    soft_time_limit=settings.CELERY_BATCH_POLL_SOFT_LIMIT,
+    time_limit=settings.CELERY_BATCH_POLL_SOFT_LIMIT + settings.CELERY_HARD_LIMIT_GRACE,
+)
+def poll_text_search_batch(celery_task: Task, batch_id: int) -> None:
+    """
+    Task for checking on an OpenAI batch, which reschedules itself until the batch
+    has ended and then stores the answers into the query results of the batch.
+
+    :param celery_task: Contains access to the Celery Task instance.
+    :param batch_id: ID of the TextSearchBatch.
+    """
+    batch = TextSearchBatch.objects.get(pk=batch_id)
+    # Batches resumed by the beat may have been ended by the poll they were resumed from.
+    if batch.status != TaskStatus.STARTED or not batch.openai_batch_id:
+        return
+
+    bind_task_model(batch)
+    chat_gpt = ChatGPT()
+
+    try:
+        openai_batch = chat_gpt.retrieve_batch(batch.openai_batch_id)
+        batch.openai_status = openai_batch.status
+        batch.save()
+
+        if openai_batch.status in OPENAI_BATCH_RUNNING_STATUSES:
+            poll_text_search_batch.apply_async(
+                kwargs={'batch_id': batch_id}, countdown=settings.OPENAI_BATCH_POLL_INTERVAL
+            )
+            return
+
+        # Expired and cancelled batches still hand over the requests they got through.
+        batch_results = []
+        for file_id in (openai_batch.output_file_id, openai_batch.error_file_id):
+            if file_id:
+                batch_results.extend(chat_gpt.download_batch_results(file_id))
+
+        _store_batch_results(chat_gpt, batch, batch_results)
+
+        # Whatever hasn't been answered by now never will be.
+        _fail_unanswered_batch_results(batch, _('OpenAI batch ended without an answer!'))
+        # Ending the batch releases the budget it reserved when it was created.
+        if openai_batch.status == 'completed':
+            batch.set_success()
+        else:
+            batch.set_failed(f'OpenAI batch ended with status: {openai_batch.status}')
+
+    # Reraise these since they'd be necessary for a retry.
+    except OPENAI_EXCEPTIONS as exception:
+        raise exception
+
+    except Exception as exception:
+        logging.getLogger(settings.ERROR_LOGGER).exception('Failed to poll the OpenAI batch!')
+        batch.set_failed(str(exception))
+        _fail_unanswered_batch_results(batch, str(exception))
+        raise exception
+
+
+@app.task(name='resume_text_search_batches', ignore_result=True)
+def resume_text_search_batches() -> None:
+    """
+    Polls the started batches nothing has checked on for a while again, as the polls of
+    a batch end for good once their retries run out or the worker stops them.
+    """
+    stale_before = timezone.now() - timedelta(seconds=settings.OPENAI_BATCH_RESUME_AFTER)
+    batches = TextSearchBatch.objects.filter(
+        status=TaskStatus.STARTED, openai_batch_id__isnull=False, modified_at__lt=stale_before
+    )
+    for batch_id in batches.values_list('pk', flat=True):
+        poll_text_search_batch.apply_async(kwargs={'batch_id': batch_id})
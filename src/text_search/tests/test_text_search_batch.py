@@ -0,0 +1,250 @@
+from datetime import timedelta
+from types import SimpleNamespace
+from typing import List
+from unittest import mock
+
+from django.conf import settings
+from django.test import override_settings
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.reverse import reverse
+from rest_framework.test import APITransactionTestCase
+
+from core.base_task import ResourceTask
+from core.choices import TaskStatus
+from core.ledger import estimate_batch_cost, reserve_budget
+from core.models import CoreVariable, Dataset
+from text_search.models import (
+    TextSearchBatch,
+    TextSearchConversation,
+    TextSearchQueryResult,
+    TextTask,
+)
+from text_search.tasks import poll_text_search_batch, resume_text_search_batches
+from user_profile.utilities import create_test_user_with_user_profile
+
+BATCH_QUESTIONS = ['Kuidas saab moos kommi sisse?', 'Kes on kommionu?']
+BATCH_RESPONSE = 'Kommionu paneb.\n\nAllikad: 0'
+BATCH_CONTEXT = {
+    'context': 'Kontekst: Kommionu paneb. Küsimus: ...',
+    'references': [
+        {'doc_id': '1', 'text': 'Kommionu paneb.', 'url': '', 'title': '', 'dataset_name': 'a'}
+    ],
+    'is_context_pruned': False,
+}
+
+
+def _download_batch_results_side_effect(_file_id: str) -> List[dict]:
+    return [
+        {
+            'custom_id': str(result.uuid),
+            'error': None,
+            'response': {
+                'status_code': 200,
+                'body': {
+                    'model': 'gpt-4o',
+                    'choices': [{'finish_reason': 'stop', 'message': {'content': BATCH_RESPONSE}}],
+                    'usage': {'prompt_tokens': 1000, 'completion_tokens': 100},
+                },
+            },
+        }
+        for result in TextSearchQueryResult.objects.all()
+    ]
+
+
+# We use APITransactionTestCase here because the batch is sent off on transaction commit.
+class TestTextSearchBatch(APITransactionTestCase):
+    def setUp(self) -> None:  # pylint: disable=invalid-name
+        self.create_endpoint_url = reverse('v1:text_search_batch-list')
+
+        self.allowed_auth_user = create_test_user_with_user_profile(
+            self, 'tester', 'tester@email.com', 'password', is_manager=False
+        )
+        self.not_allowed_auth_user = create_test_user_with_user_profile(
+            self, 'tester2', 'tester2@email.com', 'password', is_manager=False
+        )
+        not_allowed_user_profile = self.not_allowed_auth_user.user_profile
+        not_allowed_user_profile.is_allowed_to_spend_resources = False
+        not_allowed_user_profile.save()
+
+        Dataset(name='a', type='', index='a_*', description='').save()
+
+    def _authenticate(self, auth_user: object) -> None:
+        token, _ = Token.objects.get_or_create(user=auth_user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+
+    @override_settings(CELERY_TASK_ALWAYS_EAGER=True)
+    def test_batch(self) -> None:
+        self._authenticate(self.allowed_auth_user)
+
+        with mock.patch.object(
+            ResourceTask, 'vectorizer', new_callable=mock.PropertyMock
+        ), mock.patch.object(ResourceTask, 'encoder', new_callable=mock.PropertyMock), mock.patch(
+            'text_search.models.TextSearchConversation.generate_conversations_and_references',
+            return_value=BATCH_CONTEXT,
+        ), mock.patch(
+            'api.utilities.gpt.ChatGPT.submit_batch',
+            return_value=SimpleNamespace(id='batch_1', status='validating'),
+        ) as mock_submit, mock.patch(
+            'api.utilities.gpt.ChatGPT.retrieve_batch',
+            return_value=SimpleNamespace(
+                id='batch_1', status='completed', output_file_id='f_1', error_file_id=None
+            ),
+        ), mock.patch(
+            'api.utilities.gpt.ChatGPT.download_batch_results',
+            side_effect=_download_batch_results_side_effect,
+        ), mock.patch(
+            'text_search.views.reserve_budget', wraps=reserve_budget
+        ) as mock_reserve, mock.patch(
+            'core.mixins.release_budget'
+        ) as mock_release:
+            response = self.client.post(
+                self.create_endpoint_url, data={'questions': BATCH_QUESTIONS}, format='json'
+            )
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        # The whole batch is reserved until it has ended.
+        batch_id = response.data['id']
+        self.assertEqual(
+            mock_reserve.call_args.args,
+            (self.allowed_auth_user, batch_id, estimate_batch_cost(BATCH_QUESTIONS)),
+        )
+        self.assertEqual(
+            mock_reserve.call_args.kwargs, {'ttl': settings.SPEND_BATCH_RESERVATION_TTL}
+        )
+        mock_release.assert_any_call(self.allowed_auth_user.pk, str(batch_id))
+
+        # Every question is sent within the same batch.
+        mock_submit.assert_called_once()
+        self.assertEqual(len(mock_submit.call_args.args[0]), len(BATCH_QUESTIONS))
+
+        batch = TextSearchBatch.objects.get(id=response.data['id'])
+        self.assertEqual(batch.status, TaskStatus.SUCCESS)
+        self.assertEqual(batch.openai_status, 'completed')
+
+        expected_cost = 1000 * CoreVariable.get_core_setting(
+            'EURO_COST_PER_BATCH_INPUT_TOKEN'
+        ) + 100 * CoreVariable.get_core_setting('EURO_COST_PER_BATCH_OUTPUT_TOKEN')
+        for result in batch.query_results.all():
+            self.assertEqual(result.celery_task.status, TaskStatus.SUCCESS)
+            self.assertEqual(result.response, 'Kommionu paneb.')
+            self.assertAlmostEqual(result.total_cost, expected_cost)
+            self.assertTrue(result.references[0]['used_by_gpt'])
+
+        retrieve_endpoint_url = reverse('v1:text_search_batch-detail', kwargs={'pk': batch.id})
+        response = self.client.get(retrieve_endpoint_url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['query_results']), len(BATCH_QUESTIONS))
+
+    def test_batch_failing_because_the_reservation_fails(self) -> None:
+        self._authenticate(self.allowed_auth_user)
+
+        with mock.patch('text_search.views.reserve_budget', return_value=False), mock.patch(
+            'text_search.serializers.async_call_batch_task'
+        ) as mock_batch_task:
+            response = self.client.post(
+                self.create_endpoint_url, data={'questions': BATCH_QUESTIONS}, format='json'
+            )
+
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        mock_batch_task.assert_not_called()
+        self.assertFalse(TextSearchBatch.objects.exists())
+        self.assertFalse(TextSearchQueryResult.objects.exists())
+
+    def test_batch_failing_because_not_allowed_to_spend(self) -> None:
+        self._authenticate(self.not_allowed_auth_user)
+
+        response = self.client.post(
+            self.create_endpoint_url, data={'questions': BATCH_QUESTIONS}, format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertFalse(TextSearchBatch.objects.exists())
+
+    def test_batch_failing_because_of_no_questions(self) -> None:
+        self._authenticate(self.allowed_auth_user)
+
+        response = self.client.post(self.create_endpoint_url, data={'questions': []}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(CELERY_TASK_ALWAYS_EAGER=True)
+    def test_batch_storing_the_errors_of_failed_requests(self) -> None:
+        batch = self._create_started_batch()
+        failed_result, answered_result = batch.query_results.order_by('pk')
+        error_lines = [
+            {
+                'custom_id': str(failed_result.uuid),
+                'error': None,
+                'response': {
+                    'status_code': 400,
+                    'body': {'error': {'message': 'Context length exceeded.'}},
+                },
+            }
+        ]
+
+        def download_side_effect(file_id: str) -> List[dict]:
+            if file_id == 'errors_1':
+                return error_lines
+            return [
+                line
+                for line in _download_batch_results_side_effect(file_id)
+                if line['custom_id'] == str(answered_result.uuid)
+            ]
+
+        with mock.patch(
+            'api.utilities.gpt.ChatGPT.retrieve_batch',
+            return_value=SimpleNamespace(
+                id='batch_1', status='completed', output_file_id='f_1', error_file_id='errors_1'
+            ),
+        ), mock.patch(
+            'api.utilities.gpt.ChatGPT.download_batch_results', side_effect=download_side_effect
+        ), mock.patch(
+            'core.mixins.release_budget'
+        ):
+            poll_text_search_batch.apply(kwargs={'batch_id': batch.pk})
+
+        failed_result.celery_task.refresh_from_db()
+        self.assertEqual(failed_result.celery_task.status, TaskStatus.FAILURE)
+        self.assertEqual(failed_result.celery_task.error, 'Context length exceeded.')
+        answered_result.celery_task.refresh_from_db()
+        self.assertEqual(answered_result.celery_task.status, TaskStatus.SUCCESS)
+
+    @override_settings(CELERY_TASK_ALWAYS_EAGER=True)
+    def test_beat_resuming_batches_whose_polls_have_stopped(self) -> None:
+        stale_batch = self._create_started_batch()
+        polled_batch = self._create_started_batch()
+        stale_at = timezone.now() - timedelta(seconds=settings.OPENAI_BATCH_RESUME_AFTER + 1)
+        TextSearchBatch.objects.filter(pk=stale_batch.pk).update(modified_at=stale_at)
+
+        with mock.patch(
+            'api.utilities.gpt.ChatGPT.retrieve_batch',
+            return_value=SimpleNamespace(
+                id='batch_1', status='expired', output_file_id=None, error_file_id=None
+            ),
+        ) as mock_retrieve, mock.patch('core.mixins.release_budget') as mock_release:
+            resume_text_search_batches()
+
+        mock_retrieve.assert_called_once_with(stale_batch.openai_batch_id)
+        stale_batch.refresh_from_db()
+        self.assertEqual(stale_batch.status, TaskStatus.FAILURE)
+        mock_release.assert_any_call(self.allowed_auth_user.pk, str(stale_batch.pk))
+        for result in stale_batch.query_results.all():
+            self.assertEqual(result.celery_task.status, TaskStatus.FAILURE)
+
+        polled_batch.refresh_from_db()
+        self.assertEqual(polled_batch.status, TaskStatus.STARTED)
+
+    def _create_started_batch(self) -> TextSearchBatch:
+        batch = TextSearchBatch.objects.create(
+            auth_user=self.allowed_auth_user, openai_batch_id='batch_1', openai_status='in_progress'
+        )
+        batch.set_started()
+        for question in BATCH_QUESTIONS:
+            conversation = TextSearchConversation.objects.create(
+                auth_user=self.allowed_auth_user, title=question
+            )
+            result = TextSearchQueryResult.objects.create(
+                conversation=conversation, batch=batch, user_input=question, references=[]
+            )
+            TextTask.objects.create(result=result, status=TaskStatus.STARTED)
+        return batch
@@ -1,3 +1,4 @@
+import tempfile
 from typing import Tuple
 from unittest import mock
 
@@ -8,6 +9,7 @@ from rest_framework.reverse import reverse
 from rest_framework.test import APITransactionTestCase
 
 from core.models import Dataset
+from core.tasks import render_conversation_pdf
 from text_search.tests.test_settings import (
     BASE_CREATE_INPUT,
     CHAT_CHAIN_EXPECTED_ARGUMENTS_1,
@@ -105,9 +107,15 @@ class TestTextSearchChat(APITransactionTestCase):
         response = self.client.get(retrieve_endpoint_url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
-        # PDF
+        # PDF, generated right away in place of a worker.
         pdf_endpoint_url = reverse('v1:text_search-pdf', kwargs={'pk': conversation_id})
-        response = self.client.get(pdf_endpoint_url)
+        with tempfile.TemporaryDirectory() as pdf_cache_dir, override_settings(
+            PDF_CACHE_DIR=pdf_cache_dir
+        ), mock.patch(
+            'core.views.render_conversation_pdf.apply_async',
+            side_effect=lambda kwargs: render_conversation_pdf(**kwargs),
+        ):
+            response = self.client.get(pdf_endpoint_url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
     # Chat failure
@@ -151,7 +159,10 @@ class TestTextSearchChat(APITransactionTestCase):
         self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
 
     @override_settings(CELERY_TASK_ALWAYS_EAGER=True)
-    def test_chat_fails_because_usage_limit(self) -> None:
+    # A chat could cost more than the whole limit of the user in the worst case,
+    # the test is about the spent sum.
+    @mock.patch('text_search.views.estimate_chat_cost', return_value=0.01)
+    def test_chat_fails_because_usage_limit(self, _mock_estimate: mock.MagicMock) -> None:
         token, _ = Token.objects.get_or_create(user=self.low_limit_auth_user)
         self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
 
@@ -0,0 +1,78 @@
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.reverse import reverse
+from rest_framework.test import APITestCase
+
+from core.models import Dataset
+from text_search.models import TextSearchConversation, TextSearchQueryResult, TextTask
+from user_profile.utilities import create_test_user_with_user_profile
+
+
+class TestTextSearchList(APITestCase):
+    def setUp(self) -> None:  # pylint: disable=invalid-name
+        self.auth_user = create_test_user_with_user_profile(
+            self, 'tester', 'tester@email.com', 'password', is_manager=False
+        )
+        token, _ = Token.objects.get_or_create(user=self.auth_user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        self.list_endpoint_url = reverse('v1:text_search-list')
+
+        Dataset(name='a', type='', index='a_*', description='').save()
+        Dataset(name='b', type='', index='b_*', description='').save()
+
+    def _create_conversations(self, count: int) -> None:
+        for index in range(count):
+            # Conversations without datasets search through all of them.
+            conversation = TextSearchConversation.objects.create(
+                auth_user=self.auth_user, system_input='', title=f'Kommionu {index}'
+            )
+            for _ in range(2):
+                result = TextSearchQueryResult.objects.create(
+                    conversation=conversation,
+                    user_input='?',
+                    response='Kommionu paneb.',
+                    references=[{'doc_id': '1'}],
+                )
+                TextTask.objects.create(result=result)
+
+    def _get_list(self, url: str) -> tuple:
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data, len(context.captured_queries)
+
+    def test_queries_not_growing_with_conversations(self) -> None:
+        self._create_conversations(1)
+        _, query_count = self._get_list(self.list_endpoint_url)
+
+        self._create_conversations(10)
+        data, query_count_of_many = self._get_list(self.list_endpoint_url)
+
+        self.assertEqual(len(data['results']), 11)
+        self.assertEqual(query_count, query_count_of_many)
+
+    def test_list_being_compact(self) -> None:
+        self._create_conversations(1)
+        data, _ = self._get_list(self.list_endpoint_url)
+
+        conversation = data['results'][0]
+        self.assertEqual(conversation['dataset_names'], ['a', 'b'])
+        self.assertEqual(len(conversation['query_results']), 2)
+        self.assertNotIn('references', conversation['query_results'][0])
+        self.assertNotIn('response', conversation['query_results'][0])
+        self.assertIn('status', conversation['query_results'][0]['celery_task'])
+
+    def test_list_being_paginated_newest_first(self) -> None:
+        self._create_conversations(3)
+
+        data, _ = self._get_list(f'{self.list_endpoint_url}?page_size=2')
+        titles = [conversation['title'] for conversation in data['results']]
+        self.assertEqual(titles, ['Kommionu 2', 'Kommionu 1'])
+        self.assertIsNone(data['previous'])
+
+        data, _ = self._get_list(data['next'])
+        titles = [conversation['title'] for conversation in data['results']]
+        self.assertEqual(titles, ['Kommionu 0'])
+        self.assertIsNone(data['next'])
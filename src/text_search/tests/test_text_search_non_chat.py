@@ -64,7 +64,7 @@ class TestTextSearchNonChat(APITestCase):
         response = self.client.get(self.list_endpoint_url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
-        self.assertEqual(response.data, [])
+        self.assertEqual(response.data['results'], [])
 
         # Create
         response = self.client.post(self.create_endpoint_url, data=BASE_CREATE_INPUT)
@@ -111,7 +111,7 @@ class TestTextSearchNonChat(APITestCase):
         response = self.client.get(self.list_endpoint_url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
-        self.assertEqual(response.data, [response_expected_data])
+        self.assertEqual(response.data['results'], [response_expected_data])
 
         # Bulk destroy
         delete_input_data = {'ids': [conversation_id]}
@@ -130,7 +130,7 @@ class TestTextSearchNonChat(APITestCase):
         response = self.client.get(self.list_endpoint_url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
-        self.assertEqual(response.data, [])
+        self.assertEqual(response.data['results'], [])
 
     def test_create_uses_default_datasets(self) -> None:
         token, _ = Token.objects.get_or_create(user=self.accepted_auth_user)
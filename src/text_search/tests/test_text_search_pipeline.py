@@ -0,0 +1,138 @@
+from unittest import mock
+
+import fakeredis
+import gevent
+import httpx
+import openai
+from celery.exceptions import SoftTimeLimitExceeded
+from django.test import override_settings
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.reverse import reverse
+from rest_framework.test import APITransactionTestCase
+
+from api.utilities.gpt import LLMResponse
+from api.utilities.payload_store import store_payload
+from core.base_task import ResourceTask
+from core.choices import TaskStatus
+from core.ledger import RESERVATIONS_KEY_PREFIX, reserve_budget
+from core.models import Dataset
+from text_search.models import TextSearchConversation, TextSearchQueryResult, TextTask
+from text_search.tasks import call_openai_api
+from text_search.tests.test_settings import (
+    BASE_CREATE_INPUT,
+    CHAT_INPUT_1,
+    CHAT_QUESTION_1,
+)
+from user_profile.utilities import create_test_user_with_user_profile
+
+PIPELINE_CONTEXT = {
+    'context': f'Kontekst: Eesti sai iseseisvuse 1918. aastal. Küsimus: {CHAT_QUESTION_1}',
+    'references': [
+        {'doc_id': '1', 'text': '', 'url': '', 'title': '', 'dataset_name': 'a', 'parent': '1'}
+    ],
+    'is_context_pruned': False,
+}
+PIPELINE_LLM_RESPONSE = LLMResponse(
+    message='Eesti sai iseseisvuse 1918. aastal.\n\nAllikad: 0',
+    model='gpt-4o',
+    user_input=CHAT_QUESTION_1,
+    input_tokens=100,
+    response_tokens=10,
+    headers={},
+)
+RATE_LIMIT_ERROR = openai.RateLimitError(
+    'Rate limit reached!',
+    response=httpx.Response(429, request=httpx.Request('POST', 'https://api.openai.com')),
+    body=None,
+)
+
+
+# We use APITransactionTestCase here because the pipeline is started on transaction commit.
+@override_settings(
+    CELERY_TASK_ALWAYS_EAGER=True, RAG_PIPELINE_MODE='single', PAYLOAD_STORE_BACKEND='inline'
+)
+class TestTextSearchPipeline(APITransactionTestCase):
+    def setUp(self) -> None:  # pylint: disable=invalid-name
+        self.auth_user = create_test_user_with_user_profile(
+            self, 'tester', 'tester@email.com', 'password', is_manager=False
+        )
+        token, _ = Token.objects.get_or_create(user=self.auth_user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+
+        Dataset(name='a', type='', index='a_*', description='').save()
+        Dataset(name='c', type='', index='c_*', description='').save()
+
+        response = self.client.post(reverse('v1:text_search-list'), data=BASE_CREATE_INPUT)
+        self.chat_endpoint_url = reverse('v1:text_search-chat', kwargs={'pk': response.data['id']})
+
+        patches = (
+            mock.patch.object(ResourceTask, 'vectorizer', new_callable=mock.PropertyMock),
+            mock.patch.object(ResourceTask, 'encoder', new_callable=mock.PropertyMock),
+        )
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def _chat(self, chat_side_effect: list) -> mock.Mock:
+        with mock.patch(
+            'text_search.models.TextSearchConversation.generate_conversations_and_references',
+            return_value=PIPELINE_CONTEXT,
+        ) as mock_retrieval, mock.patch(
+            'api.utilities.gpt.ChatGPT.chat', side_effect=chat_side_effect
+        ) as mock_chat:
+            response = self.client.post(self.chat_endpoint_url, data=CHAT_INPUT_1)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        mock_retrieval.assert_called_once()
+        return mock_chat
+
+    def test_pipeline_storing_results_within_a_single_task(self) -> None:
+        with mock.patch('text_search.tasks.call_openai_api.s') as mock_openai_task:
+            mock_chat = self._chat([PIPELINE_LLM_RESPONSE])
+
+        mock_chat.assert_called_once()
+        mock_openai_task.assert_not_called()
+
+        result = TextSearchQueryResult.objects.get()
+        self.assertEqual(result.celery_task.status, TaskStatus.SUCCESS)
+        self.assertEqual(result.response, 'Eesti sai iseseisvuse 1918. aastal.')
+        self.assertTrue(result.references[0]['used_by_gpt'])
+        self.assertEqual(set(result.celery_task.timings), {'llm', 'db_save'})
+
+    def test_pipeline_retrying_only_the_llm_call(self) -> None:
+        mock_chat = self._chat([RATE_LIMIT_ERROR, PIPELINE_LLM_RESPONSE])
+
+        # Retrieval happened only once while OpenAI was called again.
+        self.assertEqual(mock_chat.call_count, 2)
+
+        result = TextSearchQueryResult.objects.get()
+        self.assertEqual(result.celery_task.status, TaskStatus.SUCCESS)
+        self.assertEqual(result.total_cost, PIPELINE_LLM_RESPONSE.total_cost)
+
+    def test_hung_llm_call_failing_at_the_soft_limit_on_gevent(self) -> None:
+        redis_client = fakeredis.FakeRedis()
+        conversation = TextSearchConversation.objects.get()
+        result = TextSearchQueryResult.objects.create(
+            conversation=conversation, user_input=CHAT_QUESTION_1
+        )
+        TextTask.objects.create(result=result)
+
+        with mock.patch('core.ledger._get_redis_client', return_value=redis_client), mock.patch(
+            'core.ledger._REDIS_RETRY_AT', 0.0
+        ), mock.patch('core.base_task.runs_on_gevent', return_value=True), mock.patch.object(
+            call_openai_api, 'soft_time_limit', 0.1
+        ), mock.patch(
+            'api.utilities.gpt.ChatGPT.chat', side_effect=lambda *_, **__: gevent.sleep(5)
+        ):
+            self.assertTrue(reserve_budget(self.auth_user, str(result.uuid), 0.01))
+            with self.assertRaises(SoftTimeLimitExceeded):
+                call_openai_api.apply(
+                    args=(store_payload(PIPELINE_CONTEXT), conversation.pk),
+                    kwargs={'user_input': CHAT_QUESTION_1, 'result_uuid': str(result.uuid)},
+                )
+
+        result.refresh_from_db()
+        self.assertEqual(result.celery_task.status, TaskStatus.FAILURE)
+        # The budget reserved for the chat was released along with it.
+        self.assertEqual(redis_client.hgetall(f'{RESERVATIONS_KEY_PREFIX}{self.auth_user.pk}'), {})
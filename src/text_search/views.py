@@ -1,5 +1,10 @@
-from django.db.models import QuerySet
-from django.http import FileResponse
+import uuid
+from typing import List
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Prefetch, QuerySet
+from django.http import HttpResponseBase
 from django.utils.translation import gettext as _
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
@@ -7,14 +12,23 @@ from rest_framework.generics import get_object_or_404
 from rest_framework.request import Request
 from rest_framework.response import Response
 
-from core.pdf import get_conversation_pdf_file_bytes
+from core.ledger import estimate_batch_cost, estimate_chat_cost, reserve_budget
+from core.pagination import ConversationCursorPagination
 from core.serializers import (
     ConversationBulkDeleteSerializer,
     ConversationSetTitleSerializer,
 )
-from text_search.models import TextSearchConversation
+from core.views import get_conversation_pdf_response
+from text_search.models import (
+    TextSearchBatch,
+    TextSearchConversation,
+    TextSearchQueryResult,
+)
 from text_search.serializers import (
+    TextSearchBatchCreateSerializer,
+    TextSearchBatchReadOnlySerializer,
     TextSearchConversationCreateSerializer,
+    TextSearchConversationListSerializer,
     TextSearchConversationReadOnlySerializer,
     TextSearchQuerySubmitSerializer,
 )
@@ -27,6 +41,7 @@ from user_profile.permissions import (  # type: ignore
 class TextSearchConversationViewset(viewsets.ViewSet):
     permission_classes = (IsAcceptedPermission,)
     serializer_class = TextSearchConversationCreateSerializer
+    pagination_class = ConversationCursorPagination
 
     # pylint: disable=unused-argument,invalid-name
 
@@ -37,6 +52,26 @@ class TextSearchConversationViewset(viewsets.ViewSet):
         # (403 would imply that it exists).
         return TextSearchConversation.objects.filter(auth_user=self.request.user, is_deleted=False)
 
+    def get_serialized_queryset(self) -> QuerySet:
+        # Fetches the results and their tasks in one query instead of two per result.
+        return self.get_queryset().prefetch_related(
+            Prefetch(
+                'query_results',
+                queryset=TextSearchQueryResult.objects.select_related('celery_task'),
+            )
+        )
+
+    def get_list_queryset(self) -> QuerySet:
+        # Lists don't show the responses and references, so they're left in the database.
+        return self.get_queryset().prefetch_related(
+            Prefetch(
+                'query_results',
+                queryset=TextSearchQueryResult.objects.select_related('celery_task').defer(
+                    'response', 'references', 'response_headers'
+                ),
+            )
+        )
+
     # create() uses user_input to name the conversation, but does not query the LLM.
     # After creating the conversation, the frontend must still call chat() with the input.
     def create(self, request: Request) -> Response:
@@ -67,14 +102,17 @@ class TextSearchConversationViewset(viewsets.ViewSet):
         return Response({'detail': _('Deleted chosen objects!')}, status=status.HTTP_204_NO_CONTENT)
 
     def retrieve(self, request: Request, pk: int) -> Response:
-        conversation = get_object_or_404(self.get_queryset(), id=pk)
+        conversation = get_object_or_404(self.get_serialized_queryset(), id=pk)
 
         serializer = TextSearchConversationReadOnlySerializer(conversation)
         return Response(serializer.data)
 
     def list(self, request: Request) -> Response:
-        serializer = TextSearchConversationReadOnlySerializer(self.get_queryset(), many=True)
-        return Response(serializer.data)
+        paginator = self.pagination_class()
+        conversations = paginator.paginate_queryset(self.get_list_queryset(), request, view=self)
+
+        serializer = TextSearchConversationListSerializer(conversations, many=True)
+        return paginator.get_paginated_response(serializer.data)
 
     @action(detail=True, methods=['post'])
     def set_title(self, request: Request, pk: int) -> Response:
@@ -98,24 +136,84 @@ class TextSearchConversationViewset(viewsets.ViewSet):
         serializer_class=TextSearchQuerySubmitSerializer,
     )
     def chat(self, request: Request, pk: int) -> Response:
-        get_object_or_404(self.get_queryset(), id=pk)
+        conversation = get_object_or_404(self.get_queryset(), id=pk)
 
         request_serializer = TextSearchQuerySubmitSerializer(data=request.data)
         if not request_serializer.is_valid():
             return Response(request_serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-        request_serializer.save(conversation_id=pk)
+        # The reservation is released once the task behind the result is done.
+        result_uuid = uuid.uuid4()
+        user_input = request_serializer.validated_data['user_input']
+        cost = estimate_chat_cost(conversation.messages, user_input)
+        if not reserve_budget(request.user, result_uuid, cost):
+            message = CanSpendResourcesPermission.message
+            return Response({'detail': message}, status=status.HTTP_403_FORBIDDEN)
+
+        request_serializer.save(conversation_id=pk, result_uuid=result_uuid)
 
         # Mostly needed for tests but helpful to fetch a more updated task instance.
-        conversation = self.get_queryset().get(id=pk)
+        conversation = self.get_serialized_queryset().get(id=pk)
         data = TextSearchConversationReadOnlySerializer(conversation).data
         return Response(data)
 
     @action(detail=True, methods=['get'])
-    def pdf(self, request: Request, pk: int) -> FileResponse:
+    def pdf(self, request: Request, pk: int) -> HttpResponseBase:
         conversation = get_object_or_404(self.get_queryset(), id=pk)
 
         filename = f'riigikantselei_vestlus_{pk}.pdf'
-        pdf_file_bytes = get_conversation_pdf_file_bytes(conversation)
+        return get_conversation_pdf_response(request, conversation, filename)
+
+
+# Batches answer many questions at once through the OpenAI Batch API at a lower price,
+# the answers show up in the conversations of the batch once OpenAI has finished.
+class TextSearchBatchViewset(viewsets.ViewSet):
+    permission_classes = (IsAcceptedPermission,)
+    serializer_class = TextSearchBatchCreateSerializer
+
+    # pylint: disable=unused-argument,invalid-name
+
+    def get_permissions(self) -> List:
+        if self.action == 'create':
+            self.permission_classes = (CanSpendResourcesPermission,)  # type: ignore
+        return super().get_permissions()
 
-        return FileResponse(pdf_file_bytes, as_attachment=True, filename=filename)
+    def get_queryset(self) -> QuerySet:
+        return TextSearchBatch.objects.filter(auth_user=self.request.user).prefetch_related(
+            Prefetch(
+                'query_results',
+                queryset=TextSearchQueryResult.objects.select_related('celery_task'),
+            )
+        )
+
+    def create(self, request: Request) -> Response:
+        request_serializer = TextSearchBatchCreateSerializer(data=request.data)
+        if not request_serializer.is_valid():
+            return Response(request_serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        questions = request_serializer.validated_data['questions']
+        with transaction.atomic():
+            # The batch is only sent off once this is committed. Its reservation is released
+            # when the batch ends, by poll_text_search_batch or on failure.
+            batch = request_serializer.save(auth_user=request.user)
+            cost = estimate_batch_cost(questions)
+            ttl = settings.SPEND_BATCH_RESERVATION_TTL
+            if not reserve_budget(request.user, batch.pk, cost, ttl=ttl):
+                transaction.set_rollback(True)
+                message = CanSpendResourcesPermission.message
+                return Response({'detail': message}, status=status.HTTP_403_FORBIDDEN)
+
+        response_serializer = TextSearchBatchReadOnlySerializer(
+            self.get_queryset().get(id=batch.id)
+        )
+        return Response(response_serializer.data, status=status.HTTP_201_CREATED)
+
+    def retrieve(self, request: Request, pk: int) -> Response:
+        batch = get_object_or_404(self.get_queryset(), id=pk)
+
+        serializer = TextSearchBatchReadOnlySerializer(batch)
+        return Response(serializer.data)
+
+    def list(self, request: Request) -> Response:
+        serializer = TextSearchBatchReadOnlySerializer(self.get_queryset(), many=True)
+        return Response(serializer.data)
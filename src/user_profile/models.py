@@ -2,13 +2,11 @@ from datetime import timedelta
 
 from django.contrib.auth.models import User
 from django.db import models
-from django.db.models import Sum
 from django.utils import timezone
 from rest_framework.authtoken.models import Token
 
+from core.ledger import get_used_cost
 from core.models import CoreVariable
-from document_search.models import DocumentSearchQueryResult
-from text_search.models import TextSearchQueryResult
 
 # pylint: disable=dangerous-default-value
 
@@ -60,15 +58,7 @@ class UserProfile(models.Model):
 
     @property
     def used_cost(self) -> float:
-        text_queries = TextSearchQueryResult.objects.filter(conversation__auth_user=self.auth_user)
-        document_queries = DocumentSearchQueryResult.objects.filter(
-            conversation__auth_user=self.auth_user
-        )
-        text_cost = text_queries.aggregate(Sum('total_cost', default=0.0))['total_cost__sum']
-        document_cost = document_queries.aggregate(Sum('total_cost', default=0.0))[
-            'total_cost__sum'
-        ]
-        return text_cost + document_cost
+        return get_used_cost(self.auth_user_id)
 
     def __str__(self) -> str:
         if self.auth_user.first_name and self.auth_user.last_name: